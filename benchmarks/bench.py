@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""Benchmark each driver, and the whole view.py pipeline, on synthetic data (see synth.py)."""
+import argparse
+import datetime
+import json
+import logging
+import os
+import pathlib
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import synth
+try:
+  import drivers
+except ImportError:
+  root = pathlib.Path(__file__).resolve().parent.parent
+  sys.path.insert(0, str(root))
+  import drivers
+from profiling import format_table
+assert sys.version_info.major >= 3, 'Python 3 required'
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+VIEW_SCRIPT = ROOT/'view.py'
+DEFAULT_SCALES = (1000, 10000, 100000)
+# How many times to run each command with --help to measure its startup time.
+STARTUP_RUNS = 3
+
+DESCRIPTION = """Generate synthetic data at several scales, run each driver and the full view.py
+pipeline on it, and record the throughput (events per second), peak memory, and startup time in a
+JSON file. Give a --baseline results file from an earlier run to compare against it. The exit
+status is 1 if anything got worse than the baseline by more than the --tolerance."""
+
+
+def make_argparser():
+  parser = argparse.ArgumentParser(description=DESCRIPTION)
+  parser.add_argument('-s', '--scales', type=int, nargs='+', default=DEFAULT_SCALES,
+    help='The sizes of data sets to test, in number of events (see synth.py --events). '
+         'Default: %(default)s')
+  parser.add_argument('-b', '--benchmarks', nargs='+',
+    help='Only run these benchmarks: driver names, or "view" for the full pipeline. '
+         'Default: all drivers there\'s synthetic data for, plus "view".')
+  parser.add_argument('-r', '--repeat', type=int, default=1,
+    help='Run each benchmark this many times, and keep the fastest. Default: %(default)s')
+  parser.add_argument('-d', '--data-dir', type=pathlib.Path,
+    help='Keep the generated data in this directory, and reuse it on later runs. By default, it\'s '
+         'generated in a temporary directory and deleted afterward.')
+  parser.add_argument('-o', '--output', type=pathlib.Path, default=pathlib.Path('bench-results.json'),
+    help='Write the results to this JSON file. Default: %(default)s')
+  parser.add_argument('-B', '--baseline', type=pathlib.Path,
+    help='Compare the results to this results file from a previous run.')
+  parser.add_argument('-t', '--tolerance', type=float, default=0.1,
+    help='When comparing to a --baseline, how much worse (as a fraction) throughput or memory can '
+         'be before it counts as a regression. Default: %(default)s')
+  parser.add_argument('-l', '--log', type=argparse.FileType('w'), default=sys.stderr,
+    help='Print log messages to this file instead of to stderr. Warning: Will overwrite the file.')
+  volume = parser.add_mutually_exclusive_group()
+  volume.add_argument('-q', '--quiet', dest='volume', action='store_const', const=logging.CRITICAL,
+    default=logging.WARNING)
+  volume.add_argument('-v', '--verbose', dest='volume', action='store_const', const=logging.INFO)
+  volume.add_argument('-D', '--debug', dest='volume', action='store_const', const=logging.DEBUG)
+  return parser
+
+
+def main(argv):
+
+  parser = make_argparser()
+  args = parser.parse_args(argv[1:])
+
+  logging.basicConfig(stream=args.log, level=args.volume, format='%(message)s')
+
+  baseline = None
+  if args.baseline:
+    with args.baseline.open() as baseline_file:
+      baseline = json.load(baseline_file)
+
+  if args.data_dir:
+    results = run_benchmarks(args.data_dir, args.scales, args.benchmarks, args.repeat)
+  else:
+    with tempfile.TemporaryDirectory(prefix='life-browser.bench.') as data_dir:
+      results = run_benchmarks(pathlib.Path(data_dir), args.scales, args.benchmarks, args.repeat)
+
+  with args.output.open('w') as output_file:
+    json.dump(results, output_file, indent=2)
+  logging.warning(f'Wrote results to {args.output}')
+
+  for line in format_results(results['results']):
+    print(line)
+  if baseline:
+    print()
+    lines, regressions = compare_results(results['results'], baseline['results'], args.tolerance)
+    for line in lines:
+      print(line)
+    if regressions:
+      logging.warning(f'{regressions} regressions versus {args.baseline}.')
+      return 1
+
+
+def run_benchmarks(data_dir, scales, names=None, repeat=1):
+  all_drivers = drivers.discover_drivers()
+  results = []
+  startups = {}
+  for scale in scales:
+    paths = get_data(data_dir, scale)
+    # Run each driver on its own.
+    view_args = ['-c', str(paths['contacts'])]
+    for name, driver in all_drivers.items():
+      if name not in paths or (names and name not in names):
+        continue
+      command = drivers.utils.get_driver_command(driver, paths[name])
+      if name not in startups:
+        startups[name] = measure_startup([command[0], '--help'])
+      result = run_benchmark(name, scale, command, count_driver_events, repeat)
+      result['startup'] = startups[name]
+      results.append(result)
+      # Only give view.py the drivers which work, so one broken driver doesn't sink the pipeline
+      # benchmark.
+      if 'error' not in result:
+        view_args.extend(['-d', name, str(paths[name])])
+    # Run the full pipeline.
+    if names and 'view' not in names:
+      continue
+    command = [sys.executable, str(VIEW_SCRIPT)] + view_args
+    if 'view' not in startups:
+      startups['view'] = measure_startup(command[:2]+['--help'])
+    result = run_benchmark('view', scale, command, count_view_events, repeat)
+    result['startup'] = startups['view']
+    results.append(result)
+  return {
+    'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+    'commit': get_commit(),
+    'python': platform.python_version(),
+    'platform': platform.platform(),
+    'results': results,
+  }
+
+
+def get_data(data_dir, scale):
+  """Generate the data set for `scale`, unless it's already in `data_dir`."""
+  scale_dir = data_dir/f'scale-{scale}'
+  manifest_path = scale_dir/'paths.json'
+  if manifest_path.is_file():
+    with manifest_path.open() as manifest_file:
+      return {format: pathlib.Path(path) for format, path in json.load(manifest_file).items()}
+  logging.warning(f'Generating synthetic data with {scale} events..')
+  paths = synth.generate(scale_dir, scale)
+  with manifest_path.open('w') as manifest_file:
+    json.dump({format: str(path) for format, path in paths.items()}, manifest_file)
+  return paths
+
+
+def run_benchmark(name, scale, command, counter, repeat=1):
+  """Run `command` `repeat` times and return the result of the fastest run.
+  `counter` gets the command's stdout (a file) and a function which returns its stderr so far (a
+  string). It returns how many events the command output."""
+  logging.warning(f'Running {name} on {scale} events..')
+  best = None
+  for i in range(repeat):
+    result = measure_command(command, counter)
+    result['benchmark'] = name
+    result['scale'] = scale
+    if 'error' in result:
+      logging.warning(f'Error: {name} failed: {result["error"]}')
+      return result
+    if best is None or result['wall'] < best['wall']:
+      best = result
+  return best
+
+
+def measure_command(command, counter):
+  """Run a command and measure its wall time, peak memory, time to its first output, and the number
+  of events it outputs."""
+  with tempfile.TemporaryFile('w+') as stderr_file:
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr_file, encoding='utf8')
+    first_output = None
+    def mark_first_output(lines):
+      nonlocal first_output
+      for line in lines:
+        if first_output is None:
+          first_output = time.perf_counter() - start
+        yield line
+    num_events = counter(mark_first_output(process.stdout), lambda: read_file(stderr_file))
+    # Wait for it ourselves, to get its resource usage.
+    pid, status, rusage = os.wait4(process.pid, 0)
+    wall = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    stderr = read_file(stderr_file)
+  result = {
+    'command': [str(arg) for arg in command],
+    'events': num_events,
+    'wall': round(wall, 4),
+    'cpu': round(rusage.ru_utime+rusage.ru_stime, 4),
+    'first_output': None if first_output is None else round(first_output, 4),
+    # Linux reports this in kilobytes.
+    'peak_rss': rusage.ru_maxrss*1024,
+    'events_per_sec': round(num_events/wall, 1) if wall > 0 else None,
+  }
+  if process.returncode != 0 or not num_events:
+    last_lines = stderr.strip().splitlines()[-3:]
+    result['error'] = f'Exit status {process.returncode}, {num_events} events. '+' '.join(last_lines)
+  return result
+
+
+def read_file(file):
+  file.seek(0)
+  return file.read()
+
+
+def count_driver_events(stdout, get_stderr):
+  """Count the lines of driver output which aren't contacts or marks."""
+  num_events = 0
+  for line in stdout:
+    if '"stream": "contact"' not in line and '"stream": "mark"' not in line:
+      num_events += 1
+  return num_events
+
+
+def count_view_events(stdout, get_stderr):
+  """Read view.py's output and get the number of events it says it found."""
+  for line in stdout:
+    pass
+  match = re.search(r'^Found (\d+) events\.$', get_stderr(), re.MULTILINE)
+  if match:
+    return int(match.group(1))
+  else:
+    return 0
+
+
+def measure_startup(command):
+  """The fastest of a few runs of the command, in seconds. Give it something like --help, so it
+  does nothing but start up."""
+  times = []
+  for i in range(STARTUP_RUNS):
+    start = time.perf_counter()
+    subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    times.append(time.perf_counter() - start)
+  return round(min(times), 4)
+
+
+def get_commit():
+  try:
+    output = subprocess.check_output(
+      ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL, encoding='utf8'
+    )
+  except (OSError, subprocess.CalledProcessError):
+    return None
+  return output.strip()
+
+
+def format_results(results):
+  rows = []
+  for result in results:
+    if 'error' in result:
+      rows.append((result['benchmark'], str(result['scale']), '', '', '', '', result['error'][:100]))
+    else:
+      rows.append((
+        result['benchmark'], str(result['scale']), f'{result["events_per_sec"]:0.0f}',
+        f'{result["wall"]:0.3f}', format_mb(result['peak_rss']), f'{result["startup"]:0.3f}', ''
+      ))
+  header = ('Benchmark', 'Scale', 'Events/s', 'Wall (s)', 'Peak RSS', 'Startup (s)', '')
+  return format_table(header, rows, left=(0, 6))
+
+
+def compare_results(results, baseline_results, tolerance):
+  """Compare the throughput and memory of each benchmark to the baseline.
+  Returns the table, as a list of lines, and the number of regressions."""
+  baselines = {(result['benchmark'], result['scale']): result for result in baseline_results}
+  rows = []
+  regressions = 0
+  for result in results:
+    old = baselines.get((result['benchmark'], result['scale']))
+    if old is None or 'error' in result or 'error' in old:
+      continue
+    speed_change = result['events_per_sec']/old['events_per_sec'] - 1
+    memory_change = result['peak_rss']/old['peak_rss'] - 1
+    notes = []
+    if speed_change < -tolerance:
+      notes.append('SLOWER')
+    if memory_change > tolerance:
+      notes.append('MORE MEMORY')
+    if notes:
+      regressions += 1
+    rows.append((
+      result['benchmark'], str(result['scale']),
+      f'{old["events_per_sec"]:0.0f}', f'{result["events_per_sec"]:0.0f}', f'{speed_change:+0.1%}',
+      format_mb(old['peak_rss']), format_mb(result['peak_rss']), f'{memory_change:+0.1%}',
+      ' '.join(notes)
+    ))
+  header = ('Benchmark', 'Scale', 'Old events/s', 'New events/s', 'Change', 'Old RSS', 'New RSS',
+            'Change', '')
+  return format_table(header, rows), regressions
+
+
+def format_mb(num_bytes):
+  return f'{num_bytes/1024/1024:0.1f} MB'
+
+
+if __name__ == '__main__':
+  try:
+    sys.exit(main(sys.argv))
+  except BrokenPipeError:
+    pass
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Compare the NumPy and pure-Python versions of the track math in drivers/location/kml.py."""
+import argparse
+import json
+import logging
+import pathlib
+import random
+import sys
+import time
+import synth
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT/'drivers'/'location'))
+import kml
+from profiling import format_table
+assert sys.version_info.major >= 3, 'Python 3 required'
+
+DESCRIPTION = """Generate a year of synthetic tracks (one a day, by default), then time
+kml.filter_track(), kml.get_total_distance(), and kml.is_track_near() on all of them, with and
+without NumPy. Also checks that both versions give the same answers."""
+
+
+def make_argparser():
+  parser = argparse.ArgumentParser(description=DESCRIPTION)
+  parser.add_argument('-t', '--tracks', type=int, default=365,
+    help='How many tracks. Default: %(default)s')
+  parser.add_argument('-P', '--points', type=int, default=2000,
+    help='How many points in each track. Default: %(default)s')
+  parser.add_argument('-r', '--repeat', type=int, default=3,
+    help='Time each function this many times, and keep the fastest. Default: %(default)s')
+  parser.add_argument('-s', '--seed', type=int, default=1,
+    help='Random seed. Default: %(default)s')
+  parser.add_argument('-o', '--output', type=pathlib.Path,
+    help='Also write the results to this JSON file.')
+  parser.add_argument('-l', '--log', type=argparse.FileType('w'), default=sys.stderr,
+    help='Print log messages to this file instead of to stderr. Warning: Will overwrite the file.')
+  volume = parser.add_mutually_exclusive_group()
+  volume.add_argument('-q', '--quiet', dest='volume', action='store_const', const=logging.CRITICAL,
+    default=logging.WARNING)
+  volume.add_argument('-v', '--verbose', dest='volume', action='store_const', const=logging.INFO)
+  volume.add_argument('-D', '--debug', dest='volume', action='store_const', const=logging.DEBUG)
+  return parser
+
+
+def main(argv):
+
+  parser = make_argparser()
+  args = parser.parse_args(argv[1:])
+
+  logging.basicConfig(stream=args.log, level=args.volume, format='%(message)s')
+
+  if kml.numpy is None:
+    logging.critical('Error: NumPy isn\'t installed, so there\'s nothing to compare.')
+    return 1
+
+  rng = random.Random(args.seed)
+  logging.info(f'Generating {args.tracks} tracks of {args.points} points..')
+  tracks = []
+  for i in range(args.tracks):
+    tracks.append(synth.make_track(synth.START+i*24*60*60, args.points, rng))
+  location = synth.HOME
+
+  functions = (
+    ('filter_track', lambda track: kml.filter_track(track), kml.filter_track_python),
+    ('get_total_distance', kml.get_total_distance, kml.get_total_distance_python),
+    ('is_track_near', lambda track: kml.is_track_near(track, location, 2),
+                      lambda track: kml.is_track_near_python(track, location, 2)),
+  )
+  results = []
+  for name, numpy_version, python_version in functions:
+    numpy_time, numpy_answers = time_function(numpy_version, tracks, args.repeat)
+    python_time, python_answers = time_function(python_version, tracks, args.repeat)
+    if not answers_match(numpy_answers, python_answers):
+      logging.critical(f'Error: The NumPy and Python versions of {name} gave different answers!')
+    results.append({
+      'function': name, 'tracks': args.tracks, 'points': args.points,
+      'python': round(python_time, 4), 'numpy': round(numpy_time, 4),
+      'speedup': round(python_time/numpy_time, 2),
+    })
+
+  rows = []
+  num_points = args.tracks*args.points
+  for result in results:
+    rows.append((
+      result['function'], f'{result["python"]:0.3f}', f'{result["numpy"]:0.3f}',
+      f'{num_points/result["python"]:0.0f}', f'{num_points/result["numpy"]:0.0f}',
+      f'{result["speedup"]:0.1f}x'
+    ))
+  header = ('Function', 'Python (s)', 'NumPy (s)', 'Python points/s', 'NumPy points/s', 'Speedup')
+  for line in format_table(header, rows):
+    print(line)
+
+  if args.output:
+    with args.output.open('w') as output_file:
+      json.dump({'results': results}, output_file, indent=2)
+
+
+def time_function(function, tracks, repeat):
+  """Run `function` on every track `repeat` times. Return the fastest time, and the answers."""
+  best = None
+  for i in range(repeat):
+    start = time.perf_counter()
+    answers = [function(track) for track in tracks]
+    elapsed = time.perf_counter() - start
+    if best is None or elapsed < best:
+      best = elapsed
+  return best, answers
+
+
+def answers_match(answers1, answers2):
+  for answer1, answer2 in zip(answers1, answers2):
+    if isinstance(answer1, float) and isinstance(answer2, float):
+      if abs(answer1-answer2) > 1e-6*max(1, abs(answer2)):
+        return False
+    elif answer1 != answer2:
+      return False
+  return True
+
+
+if __name__ == '__main__':
+  try:
+    sys.exit(main(sys.argv))
+  except BrokenPipeError:
+    pass
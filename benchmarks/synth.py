@@ -0,0 +1,614 @@
+#!/usr/bin/env python3
+"""Generate fake but realistic input data, at any scale, for testing and benchmarking.
+Everything is made from a shared pool of fake people, so the same person shows up in several data
+sources with slightly different contact info, like in real exports."""
+import argparse
+import collections
+import csv
+import datetime
+import json
+import logging
+import math
+import pathlib
+import random
+import sys
+import zipfile
+from xml.sax.saxutils import escape
+assert sys.version_info.major >= 3, 'Python 3 required'
+
+# 2014-01-01 00:00:00 UTC.
+START = 1388534400
+# Spread the events over this many seconds.
+SPAN = 365*24*60*60
+# Where the fake tracks are (downtown Washington, DC).
+HOME = (38.9, -77.03)
+
+FIRST_NAMES = (
+  'Alice', 'Bob', 'Carol', 'Dave', 'Erin', 'Frank', 'Grace', 'Heidi', 'Ivan', 'Judy', 'Mallory',
+  'Niaj', 'Olivia', 'Peggy', 'Rupert', 'Sybil', 'Trent', 'Uma', 'Victor', 'Walter', 'Xavier',
+  'Yolanda', 'Zoe',
+)
+LAST_NAMES = (
+  'Anderson', 'Brown', 'Chen', 'Davis', 'Evans', 'Fischer', 'Garcia', 'Hughes', 'Ito', 'Jones',
+  'Kim', 'Lopez', 'Miller', 'Nguyen', 'Okafor', 'Patel', 'Quinn', 'Rossi', 'Smith', 'Taylor',
+)
+WORDS = (
+  'the', 'a', 'to', 'and', 'you', 'I', 'it', 'is', 'that', 'on', 'for', 'we', 'are', 'at', 'be',
+  'this', 'what', 'so', 'can', 'just', 'now', 'get', 'here', 'there', 'going', 'yeah', 'ok',
+  'lunch', 'dinner', 'tonight', 'tomorrow', 'work', 'home', 'call', 'later', 'soon', 'movie',
+  'coffee', 'sounds', 'good', 'great', 'thanks', 'sure', 'where', 'when', 'minutes', 'late',
+)
+DOMAINS = ('example.com', 'example.org', 'example.net')
+
+Person = collections.namedtuple('Person', ('name', 'first', 'last', 'phone', 'email', 'gaia_id'))
+
+USAGE = """%(prog)s [options] outdir
+       %(prog)s --events 100000 --people 500 outdir"""
+DESCRIPTION = """Write a fake data set into outdir: Hangouts.json, a Voice/ directory (Calls/*.html
+and Phones.vcf), a tracks/ directory of My Tracks and Geo Tracker .kml and .kmz files, a Location
+History Records.json, and a Google Contacts CSV. It's the same for the same --seed."""
+
+
+def make_argparser():
+  parser = argparse.ArgumentParser(usage=USAGE, description=DESCRIPTION)
+  parser.add_argument('outdir', type=pathlib.Path,
+    help='Write the files into this directory. It will be created if it doesn\'t exist.')
+  parser.add_argument('-n', '--events', type=int, default=10000,
+    help='Roughly how many message and call events to make, in total. The sizes of each data set '
+         'are scaled from this, unless given below. Default: %(default)s')
+  parser.add_argument('-p', '--people', type=int,
+    help='How many people to make up. Default: 1 for every 50 events, between 10 and 5000.')
+  parser.add_argument('-c', '--convos', type=int,
+    help='How many Hangouts conversations to spread the events over. Default: 1 per 100 events.')
+  parser.add_argument('-t', '--tracks', type=int,
+    help='How many location tracks to make. Default: 1 per 1000 events.')
+  parser.add_argument('-P', '--points', type=int, default=500,
+    help='How many points to put in each track. Default: %(default)s')
+  parser.add_argument('--locations', type=int,
+    help='How many points to put in the location history. Default: 1 per event.')
+  parser.add_argument('-s', '--seed', type=int, default=1,
+    help='Random seed. Default: %(default)s')
+  parser.add_argument('-l', '--log', type=argparse.FileType('w'), default=sys.stderr,
+    help='Print log messages to this file instead of to stderr. Warning: Will overwrite the file.')
+  volume = parser.add_mutually_exclusive_group()
+  volume.add_argument('-q', '--quiet', dest='volume', action='store_const', const=logging.CRITICAL,
+    default=logging.WARNING)
+  volume.add_argument('-v', '--verbose', dest='volume', action='store_const', const=logging.INFO)
+  volume.add_argument('-D', '--debug', dest='volume', action='store_const', const=logging.DEBUG)
+  return parser
+
+
+def main(argv):
+
+  parser = make_argparser()
+  args = parser.parse_args(argv[1:])
+
+  logging.basicConfig(stream=args.log, level=args.volume, format='%(message)s')
+
+  paths = generate(
+    args.outdir, args.events, num_people=args.people, num_convos=args.convos,
+    num_tracks=args.tracks, points_per_track=args.points, num_locations=args.locations,
+    seed=args.seed
+  )
+  for format, path in paths.items():
+    print(f'{format}\t{path}')
+
+
+def generate(outdir, num_events, num_people=None, num_convos=None, num_tracks=None,
+             points_per_track=500, num_locations=None, seed=1):
+  """Write a whole fake data set into `outdir`. Returns a dict mapping each format to its path.
+  60% of the `num_events` go to Hangouts, and 40% to Voice."""
+  outdir = pathlib.Path(outdir)
+  outdir.mkdir(parents=True, exist_ok=True)
+  rng = random.Random(seed)
+  if num_people is None:
+    num_people = min(max(10, num_events//50), 5000)
+  if num_tracks is None:
+    num_tracks = max(1, num_events//1000)
+  if num_locations is None:
+    num_locations = num_events
+  people = make_people(num_people, rng)
+  paths = collections.OrderedDict()
+  paths['hangouts'] = outdir/'Hangouts.json'
+  logging.info(f'Writing {paths["hangouts"]}')
+  write_hangouts(paths['hangouts'], people, round(num_events*0.6), num_convos=num_convos, rng=rng)
+  paths['voice'] = outdir/'Voice'
+  logging.info(f'Writing {paths["voice"]}')
+  write_voice(paths['voice'], people, round(num_events*0.4), rng=rng)
+  paths['mytracks'] = outdir/'tracks'
+  logging.info(f'Writing {paths["mytracks"]}')
+  write_tracks(paths['mytracks'], num_tracks, points_per_track, rng=rng)
+  paths['contacts'] = outdir/'contacts.csv'
+  logging.info(f'Writing {paths["contacts"]}')
+  write_contacts_csv(paths['contacts'], people, rng=rng)
+  paths['records'] = outdir/'Records.json'
+  logging.info(f'Writing {paths["records"]}')
+  write_records(paths['records'], num_locations, rng=rng)
+  return paths
+
+
+def make_people(num_people, rng):
+  """Make up `num_people` people. The first one is "me"."""
+  people = []
+  names = set()
+  phones = set()
+  for i in range(num_people):
+    first = rng.choice(FIRST_NAMES)
+    last = rng.choice(LAST_NAMES)
+    # Keep the names unique, like in a real address book.
+    name = f'{first} {last}'
+    if name in names:
+      name = f'{first} {last} {i}'
+    names.add(name)
+    phone = None
+    while phone is None or phone in phones:
+      phone = f'+1555{rng.randint(2000000, 9999999)}'
+    phones.add(phone)
+    email = f'{first.lower()}.{last.lower()}{i}@{rng.choice(DOMAINS)}'
+    gaia_id = str(rng.randint(10**20, 10**21-1))
+    people.append(Person(name, first, last, phone, email, gaia_id))
+  return people
+
+
+def split_count(total, weights):
+  """Divide `total` into integers proportional to `weights`."""
+  weight_sum = sum(weights)
+  counts = [math.floor(total*weight/weight_sum) for weight in weights]
+  for i in range(total-sum(counts)):
+    counts[i % len(counts)] += 1
+  return counts
+
+
+def make_text(rng, max_words=20):
+  return ' '.join(rng.choices(WORDS, k=rng.randint(1, max_words))).capitalize()
+
+
+def format_iso(timestamp, millis=True):
+  dt = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+  if millis:
+    return dt.strftime('%Y-%m-%dT%H:%M:%S.')+f'{dt.microsecond//1000:03d}Z'
+  else:
+    return dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+########## Hangouts ##########
+
+
+def write_hangouts(path, people, num_events, num_convos=None, rng=None, start=START, span=SPAN):
+  """Write a Hangouts.json like the one from Google Takeout.
+  Some conversations are much busier than others, most are one-on-one, and a few are SMS threads.
+  The conversations are written one at a time, so memory use doesn't grow with the size."""
+  if rng is None:
+    rng = random.Random()
+  if num_convos is None:
+    num_convos = max(1, num_events//100)
+  me = people[0]
+  others = people[1:]
+  weights = [rng.paretovariate(1.2) for i in range(num_convos)]
+  with open(path, 'w') as hangouts_file:
+    hangouts_file.write('{"conversations": [\n')
+    for i, count in enumerate(split_count(num_events, weights)):
+      if i > 0:
+        hangouts_file.write(',\n')
+      if rng.random() < 0.8:
+        members = [me, rng.choice(others)]
+      else:
+        members = [me] + rng.sample(others, min(len(others), rng.randint(2, 8)))
+      sms = len(members) == 2 and rng.random() < 0.3
+      convo = make_hangouts_convo(f'Ugz{i:08d}AaABAQ', members, count, sms, rng, start, span)
+      json.dump(convo, hangouts_file)
+    hangouts_file.write('\n]}\n')
+
+
+def make_hangouts_convo(convo_id, members, num_events, sms, rng, start, span):
+  participant_data = []
+  for person in members:
+    participant = {
+      'id': {'gaia_id': person.gaia_id, 'chat_id': person.gaia_id},
+      'fallback_name': person.name,
+    }
+    if sms:
+      participant['phone_number'] = {'e164': person.phone}
+    participant_data.append(participant)
+  medium = 'GOOGLE_VOICE_MEDIUM' if sms else 'BABEL_MEDIUM'
+  timestamps = sorted([rng.uniform(start, start+span) for i in range(num_events)])
+  events = []
+  for j, timestamp in enumerate(timestamps):
+    sender = members[0] if rng.random() < 0.45 else rng.choice(members[1:])
+    events.append({
+      'conversation_id': {'id': convo_id},
+      'sender_id': {'gaia_id': sender.gaia_id, 'chat_id': sender.gaia_id},
+      'timestamp': str(int(timestamp*1000000)),
+      'event_id': f'{convo_id}.{j}',
+      'event_type': 'REGULAR_CHAT_MESSAGE',
+      'delivery_medium': {'medium_type': medium},
+      'chat_message': {'message_content': make_hangouts_content(rng)},
+    })
+  return {
+    'conversation': {
+      'conversation_id': {'id': convo_id},
+      'conversation': {
+        'id': {'id': convo_id},
+        'type': 'STICKY_ONE_TO_ONE' if len(members) == 2 else 'GROUP',
+        'participant_data': participant_data,
+      },
+    },
+    'events': events,
+  }
+
+
+def make_hangouts_content(rng):
+  segments = [{'type': 'TEXT', 'text': make_text(rng)}]
+  roll = rng.random()
+  if roll < 0.05:
+    url = f'https://www.{rng.choice(DOMAINS)}/{rng.choice(WORDS)}'
+    segments.append({'type': 'TEXT', 'text': ' '})
+    segments.append({
+      'type': 'LINK', 'text': url,
+      'link_data': {'link_target': 'https://www.google.com/url?q='+url, 'display_url': url},
+    })
+  elif roll < 0.1:
+    segments.append({'type': 'LINE_BREAK', 'text': '\n'})
+    segments.append({'type': 'TEXT', 'text': make_text(rng)})
+  content = {'segment': segments}
+  if rng.random() < 0.02:
+    photo_id = rng.randint(10**18, 10**19-1)
+    content['attachment'] = [{
+      'embed_item': {
+        'type': ['PLUS_PHOTO'],
+        'plus_photo': {
+          'url': f'https://lh3.googleusercontent.com/-fake/{photo_id}/photo.jpg',
+          'thumbnail': {'url': f'https://lh3.googleusercontent.com/-fake/{photo_id}/s0/photo.jpg'},
+          'media_type': 'PHOTO',
+        },
+      },
+    }]
+  return content
+
+
+########## Voice ##########
+
+VOICE_KINDS = ('Text', 'Placed', 'Received', 'Missed', 'Voicemail')
+VOICE_KIND_WEIGHTS = (6, 2, 2, 1, 1)
+VOICE_HEAD = """<?xml version="1.0" ?>
+<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Strict//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-strict.dtd">
+<html xmlns="http://www.w3.org/1999/xhtml">
+<head>
+<meta http-equiv="Content-Type" content="text/html; charset=UTF-8" />
+<title>{title}</title>
+</head>
+<body>
+"""
+VOICE_TAGS = """<div class="tags">Labels:
+<a rel="tag" href="http://www.google.com/voice#{tag}">{label}</a></div>
+"""
+VOICE_TAIL = """</body>
+</html>
+"""
+
+
+def write_voice(root, people, num_events, rng=None, start=START, span=SPAN):
+  """Write a Google Voice Takeout directory: `root`/Calls/*.html and `root`/Phones.vcf.
+  Text records hold a conversation of several messages. The rest are single calls."""
+  if rng is None:
+    rng = random.Random()
+  root = pathlib.Path(root)
+  calls_dir = root/'Calls'
+  calls_dir.mkdir(parents=True, exist_ok=True)
+  me = people[0]
+  others = people[1:]
+  with (root/'Phones.vcf').open('w') as phones_file:
+    phones_file.write(
+      'BEGIN:VCARD\nVERSION:3.0\nFN:\n'
+      f'item1.TEL:{me.phone}\nitem1.X-ABLabel:Google Voice\n'
+      'END:VCARD\n'
+    )
+  used = set()
+  num_written = 0
+  while num_written < num_events:
+    kind = rng.choices(VOICE_KINDS, weights=VOICE_KIND_WEIGHTS)[0]
+    person = rng.choice(others)
+    timestamp = int(rng.uniform(start, start+span))
+    while (person, timestamp) in used:
+      timestamp += 1
+    used.add((person, timestamp))
+    stamp = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+    filename = f'{person.name} - {kind} - {stamp.strftime("%Y-%m-%dT%H_%M_%SZ")}.html'
+    if kind == 'Text':
+      num_messages = min(num_events-num_written, rng.randint(1, 12))
+      html = make_voice_text(me, person, timestamp, num_messages, rng)
+      num_written += num_messages
+    else:
+      html = make_voice_call(me, person, kind, timestamp, rng)
+      num_written += 1
+    with (calls_dir/filename).open('w', encoding='iso-8859-15') as record_file:
+      record_file.write(html)
+
+
+def make_voice_text(me, person, timestamp, num_messages, rng):
+  parts = [VOICE_HEAD.format(title=f'Me to {escape(person.name)}'), '<div class="hChatLog hfeed">\n']
+  for i in range(num_messages):
+    if rng.random() < 0.5:
+      sender_html = f'<a class="tel" href="tel:{me.phone}"><abbr class="fn" title="">Me</abbr></a>'
+    else:
+      sender_html = f'<a class="tel" href="tel:{person.phone}"><span class="fn">{escape(person.name)}</span></a>'
+    parts.append(
+      f'<div class="message"><abbr class="dt" title="{format_iso(timestamp)}">{format_voice_date(timestamp)}</abbr>:\n'
+      f'<cite class="sender vcard">{sender_html}</cite>:\n'
+      f'<q>{escape(make_text(rng))}</q>\n'
+      '</div>\n'
+    )
+    timestamp += rng.randint(5, 600)
+  parts.append('</div>\n')
+  parts.append(VOICE_TAGS.format(tag='sms', label='Text'))
+  parts.append(VOICE_TAIL)
+  return ''.join(parts)
+
+
+def make_voice_call(me, person, kind, timestamp, rng):
+  if kind == 'Placed':
+    action = 'Placed call to'
+  elif kind == 'Voicemail':
+    action = 'Voicemail from'
+  else:
+    action = f'{kind} call from'
+  parts = [
+    VOICE_HEAD.format(title=f'{action} {escape(person.name)}'),
+    '<div class="haudio">\n',
+    f'<span class="fn">{action} {escape(person.name)}</span>\n',
+    f'<div class="contributor vcard">{action}\n'
+    f'<a class="tel" href="tel:{person.phone}"><span class="fn">{escape(person.name)}</span></a></div>\n',
+    f'<abbr class="published" title="{format_iso(timestamp)}">{format_voice_date(timestamp)}</abbr>\n',
+  ]
+  if kind != 'Missed':
+    duration = rng.randint(5, 1800) if kind != 'Voicemail' else rng.randint(5, 90)
+    hours, remainder = divmod(duration, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    parts.append(
+      f'<abbr class="duration" title="PT{hours}H{minutes}M{seconds}S">'
+      f'({hours:02d}:{minutes:02d}:{seconds:02d})</abbr>\n'
+    )
+  if kind == 'Voicemail':
+    parts.append(f'<span class="description"><span class="full-text">{escape(make_text(rng))}</span></span>\n')
+  parts.append(VOICE_TAGS.format(tag=kind.lower(), label=kind))
+  parts.append('</div>\n')
+  parts.append(VOICE_TAIL)
+  return ''.join(parts)
+
+
+def format_voice_date(timestamp):
+  """Format a time like "Jan 5, 2014 3:04:05 PM"."""
+  dt = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+  hour = dt.hour % 12 or 12
+  return f'{dt:%b} {dt.day}, {dt.year} {hour}:{dt:%M:%S %p}'
+
+
+########## Tracks ##########
+
+KML_HEAD = """<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2" xmlns:atom="http://www.w3.org/2005/Atom">
+<Document>
+<open>1</open>
+<visibility>1</visibility>
+<name><![CDATA[{title}]]></name>
+<atom:author><atom:name><![CDATA[{author}]]></atom:name></atom:author>
+"""
+MYTRACKS_AUTHOR = 'Created by Google My Tracks on Android'
+GEOTRACKER_AUTHOR = 'Recorded in Geo Tracker for Android from Ilya Bogdanovich'
+MARKER_TYPES = ('home', 'shop', 'food', 'park', 'work', 'transit')
+
+
+def write_tracks(outdir, num_tracks, points_per_track=500, rng=None, start=START, span=SPAN):
+  """Write `num_tracks` tracks as .kml and .kmz files. About a third are in the Geo Tracker
+  dialect, and the rest are from My Tracks. Half are zipped into .kmz files."""
+  if rng is None:
+    rng = random.Random()
+  outdir = pathlib.Path(outdir)
+  outdir.mkdir(parents=True, exist_ok=True)
+  for i in range(num_tracks):
+    track_start = start + span*i/num_tracks + rng.uniform(0, span/num_tracks/2)
+    track = make_track(track_start, points_per_track, rng)
+    markers = make_markers(track, rng)
+    dt = datetime.datetime.fromtimestamp(track_start, datetime.timezone.utc)
+    title = dt.strftime('%Y-%m-%d %H:%M')
+    if rng.random() < 1/3:
+      kml_str = make_geotracker_kml(title, track, markers)
+    else:
+      kml_str = make_mytracks_kml(title, track, markers)
+    filename = f'track-{i:05d}-{dt.strftime("%Y%m%d-%H%M")}'
+    if rng.random() < 0.5:
+      with zipfile.ZipFile(outdir/(filename+'.kmz'), 'w', zipfile.ZIP_DEFLATED) as kmz_file:
+        kmz_file.writestr('doc.kml', kml_str)
+    else:
+      (outdir/(filename+'.kml')).write_text(kml_str)
+
+
+def make_track(track_start, num_points, rng):
+  """A random walk (or bike ride) from near `HOME`, as (timestamp, lat, lon, alt) tuples.
+  A few points are GPS glitches, to give `kml.filter_track()` something to do."""
+  lat = HOME[0] + rng.gauss(0, 0.05)
+  lon = HOME[1] + rng.gauss(0, 0.05)
+  alt = rng.uniform(0, 100)
+  # Meters per second.
+  speed = rng.choice((1.4, 4, 12))
+  heading = rng.uniform(0, 2*math.pi)
+  timestamp = track_start
+  track = []
+  for i in range(num_points):
+    interval = rng.uniform(2, 10)
+    timestamp += interval
+    heading += rng.gauss(0, 0.3)
+    distance = speed*interval
+    lat += distance*math.cos(heading)/111111
+    lon += distance*math.sin(heading)/(111111*math.cos(math.radians(lat)))
+    alt += rng.gauss(0, 1)
+    if rng.random() < 0.002:
+      # A glitch: way off in the distance or high in the sky.
+      track.append((timestamp, lat+rng.uniform(1, 5), lon, alt))
+    elif rng.random() < 0.003:
+      track.append((timestamp, lat, lon, rng.uniform(200000, 300000)))
+    else:
+      track.append((timestamp, lat, lon, alt))
+  return track
+
+
+def make_markers(track, rng):
+  markers = []
+  for i in range(rng.randint(0, 4)):
+    timestamp, lat, lon, alt = rng.choice(track)
+    lines = [make_text(rng, max_words=8), f'!type: {rng.choice(MARKER_TYPES)}']
+    if rng.random() < 0.5:
+      lines.append(f'!people: {rng.choice(FIRST_NAMES)}; {rng.choice(FIRST_NAMES)}')
+    if rng.random() < 0.2:
+      lines.append('!private')
+    markers.append({'name': make_text(rng, max_words=3), 'description': '\n'.join(lines),
+                    'timestamp': timestamp, 'lat': lat, 'lon': lon, 'alt': alt})
+  return markers
+
+
+def make_marker_placemark(marker):
+  return (
+    '<Placemark>\n'
+    f'<name><![CDATA[{marker["name"]}]]></name>\n'
+    f'<description><![CDATA[{marker["description"]}]]></description>\n'
+    f'<TimeStamp><when>{format_iso(marker["timestamp"])}</when></TimeStamp>\n'
+    '<styleUrl>#statistics</styleUrl>\n'
+    f'<Point><coordinates>{marker["lon"]:0.6f},{marker["lat"]:0.6f},{marker["alt"]:0.1f}</coordinates></Point>\n'
+    '</Placemark>\n'
+  )
+
+
+def make_multitrack(track):
+  parts = ['<gx:MultiTrack>\n<altitudeMode>absolute</altitudeMode>\n<gx:interpolate>1</gx:interpolate>\n<gx:Track>\n']
+  for timestamp, lat, lon, alt in track:
+    parts.append(f'<when>{format_iso(timestamp)}</when>\n<gx:coord>{lon:0.6f} {lat:0.6f} {alt:0.1f}</gx:coord>\n')
+  parts.append('</gx:Track>\n</gx:MultiTrack>\n')
+  return ''.join(parts)
+
+
+def make_mytracks_kml(title, track, markers):
+  parts = [KML_HEAD.format(title=title, author=MYTRACKS_AUTHOR)]
+  for style in ('start', 'end', 'statistics'):
+    parts.append(f'<Style id="{style}"><IconStyle><scale>1.3</scale></IconStyle></Style>\n')
+  parts.append('<Placemark>\n<name><![CDATA[(Start)]]></name>\n')
+  parts.append(f'<TimeStamp><when>{format_iso(track[0][0])}</when></TimeStamp>\n<styleUrl>#start</styleUrl>\n')
+  parts.append(f'<Point><coordinates>{track[0][2]:0.6f},{track[0][1]:0.6f},{track[0][3]:0.1f}</coordinates></Point>\n</Placemark>\n')
+  parts.append('<Placemark id="tour">\n')
+  parts.append(f'<name><![CDATA[{title}]]></name>\n<description><![CDATA[]]></description>\n')
+  parts.append(make_multitrack(track))
+  parts.append('</Placemark>\n')
+  parts.append('<Placemark>\n<name><![CDATA[(End)]]></name>\n')
+  parts.append(f'<TimeStamp><when>{format_iso(track[-1][0])}</when></TimeStamp>\n<styleUrl>#end</styleUrl>\n')
+  parts.append(f'<Point><coordinates>{track[-1][2]:0.6f},{track[-1][1]:0.6f},{track[-1][3]:0.1f}</coordinates></Point>\n</Placemark>\n')
+  if markers:
+    parts.append(f'<Folder>\n<name><![CDATA[{title} Markers]]></name>\n')
+    for marker in markers:
+      parts.append(make_marker_placemark(marker))
+    parts.append('</Folder>\n')
+  parts.append('</Document>\n</kml>\n')
+  return ''.join(parts)
+
+
+def make_geotracker_kml(title, track, markers):
+  parts = [KML_HEAD.format(title=title, author=GEOTRACKER_AUTHOR)]
+  parts.append('<Style id="track"><LineStyle><color>ff0000ff</color><width>4</width></LineStyle></Style>\n')
+  parts.append('<Placemark id="tour">\n')
+  parts.append(f'<name><![CDATA[{title}]]></name>\n<description><![CDATA[]]></description>\n')
+  parts.append(
+    f'<TimeSpan><begin>{format_iso(track[0][0])}</begin><end>{format_iso(track[-1][0])}</end></TimeSpan>\n'
+  )
+  parts.append(make_multitrack(track))
+  parts.append('</Placemark>\n')
+  for marker in markers:
+    parts.append(make_marker_placemark(marker))
+  parts.append('</Document>\n</kml>\n')
+  return ''.join(parts)
+
+
+########## Location History ##########
+
+
+RECORD_SOURCES = ('WIFI', 'CELL', 'GPS')
+
+
+def write_records(path, num_locations, rng=None, start=START, span=SPAN):
+  """Write a Location History Records.json like the one from Google Takeout, formatted the same
+  way (one key per line). The first half use the old "timestampMs" field, and the rest use
+  "timestamp"."""
+  if rng is None:
+    rng = random.Random()
+  lat, lon = HOME
+  with open(path, 'w') as records_file:
+    records_file.write('{\n  "locations": [')
+    for i in range(num_locations):
+      timestamp = start + span*i/num_locations + rng.uniform(0, span/num_locations/2)
+      # Wander around, but stay near home.
+      lat += rng.gauss(0, 0.002) + (HOME[0]-lat)*0.01
+      lon += rng.gauss(0, 0.002) + (HOME[1]-lon)*0.01
+      record = {'latitudeE7': round(lat*1e7), 'longitudeE7': round(lon*1e7),
+                'accuracy': rng.choice((5, 10, 20, 50, 1500))}
+      if i < num_locations/2:
+        record['timestampMs'] = str(round(timestamp*1000))
+      else:
+        record['timestamp'] = format_iso(timestamp)
+      record['source'] = rng.choice(RECORD_SOURCES)
+      if i > 0:
+        records_file.write(',')
+      records_file.write(' ')
+      records_file.write(json.dumps(record, indent=2).replace('\n', '\n    '))
+    records_file.write(' ]\n}\n')
+
+
+########## Contacts ##########
+
+CONTACTS_HEADER = (
+  'Name', 'Given Name', 'Additional Name', 'Family Name', 'Yomi Name', 'Given Name Yomi',
+  'Additional Name Yomi', 'Family Name Yomi', 'Name Prefix', 'Name Suffix', 'Initials', 'Nickname',
+  'Short Name', 'Maiden Name', 'Birthday', 'Gender', 'Location', 'Billing Information',
+  'Directory Server', 'Mileage', 'Occupation', 'Hobby', 'Sensitivity', 'Priority', 'Subject',
+  'Notes', 'Group Membership', 'E-mail 1 - Type', 'E-mail 1 - Value', 'Phone 1 - Type',
+  'Phone 1 - Value', 'Phone 2 - Type', 'Phone 2 - Value', 'Address 1 - Type',
+  'Address 1 - Formatted', 'Organization 1 - Type', 'Organization 1 - Name',
+)
+
+
+def write_contacts_csv(path, people, rng=None):
+  """Write a "Google CSV" export of Google Contacts with most of the `people` (not "me").
+  Phone numbers are formatted in different ways than in the other data, like they are in real
+  address books."""
+  if rng is None:
+    rng = random.Random()
+  with open(path, 'w', newline='') as csv_file:
+    writer = csv.writer(csv_file)
+    writer.writerow(CONTACTS_HEADER)
+    for person in people[1:]:
+      if rng.random() < 0.2:
+        continue
+      row = dict.fromkeys(CONTACTS_HEADER, '')
+      row['Name'] = person.name
+      row['Given Name'] = person.first
+      row['Family Name'] = person.last
+      row['Group Membership'] = '* myContacts'
+      row['E-mail 1 - Type'] = '* Home'
+      row['E-mail 1 - Value'] = person.email
+      number = person.phone[2:]
+      row['Phone 1 - Type'] = 'Mobile'
+      row['Phone 1 - Value'] = rng.choice((
+        person.phone, f'({number[:3]}) {number[3:6]}-{number[6:]}', f'{number[:3]}-{number[3:6]}-{number[6:]}'
+      ))
+      if rng.random() < 0.2:
+        row['Phone 2 - Type'] = 'Work'
+        row['Phone 2 - Value'] = f'+1555{rng.randint(2000000, 9999999)}'
+      if rng.random() < 0.3:
+        row['Address 1 - Type'] = 'Home'
+        row['Address 1 - Formatted'] = f'{rng.randint(1, 9999)} {rng.choice(LAST_NAMES)} St NW\nWashington, DC 20001'
+      if rng.random() < 0.3:
+        row['Organization 1 - Name'] = f'{rng.choice(LAST_NAMES)} & {rng.choice(LAST_NAMES)}'
+      writer.writerow([row[column] for column in CONTACTS_HEADER])
+
+
+if __name__ == '__main__':
+  try:
+    sys.exit(main(sys.argv))
+  except BrokenPipeError:
+    pass
@@ -24,6 +24,7 @@ except ImportError:
   sys.path.insert(0, str(root))
   from contacts import Contact, ContactBook
 from drivers.utils import extract_data
+import profiling
 
 #TODO: Deal with participants leaving and joining hangouts chats.
 #      Membership can vary over time, but I think this is currently getting the static list of
@@ -33,14 +34,19 @@ from drivers.utils import extract_data
 VERSION = '0.2.2'
 
 
-def get_events(convos):
+def get_events(convos, since=None):
   # Implement the driver interface.
   # This yields Python dicts, not JSON strings, so the caller has to do the json.dumps().
+  # `since` is the high-water marks from a previous run: a dict mapping conversation ids to the
+  # timestamp of the last event already seen in each. Only events after that will be yielded.
   book = ContactBook()
   book.indexable.add('gaia_ids')
   emitted_contacts = set()
   for convo in convos:
+    last = get_mark(since, convo.id)
     for event in convo.events:
+      if last is not None and event.timestamp <= last:
+        continue
       recipients = []
       for participant in convo.participants:
         if participant.id != event.sender_id:
@@ -64,6 +70,16 @@ def get_events(convos):
           yield contact.to_dict(stream='contact', format='hangouts')
           emitted_contacts.add(contact.id)
       yield event
+    # Record how far we've gotten in this conversation, for the next incremental run.
+    if convo.end_time is not None:
+      yield {'stream':'mark', 'format':'hangouts', 'source':convo.id, 'last':convo.end_time}
+
+
+def get_mark(since, convo_id):
+  """Get the timestamp of the last event seen in a conversation, if any."""
+  if since is None or convo_id not in since:
+    return None
+  return since[convo_id]['last']
 
 
 def participant_to_contact(participant, book):
@@ -290,9 +306,11 @@ class Conversation(object):
       )
 
 
-def read_hangouts(json_data, convo_id=None):
+def read_hangouts(json_data, convo_id=None, since=None):
   """Parses the json file.
-  A generator that yields conversations."""
+  A generator that yields conversations.
+  If `since` is given, conversations with no events after their high-water mark are skipped without
+  parsing them (see `get_events()`)."""
   logging.info("Analyzing json file ...")
   if "conversation_state" in json_data:
     jconvos = json_data["conversation_state"]
@@ -305,6 +323,11 @@ def read_hangouts(json_data, convo_id=None):
     else:
       jconvo = meta_convo["conversation"]
       jevents = meta_convo["events"]
+    last = get_mark(since, jconvo["conversation_id"]["id"])
+    if last is not None and jevents:
+      # The timestamps are in microseconds.
+      if max([int(jevent["timestamp"]) for jevent in jevents])/1000000 <= last:
+        continue
     convo = _extract_convo_data(jconvo, jevents)
     if convo_id is None or convo.id == convo_id:
       yield convo
@@ -436,6 +459,14 @@ def make_argparser():
     help='Print the output in the Driver API JSON format.')
   parser.add_argument('-J', '--json-array', action='store_true',
     help='When using --json, add commas and brackets to make the entire output a JSON array.')
+  parser.add_argument('--since', type=argparse.FileType('r'),
+    help='Only output data that\'s newer than what\'s recorded in this JSON file of high-water marks '
+         'from a previous run. It should map conversation ids to mark objects with a "last" '
+         'timestamp, like the "mark" objects in the --json output.')
+  parser.add_argument('--memprofile', action='store_true',
+    help='Track memory allocations (with tracemalloc) while reading the file, parsing the '
+         'conversations, and outputting the events, and print a report of where the memory goes to '
+         'the log (stderr by default).')
   parser.add_argument('-S', '--no-sort', dest='sort', action='store_false', default=True)
   parser.add_argument('-l', '--list', action='store_true',
     help='Just print the list of conversations, not their full contents. Prints one line per '
@@ -481,20 +512,41 @@ def main(argv):
 
   validate_file(args.logfile)
 
-  json_data = extract_data(args.logfile, 'Takeout/Hangouts/Hangouts.json', transform='json')
+  if args.memprofile:
+    profiling.start(memory=True)
+    try:
+      return run(args, start, end)
+    finally:
+      profiling.report(profiling.stop())
+  else:
+    return run(args, start, end)
+
+
+def run(args, start, end):
+
+  with profiling.span('read'):
+    json_data = extract_data(args.logfile, 'Takeout/Hangouts/Hangouts.json', transform='json')
+  profiling.checkpoint('read')
   if json_data is None:
     return 1
 
   if args.format == 'json':
     if args.json_array:
       print('[')
+    if args.since:
+      since = json.load(args.since)
+    else:
+      since = None
     first = True
-    for obj in get_events(read_hangouts(json_data)):
-      if first:
-        first = False
-      elif args.json_array:
-        print(',', end='')
-      print(json.dumps(obj))
+    convos = profiling.wrap('parse', read_hangouts(json_data, since=since))
+    with profiling.span('output'):
+      for obj in profiling.wrap('events', get_events(convos, since=since)):
+        if first:
+          first = False
+        elif args.json_array:
+          print(',', end='')
+        print(json.dumps(obj))
+    profiling.checkpoint('output')
     if args.json_array:
       print(']')
     return
@@ -5,22 +5,28 @@ import logging
 import sys
 import kml
 
-def parse(kml_tree):
-  # <kml>
-  if len(kml_tree) != 1:
-    logging.warning('Warning: <kml> element contained {} children.'.format(len(kml_tree)))
+def parse(kml_file):
+  """Get the total distance of the track in the file, in kilometers. Give an open file from
+  `kml.open_kml()`. The file is parsed incrementally and the points aren't kept, so this works on
+  location histories of any size."""
+  distance = 0
+  last_point = None
+  num_placemarks = 0
+  # <kml><Document>
+  for item_type, item in kml.iterparse_kml(kml_file):
+    if item_type == 'point':
+      point = item
+      if last_point is not None:
+        distance += kml.get_lat_long_distance(point[1], point[2], last_point[1], last_point[2])
+      last_point = point
+    # <Placemark>
+    elif item.tag == '{http://www.opengis.net/kml/2.2}Placemark':
+      num_placemarks += 1
+  if num_placemarks != 1:
+    logging.warning('Warning: <Document> contained {} <Placemark>s.'.format(num_placemarks))
+  if last_point is None:
+    logging.warning('Warning: No track points found.')
     return None
-  # <Document>
-  if kml_tree[0].tag != '{http://www.opengis.net/kml/2.2}Document' or len(kml_tree[0]) != 1:
-    logging.warning('Warning: <Document> element not found or contained {} children.'
-                    .format(len(kml_tree[0])))
-    return None
-  # <Placemark>
-  if kml_tree[0][0].tag != '{http://www.opengis.net/kml/2.2}Placemark' or len(kml_tree[0][0]) < 1:
-    logging.warning('Warning: <Placemark> element not found or contained {} children.'
-                    .format(len(kml_tree[0])))
-    return None
-  distance = kml.parse_track(kml_tree[0][0])
   return distance
 
 def make_argparser():
@@ -44,11 +50,8 @@ def main(argv):
   parser = make_argparser()
   args = parser.parse_args(argv[1:])
   logging.basicConfig(stream=args.log, level=args.volume, format='%(message)s')
-  if args.kml.endswith('.kmz'):
-    kml_tree = kml.read_kmz(args.kml)
-  else:
-    kml_tree = kml.read_kml(args.kml)
-  distance = parse(kml_tree)
+  with kml.open_kml(args.kml) as kml_file:
+    distance = parse(kml_file)
   if distance is None:
     fail('Error: Did not find location data.')
   else:
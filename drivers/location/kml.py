@@ -1,10 +1,31 @@
+import bisect
+import calendar
+import contextlib
+import datetime
+import functools
 import logging
 import math
+import re
 import zipfile
-import dateutil
+import dateutil.parser
 import defusedxml.ElementTree
+try:
+  import numpy
+except ImportError:
+  numpy = None
 
 EARTH_RADIUS = 6371  # Radius of Earth in km.
+KML_NS = '{http://www.opengis.net/kml/2.2}'
+GX_NS = '{http://www.google.com/kml/ext/2.2}'
+# The timestamp format My Tracks and Geo Tracker use, like "2014-01-01T12:00:00.000Z".
+ISO_8601_REGEX = re.compile(
+  r'^(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:\.(\d+))?(Z|[+-]\d\d:?\d\d)?$'
+)
+# The Douglas-Peucker tolerances (in km) for the levels of a track pyramid: 5, 25, and 125 meters.
+PYRAMID_TOLERANCES = (0.005, 0.025, 0.125)
+# Tracks shorter than this are processed in pure Python even if NumPy is available, since converting
+# them to arrays takes longer than it saves.
+NUMPY_MIN_POINTS = 32
 
 
 def parse_kml_str(kml_str):
@@ -32,6 +53,62 @@ def extract_from_zip(zip_path, file_path):
   return contents
 
 
+@contextlib.contextmanager
+def open_kml(kml_path, kmz=None):
+  """Open a .kml or .kmz file for streaming with `iterparse_kml()`. Give a path or an open (binary)
+  filehandle. For a .kmz, this opens the doc.kml inside it without extracting it all.
+  Whether it's a .kmz is decided by the file extension, unless you give `kmz`."""
+  if kmz is None:
+    kml_name = str(getattr(kml_path, 'name', kml_path))
+    kmz = kml_name.endswith('.kmz') or kml_name.endswith('.zip')
+  if kmz:
+    with zipfile.ZipFile(kml_path, 'r') as zip_file:
+      with zip_file.open('doc.kml', 'r') as kml_file:
+        yield kml_file
+  elif hasattr(kml_path, 'read'):
+    yield kml_path
+  else:
+    with open(kml_path, 'rb') as kml_file:
+      yield kml_file
+
+
+def iterparse_kml(kml_file, depth=2, parse_points=True):
+  """Parse KML incrementally, without building the whole tree in memory.
+  Yields `('point', point)` for each point in each <gx:Track>, as it's parsed, and
+  `('element', element)` for each complete element `depth` levels down (by default, the children of
+  the <Document>). Points are in the same format as `parse_track()`. Each element is removed from the
+  tree once it's been yielded, so memory use doesn't grow with the size of the file. This also means
+  the <gx:Track>s in the yielded elements will be empty.
+  If `parse_points` is False, the points are thrown away without parsing them."""
+  # The elements from the root down to the one being parsed.
+  stack = []
+  point = (None,)
+  events = defusedxml.ElementTree.iterparse(kml_file, events=('start', 'end'))
+  for event, element in events:
+    if event == 'start':
+      stack.append(element)
+      continue
+    stack.pop()
+    if not stack:
+      continue
+    parent = stack[-1]
+    if parent.tag == GX_NS+'Track':
+      if parse_points:
+        # <when>
+        if element.tag == KML_NS+'when':
+          point = (parse_timestamp(element.text),)
+        # <gx:coord>
+        elif element.tag == GX_NS+'coord':
+          point += parse_coord(element.text, 'gx')
+        if len(point) == 4:
+          yield 'point', point
+          point = (None,)
+      parent.remove(element)
+    elif len(stack) == depth:
+      yield 'element', element
+      parent.remove(element)
+
+
 def parse_track(track_element):
   """Parse the time/location points from a track element.
   Argument: the enclosing <gx:MultiTrack> containing one or more <gx:Track>s."""
@@ -43,7 +120,7 @@ def parse_track(track_element):
       for subelement in element:
         # <when>
         if subelement.tag == '{http://www.opengis.net/kml/2.2}when':
-          when = dateutil.parser.parse(subelement.text).timestamp()
+          when = parse_timestamp(subelement.text)
           point = (when,)
         # <gx:coord>
         elif subelement.tag == '{http://www.google.com/kml/ext/2.2}coord':
@@ -54,6 +131,45 @@ def parse_track(track_element):
   return track
 
 
+def parse_timestamp(time_str):
+  """Parse an ISO 8601 time string into a Unix timestamp. Times without a time zone are taken as
+  local time, like `dateutil`.
+  The formats from My Tracks and Geo Tracker are parsed directly, which is much faster than
+  `dateutil.parser`. Anything else falls back to `dateutil`."""
+  time_str = time_str.strip()
+  match = ISO_8601_REGEX.match(time_str)
+  if not match:
+    return dateutil.parser.parse(time_str).timestamp()
+  year, month, day, hour, minute, second, fraction, zone = match.groups()
+  # Only microseconds, like `datetime`.
+  micros = int(fraction[:6].ljust(6, '0')) if fraction else 0
+  if zone is None:
+    try:
+      dt = datetime.datetime(int(year), int(month), int(day), int(hour), int(minute), int(second))
+    except ValueError:
+      return dateutil.parser.parse(time_str).timestamp()
+    return (int(dt.timestamp())*1000000 + micros)/1000000
+  hour, minute, second = int(hour), int(minute), int(second)
+  try:
+    if hour > 23 or minute > 59 or second > 59:
+      raise ValueError(f'Time out of range: {time_str!r}')
+    seconds = get_day_start(int(year), int(month), int(day))
+  except ValueError:
+    return dateutil.parser.parse(time_str).timestamp()
+  seconds += hour*3600 + minute*60 + second
+  if zone != 'Z':
+    offset = int(zone[1:3])*3600 + int(zone[-2:])*60
+    seconds += -offset if zone[0] == '+' else offset
+  return (seconds*1000000 + micros)/1000000
+
+
+@functools.lru_cache(maxsize=1024)
+def get_day_start(year, month, day):
+  """The Unix timestamp of the start of this (UTC) day. Raises `ValueError` for invalid dates.
+  Cached, since the points in a track are mostly on the same day."""
+  return calendar.timegm(datetime.date(year, month, day).timetuple())
+
+
 def filter_track(track, speed_limit=2000, alt_limit=100000):
   """Remove obviously inaccurate points from track.
   Removes points at impossible altitudes, impossibly far from neighboring points, or which occurred
@@ -61,6 +177,13 @@ def filter_track(track, speed_limit=2000, alt_limit=100000):
   `speed_limit` is in km/h
   `alt_limit` is in feet"""
   # See example-mytracks6.xml for the sort of errors this is designed for.
+  points = get_points_array(track)
+  if points is None:
+    return filter_track_python(track, speed_limit, alt_limit)
+  return [track[i] for i in filter_points(points, speed_limit, alt_limit).tolist()]
+
+
+def filter_track_python(track, speed_limit=2000, alt_limit=100000):
   new_track = []
   speed_limit_km_sec = speed_limit/60/60
   last_lat = last_lon = last_when = None
@@ -95,7 +218,78 @@ def filter_track(track, speed_limit=2000, alt_limit=100000):
   return new_track
 
 
+def filter_points(points, speed_limit=2000, alt_limit=100000):
+  """The NumPy version of `filter_track()`. Takes an array from `get_points_array()` and returns the
+  indices of the points to keep.
+  Each point is checked against the last one kept, not the one just before it. But almost every point
+  is kept, so this checks all the neighboring pairs at once, then only goes point by point after the
+  (rare) rejected ones, until it finds the next point to keep."""
+  speed_limit_km_sec = speed_limit/60/60
+  # Too high? Missing altitudes are NaN, which passes.
+  candidates = numpy.flatnonzero(~(points[:, 3] > alt_limit))
+  if len(candidates) == 0:
+    return candidates
+  whens = points[candidates, 0]
+  lats = points[candidates, 1]
+  lons = points[candidates, 2]
+  # pair_ok[i] says whether candidate i+1 is okay, if candidate i was kept.
+  pair_ok = get_speeds_ok(
+    lats[1:], lons[1:], whens[1:], lats[:-1], lons[:-1], whens[:-1], speed_limit_km_sec
+  )
+  bad_pairs = numpy.flatnonzero(~pair_ok)
+  keep = numpy.ones(len(candidates), dtype=bool)
+  i = 0
+  while True:
+    # Find the next candidate that fails against the one before it, which we know was kept.
+    b = bisect.bisect_left(bad_pairs, i)
+    if b >= len(bad_pairs):
+      break
+    last = bad_pairs[b]
+    # Reject candidates until one is okay compared to `last`, checking them in growing batches.
+    start = last + 1
+    size = 8
+    next_kept = None
+    while start < len(candidates):
+      end = min(start+size, len(candidates))
+      ok = get_speeds_ok(
+        lats[start:end], lons[start:end], whens[start:end], lats[last], lons[last], whens[last],
+        speed_limit_km_sec
+      )
+      hits = numpy.flatnonzero(ok)
+      if len(hits):
+        next_kept = start + hits[0]
+        keep[start:next_kept] = False
+        break
+      keep[start:end] = False
+      start = end
+      size *= 2
+    if next_kept is None:
+      break
+    i = next_kept
+  return candidates[keep]
+
+
+def get_speeds_ok(lats, lons, whens, last_lats, last_lons, last_whens, speed_limit_km_sec):
+  """Which points could have been reached from the last points without going faster than the limit
+  or backward in time. Takes arrays (or scalars for the last point), and returns a boolean array."""
+  distances = get_lat_long_distances(lats, lons, last_lats, last_lons)
+  durations = whens - last_whens
+  with numpy.errstate(divide='ignore', invalid='ignore'):
+    speeds = distances/durations
+  return (((durations > 0) & (speeds <= speed_limit_km_sec))
+          | ((durations == 0) & (distances == 0)))
+
+
 def get_total_distance(track):
+  points = get_points_array(track)
+  if points is None:
+    return get_total_distance_python(track)
+  lats = points[:, 1]
+  lons = points[:, 2]
+  return float(get_lat_long_distances(lats[1:], lons[1:], lats[:-1], lons[:-1]).sum())
+
+
+def get_total_distance_python(track):
   distance = 0
   lat = lon = last_lat = last_lon = None
   for point in track:
@@ -110,6 +304,136 @@ def get_total_distance(track):
     return distance
 
 
+def simplify_track(track, tolerance):
+  """Simplify a track with the Douglas-Peucker algorithm: keep only enough points that every point
+  left out is within `tolerance` kilometers of the simplified track. The first and last points are
+  always kept.
+  Run `filter_track()` first, or the GPS glitches will be kept as the most prominent features."""
+  if len(track) < 3:
+    return list(track)
+  points = get_points_array(track)
+  if points is None:
+    xs, ys = project_points([point[1] for point in track], [point[2] for point in track])
+    keep = simplify_points_python(xs, ys, tolerance)
+  else:
+    xs, ys = project_points(points[:, 1], points[:, 2])
+    keep = simplify_points(xs, ys, tolerance)
+  return [track[i] for i in keep]
+
+
+def get_track_pyramid(track, tolerances=PYRAMID_TOLERANCES):
+  """Simplify a track at each of the (increasing) `tolerances`. Returns a list of
+  `(max_error, track)` levels, from finest to coarsest. Each level is simplified from the one
+  before, which is faster and means each level's points are a subset of the last's. But then each
+  level can be off by the sum of its tolerance and the ones before it, which is its `max_error`: no
+  point in the original `track` is farther than that (in km) from the level's line."""
+  levels = []
+  max_error = 0
+  for tolerance in tolerances:
+    track = simplify_track(track, tolerance)
+    max_error = round(max_error+tolerance, 6)
+    levels.append((max_error, track))
+  return levels
+
+
+def project_points(lats, lons):
+  """Project latitudes and longitudes onto a flat plane, in kilometers (an equirectangular projection
+  centered on the first point). Fine over the span of a track, but not for whole continents.
+  Longitudes are taken the short way around, so points across the antimeridian stay close."""
+  lat0 = lats[0]
+  lon0 = lons[0]
+  scale = math.pi/180*EARTH_RADIUS
+  lon_scale = scale*math.cos(math.radians(lat0))
+  if numpy is not None and isinstance(lats, numpy.ndarray):
+    return ((lons-lon0+180) % 360 - 180)*lon_scale, (lats-lat0)*scale
+  xs = [((lon-lon0+180) % 360 - 180)*lon_scale for lon in lons]
+  ys = [(lat-lat0)*scale for lat in lats]
+  return xs, ys
+
+
+def simplify_points(xs, ys, tolerance):
+  """The NumPy version of Douglas-Peucker, on projected points from `project_points()`.
+  Returns the indices of the points to keep."""
+  keep = numpy.zeros(len(xs), dtype=bool)
+  keep[0] = keep[-1] = True
+  # Done with a stack instead of recursion, so long tracks can't hit the recursion limit.
+  stack = [(0, len(xs)-1)]
+  while stack:
+    start, end = stack.pop()
+    if end - start < 2:
+      continue
+    distances = get_segment_distances(
+      xs[start+1:end], ys[start+1:end], xs[start], ys[start], xs[end], ys[end]
+    )
+    i = int(distances.argmax())
+    if distances[i] > tolerance:
+      middle = start+1+i
+      keep[middle] = True
+      stack.append((start, middle))
+      stack.append((middle, end))
+  return numpy.flatnonzero(keep).tolist()
+
+
+def simplify_points_python(xs, ys, tolerance):
+  keep = [False]*len(xs)
+  keep[0] = keep[-1] = True
+  stack = [(0, len(xs)-1)]
+  while stack:
+    start, end = stack.pop()
+    max_distance = None
+    middle = None
+    for i in range(start+1, end):
+      distance = get_segment_distance(xs[i], ys[i], xs[start], ys[start], xs[end], ys[end])
+      if max_distance is None or distance > max_distance:
+        max_distance = distance
+        middle = i
+    if max_distance is not None and max_distance > tolerance:
+      keep[middle] = True
+      stack.append((start, middle))
+      stack.append((middle, end))
+  return [i for i, kept in enumerate(keep) if kept]
+
+
+def get_segment_distance(x, y, x1, y1, x2, y2):
+  """The distance from point (x, y) to the line segment from (x1, y1) to (x2, y2), on a plane."""
+  dx = x2 - x1
+  dy = y2 - y1
+  length_sq = dx*dx + dy*dy
+  if length_sq == 0:
+    fraction = 0
+  else:
+    fraction = min(max(((x-x1)*dx + (y-y1)*dy)/length_sq, 0), 1)
+  return math.hypot(x - (x1 + fraction*dx), y - (y1 + fraction*dy))
+
+
+def get_segment_distances(xs, ys, x1, y1, x2, y2):
+  """The NumPy version of `get_segment_distance()`. Any of the arguments can be arrays."""
+  dx = x2 - x1
+  dy = y2 - y1
+  length_sq = dx*dx + dy*dy
+  with numpy.errstate(divide='ignore', invalid='ignore'):
+    fractions = numpy.where(length_sq == 0, 0, ((xs-x1)*dx + (ys-y1)*dy)/length_sq)
+  fractions = numpy.clip(fractions, 0, 1)
+  return numpy.hypot(xs - (x1 + fractions*dx), ys - (y1 + fractions*dy))
+
+
+def get_line_distance(lats, lons, location):
+  """The shortest distance (in km) from `location` (a latitude/longitude pair) to the line through
+  the points, not just to the points themselves. Uses a flat projection centered on the location,
+  so it's only accurate for lines within a few hundred kilometers of it."""
+  lat0, lon0 = location
+  if numpy is not None and isinstance(lats, numpy.ndarray):
+    xs, ys = project_points(numpy.concatenate(([lat0], lats)), numpy.concatenate(([lon0], lons)))
+    if len(lats) == 1:
+      return float(numpy.hypot(xs[1], ys[1]))
+    return float(get_segment_distances(0, 0, xs[1:-1], ys[1:-1], xs[2:], ys[2:]).min())
+  xs, ys = project_points([lat0]+list(lats), [lon0]+list(lons))
+  if len(lats) == 1:
+    return math.hypot(xs[1], ys[1])
+  return min([get_segment_distance(0, 0, xs[i], ys[i], xs[i+1], ys[i+1])
+              for i in range(1, len(xs)-1)])
+
+
 def parse_coord(coord_str, type):
   if type == 'kml':
     fields = coord_str.split(',')
@@ -127,6 +451,14 @@ def parse_coord(coord_str, type):
 
 
 def is_track_near(track, location, thres):
+  points = get_points_array(track)
+  if points is None:
+    return is_track_near_python(track, location, thres)
+  distances = get_lat_long_distances(points[:, 1], points[:, 2], location[0], location[1])
+  return bool((distances <= thres).any())
+
+
+def is_track_near_python(track, location, thres):
   for point in track:
     when, lat, lon = point[:3]
     distance = get_lat_long_distance(lat, lon, location[0], location[1])
@@ -147,3 +479,38 @@ def get_lat_long_distance(lat1, lon1, lat2, lon2):
   a = math.sin(lat_delta/2)**2 + math.cos(lat1)*math.cos(lat2)*math.sin(lon_delta/2)**2
   c = 2*math.asin(math.sqrt(a))
   return EARTH_RADIUS * c
+
+
+def get_lat_long_distances(lats1, lons1, lats2, lons2):
+  """The NumPy version of `get_lat_long_distance()`: give arrays of latitudes and longitudes (or
+  scalars, which are broadcast) and get an array of distances in kilometers."""
+  lats1 = numpy.radians(lats1)
+  lats2 = numpy.radians(lats2)
+  lat_delta = lats2 - lats1
+  lon_delta = numpy.radians(lons2) - numpy.radians(lons1)
+  a = numpy.sin(lat_delta/2)**2 + numpy.cos(lats1)*numpy.cos(lats2)*numpy.sin(lon_delta/2)**2
+  # Rounding can push `a` a hair over 1 for antipodal points.
+  return EARTH_RADIUS * 2*numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1)))
+
+
+def get_points_array(track):
+  """Convert a track into an array with a row per point: timestamp, latitude, longitude, altitude.
+  Missing altitudes become NaN. Returns None if NumPy isn't available, the track is too short to be
+  worth it, or any timestamps or coordinates are missing, so the caller can fall back to pure
+  Python."""
+  if numpy is None or len(track) < NUMPY_MIN_POINTS:
+    return None
+  try:
+    points = numpy.array(track, dtype=float)
+  except (TypeError, ValueError):
+    # Points of different lengths.
+    try:
+      points = numpy.array([point[:4] for point in track], dtype=float)
+    except (TypeError, ValueError):
+      return None
+  if points.ndim != 2 or points.shape[1] < 4:
+    return None
+  points = points[:, :4]
+  if numpy.isnan(points[:, :3]).any():
+    return None
+  return points
@@ -3,6 +3,7 @@
 import argparse
 import collections
 import datetime
+import json
 import logging
 import os
 import pathlib
@@ -13,13 +14,13 @@ import xml.dom.minidom
 import dateutil.parser
 import yaml
 import kml
+import trackindex
 try:
-  from events import LocationEvent
+  import polyline
 except ImportError:
   root = pathlib.Path(__file__).resolve().parent.parent.parent
   sys.path.insert(0, str(root))
-  from events import LocationEvent
-from events import LocationTrackEvent
+  import polyline
 
 
 ########## Driver interface ##########
@@ -35,36 +36,59 @@ METADATA = {
 }
 
 
-class MyTracksTrack(LocationTrackEvent):
-  def __init__(self, stream, format, start, end, nw_lat, nw_lon, se_lat, se_lon, track, title,
-               description, people, distance, raw=None):
-    super().__init__(stream, format, start, nw_lat, nw_lon, se_lat, se_lon, track, end=end, raw=raw)
-    self.title = title
-    self.description = description
-    self.people = people
-    self.distance = distance
-
-
-class MyTracksMarker(LocationEvent):
-  def __init__(self, stream, format, start, nw_lat, nw_lon, accuracy, name, description, raw=None):
-    super().__init__(stream, format, start, nw_lat, nw_lon, accuracy, raw=raw)
-    self.name = name
-    self.description = description
+def get_events(input_paths, since=None):
+  # Implement the driver interface.
+  # This yields Python dicts, not JSON strings, so the caller has to do the json.dumps().
+  # Each file becomes a "track" event (see `events.LocationTrackEvent`), with the points in the
+  # compact `polyline` encoding, plus a "marker" event for each of its markers.
+  # `since` is the high-water marks from a previous run: a dict mapping each file to the end of its
+  # track and its size. Files which haven't changed size are skipped without parsing them.
+  sizes = {}
+  def is_unchanged(kml_path, size):
+    sizes[kml_path] = size
+    return since is not None and kml_path in since and since[kml_path].get('size') == size
+  for kml_path, kml_file in extract_inputs(input_paths, skip=is_unchanged):
+    meta, track, markers = parse(kml_file)
+    track = kml.filter_track(track)
+    format = meta['dialect'] or 'mytracks'
+    if meta['start'] is None:
+      logging.warning(f'Warning: No time found for track in {kml_path}. Skipping..')
+    else:
+      yield {
+        'stream':'track', 'format':format, 'start':meta['start'], 'end':meta['end'],
+        'title':meta['title'], 'description':meta['description'],
+        'distance':kml.get_total_distance(track), 'track':polyline.encode_track(track),
+      }
+    for marker in markers:
+      yield {
+        'stream':'marker', 'format':format, 'start':marker['timestamp'], 'lat':marker['lat'],
+        'lon':marker['long'], 'name':marker['name'], 'description':marker['description'],
+      }
+    # Record that this file's been read, for the next incremental run. A mark needs a time, so a
+    # file without any is just read again next time.
+    last = meta['start'] if meta['end'] is None else meta['end']
+    if last is not None:
+      yield {'stream':'mark', 'format':'mytracks', 'source':kml_path, 'last':last,
+             'size':sizes.get(kml_path)}
 
 
 ########## Parsing ##########
 
 
-def parse(kml_root, parse_track=True):
+def parse(kml_file, parse_track=True):
+  """Parse a My Tracks or Geo Tracker file. Give an open file from `kml.open_kml()`.
+  The file is parsed incrementally, so only the track itself is held in memory, not the XML."""
   meta = {'dialect':None, 'title':None, 'description':None, 'start':None, 'end':None,
           'distance':None, 'start_lat':None, 'start_lon':None, 'end_lat':None, 'end_lon':None}
   markers = []
   track = []
-  # <kml>
-  if len(kml_root) == 0:
-    return None
-  # <Document>
-  for element in kml_root[0]:
+  # <kml><Document>
+  for item_type, item in kml.iterparse_kml(kml_file, parse_points=parse_track):
+    # The points of the <gx:MultiTrack> come before the <Placemark> containing it is finished.
+    if item_type == 'point':
+      track.append(item)
+      continue
+    element = item
     if len(element) == 0:
       continue
     # <atom:author>
@@ -98,12 +122,11 @@ def parse(kml_root, parse_track=True):
               meta['dialect'] == 'geotracker'):
             for sub2element in subelement:
               if sub2element.tag == '{http://www.opengis.net/kml/2.2}begin':
-                meta['start'] = dateutil.parser.parse(sub2element.text).timestamp()
+                meta['start'] = kml.parse_timestamp(sub2element.text)
               elif sub2element.tag == '{http://www.opengis.net/kml/2.2}end':
-                meta['end'] = dateutil.parser.parse(sub2element.text).timestamp()
-          # <gx:MultiTrack>
+                meta['end'] = kml.parse_timestamp(sub2element.text)
+          # <gx:MultiTrack> (its points have already been parsed into `track`)
           elif subelement.tag == '{http://www.google.com/kml/ext/2.2}MultiTrack' and parse_track:
-            track = kml.parse_track(subelement)
             #TODO: Measure distance elsewhere?
             meta['distance'] = kml.get_total_distance(track)
       # Get start/end timestamps for My Tracks files.
@@ -155,7 +178,7 @@ def parse_mytracks_timestamp(placemark_element):
   for subelement in placemark_element:
     if (subelement.tag == '{http://www.opengis.net/kml/2.2}TimeStamp' and len(subelement) > 0
         and subelement[0].tag == '{http://www.opengis.net/kml/2.2}when'):
-      timestamp = dateutil.parser.parse(subelement[0].text).timestamp()
+      timestamp = kml.parse_timestamp(subelement[0].text)
     elif subelement.tag == '{http://www.opengis.net/kml/2.2}styleUrl':
       placemark_type = subelement.text[1:]
   return timestamp, placemark_type
@@ -195,7 +218,7 @@ def parse_marker(marker_element):
       marker['lat'], marker['long'], dummy = kml.parse_coord(element[0].text, 'kml')
     elif (element.tag == '{http://www.opengis.net/kml/2.2}TimeStamp' and len(element) > 0 and
         element[0].tag == '{http://www.opengis.net/kml/2.2}when'):
-      marker['timestamp'] = dateutil.parser.parse(element[0].text).timestamp()
+      marker['timestamp'] = kml.parse_timestamp(element[0].text)
   if marker['description'] is not None:
     marker['meta'] = parse_meta_markup(marker['description'])
   if any([v is None for v in marker.values()]):
@@ -247,6 +270,13 @@ def make_argparser():
   parser = argparse.ArgumentParser(description='Parse a .kml or .kmz track.')
   parser.add_argument('inputs', metavar='kml/kmz', nargs='+',
     help='The inputs. Can be kml or kmz files, or directories containing them.')
+  parser.add_argument('-j', '--json', action='store_true',
+    help='Print the tracks and markers in the Driver API JSON format. The filtering options don\'t '
+         'apply.')
+  parser.add_argument('--since', type=argparse.FileType('r'),
+    help='With --json, only output data from files which have changed since a previous run, as '
+         'recorded in this JSON file of high-water marks. It should map file paths to mark objects, '
+         'like the "mark" objects in the --json output.')
   output = parser.add_argument_group('Output')
   output.add_argument('-k', '--key',
     help='Print the value of this key from the metadata. Special keys: "markers" - print the name '
@@ -276,6 +306,11 @@ def make_argparser():
   filters.add_argument('-d', '--distance', type=float, default=2,
     help='When using --location, only match tracks that went within this many miles of the '
          'location. Default: %(default)s mi')
+  filters.add_argument('-I', '--index',
+    help='Keep an index of the tracks in this file, to answer --location queries without reading '
+         'every track. It also caches each track\'s metadata and markers, so queries and summaries '
+         'don\'t have to read the files at all. It\'s created if it doesn\'t exist, and any new or '
+         'changed input files are added to it on each run.')
   filters.add_argument('-s', '--start', type=int,
     help='Only match tracks that start after this timestamp.')
   filters.add_argument('-e', '--end', type=int,
@@ -301,6 +336,14 @@ def main(argv):
   parser = make_argparser()
   args = parser.parse_args(argv[1:])
   logging.basicConfig(stream=args.log, level=args.volume, format='%(message)s')
+  if args.json:
+    if args.since:
+      since = json.load(args.since)
+    else:
+      since = None
+    for event in get_events(args.inputs, since=since):
+      print(json.dumps(event))
+    return
   summarize = not (args.key or args.key_len or args.marker_key or args.marker_keys or args.marker_meta)
   if (summarize or args.key in ('distance', 'start', 'end', 'duration') or
       args.location or args.start or args.end):
@@ -317,34 +360,46 @@ def main(argv):
       marker_value = True
     elif marker_value.lower() == 'false':
       marker_value = False
+    else:
+      marker_value = marker_value.lower()
+  if args.location:
+    distance = args.distance/MI_PER_KM
+  # Use the index to find which tracks pass near the --location, so only those need to be read.
+  index = near_tracks = meta_tracks = key_tracks = None
+  if args.index:
+    index = trackindex.TrackIndex(args.index)
+    source_paths = find_sources(args.inputs)
+    index.update(source_paths, read_source)
+    if args.location:
+      near_tracks = index.find_near(args.location, distance, source_paths)
+    # Look up the marker metadata filters in the index too.
+    if args.marker_filt_meta:
+      meta_tracks = set(index.find_marker_meta(marker_key, marker_value, source_paths))
+    if args.marker_filt_key:
+      key_tracks = set(index.find_marker_meta(args.marker_filt_key, source_paths=source_paths))
+  index_tracks = intersect_tracks(near_tracks, meta_tracks, key_tracks)
+  # If --dump, format and print the xml.
   if args.dump:
-    out_format = 'str'
-  else:
-    out_format = 'xml'
-  # Process each input file.
-  for i, (kml_path, kml_data) in enumerate(extract_inputs(args.inputs, out_format)):
+    for kml_path, kml_str in extract_inputs(args.inputs, 'str', near_tracks):
+      if args.filename and os.path.basename(kml_path) != args.filename:
+        continue
+      args.outfile.write(format_xml(kml_str))
+    return
+  # Process each track.
+  for kml_path, meta, markers, track, num_points in read_inputs(args.inputs, index_tracks,
+                                                                 parse_track, index):
     filename = os.path.basename(kml_path)
     if args.filename and filename != args.filename:
       continue
-    # If --dump, format and print the xml and continue.
-    if args.dump:
-      kml_str = kml_data
-      args.outfile.write(format_xml(kml_str))
-      continue
-    else:
-      kml_root = kml_data
-    # Parse the kml.
-    meta, track, markers = parse(kml_root, parse_track=parse_track)
-    track = kml.filter_track(track)
     # Apply filters.
-    if args.marker_filt_meta:
+    if args.marker_filt_meta and meta_tracks is None:
       if not markers_match_metavalue(markers, marker_key, marker_value):
         continue
-    if args.marker_filt_key:
+    if args.marker_filt_key and key_tracks is None:
       if not markers_match_metakey(markers, args.marker_filt_key):
         continue
-    if args.location:
-      if not kml.is_track_near(track, args.location, args.distance):
+    if args.location and near_tracks is None:
+      if not kml.is_track_near(track, args.location, distance):
         continue
     if args.start and meta['start'] and meta['start'] < args.start:
       continue
@@ -369,9 +424,21 @@ def main(argv):
         print(output, file=args.outfile)
     # If no specific values were requested, print a summary.
     if summarize:
-      print(format_summary(meta, markers, track, args.ref_points), file=args.outfile)
+      print(format_summary(meta, markers, num_points, args.ref_points), file=args.outfile)
     if summarize and not single_input:
       print(file=args.outfile)
+  if index is not None:
+    index.close()
+
+
+def intersect_tracks(*track_sets):
+  """Combine the sets of (source, name) tracks found by index lookups. A set of None means that
+  lookup wasn't done. Returns None if none of them were."""
+  result = None
+  for tracks in track_sets:
+    if tracks is not None:
+      result = tracks if result is None else result & tracks
+  return result
 
 
 def path_is_kmz(path):
@@ -402,43 +469,87 @@ def format_xml(input_str):
   return '\n'.join(output)
 
 
-def extract_inputs(input_paths, out_format='xml'):
-  """Take a list of paths containing kml data and return parsed kml objects."""
-  file_paths = []
-  # Expand directories into the files they contain.
-  for input_path in input_paths:
-    if os.path.isdir(input_path):
-      file_paths.extend(find_kmls(input_path))
-    else:
-      file_paths.append(input_path)
+def extract_inputs(input_paths, out_format='file', tracks=None, skip=None):
+  """Take a list of paths containing kml data and yield the path and contents of each kml file.
+  With `out_format` 'file', the contents are an open file for `parse()` (only valid until the next
+  one is yielded). With 'str', it's the kml as a string.
+  If `tracks` is given, only read those tracks. It's a set of (source, name) pairs, where the source
+  is the input file and the name is the path yielded by this.
+  If `skip` is given, it's called with the path and size of each file, and the file is skipped if it
+  returns True."""
   # Read each file.
-  for file_path in file_paths:
+  for file_path in find_sources(input_paths):
     ext = os.path.splitext(file_path)[1]
     if (ext in ('.tgz', '.tbz', '.txz') or file_path.endswith('.tar.gz') or
         file_path.endswith('.tar.bz') or file_path.endswith('.tar.xz')):
       with tarfile.open(file_path) as tarball:
         for member in sorted(tarball.getnames()):
+          if tracks is not None and (file_path, member) not in tracks:
+            continue
+          if skip is not None and skip(member, tarball.getmember(member).size):
+            continue
           if member.endswith('.kml') or member.endswith('.kmz'):
             file = tarball.extractfile(member)
-            contents = str(file.read(), 'utf8')
-            if out_format == 'xml':
-              yield member, kml.parse_kml_str(contents)
+            if out_format == 'file':
+              with kml.open_kml(file, kmz=member.endswith('.kmz')) as kml_file:
+                yield member, kml_file
             elif out_format == 'str':
-              yield member, contents
+              yield member, str(file.read(), 'utf8')
+    elif tracks is not None and (file_path, file_path) not in tracks:
+      continue
+    elif skip is not None and skip(file_path, os.path.getsize(file_path)):
+      continue
+    elif out_format == 'file':
+      with kml.open_kml(file_path) as kml_file:
+        yield file_path, kml_file
     elif ext in ('.kmz', '.zip'):
-      if out_format == 'xml':
-        yield file_path, kml.read_kmz(file_path)
-      elif out_format == 'str':
+      if out_format == 'str':
         kml_bytes = kml.extract_from_zip(file_path, 'doc.kml')
         yield file_path, str(kml_bytes, 'utf8')
     else:
-      if out_format == 'xml':
-        yield file_path, kml.read_kml(file_path)
-      elif out_format == 'str':
+      if out_format == 'str':
         with open(file_path, 'r') as file:
           yield file_path, file.read()
 
 
+def read_inputs(input_paths, tracks=None, parse_track=True, index=None):
+  """Parse each track in the inputs, yielding its path, metadata, markers, points, and number of
+  points. `tracks` is as in `extract_inputs()`.
+  If a `trackindex.TrackIndex` is given, the summaries it has cached are used instead of reading the
+  files. Then the points are None (they're already filtered and counted)."""
+  for source_path in find_sources(input_paths):
+    summaries = None
+    if index is not None:
+      summaries = index.get_summaries(source_path)
+    if summaries is None:
+      for kml_path, kml_file in extract_inputs([source_path], tracks=tracks):
+        meta, track, markers = parse(kml_file, parse_track=parse_track)
+        track = kml.filter_track(track)
+        yield kml_path, meta, markers, track, len(track)
+    else:
+      for summary in summaries:
+        if tracks is None or (source_path, summary['name']) in tracks:
+          yield summary['name'], summary['meta'], summary['markers'], None, summary['points']
+
+
+def find_sources(input_paths):
+  """Expand directories in `input_paths` into the kml and kmz files they contain."""
+  file_paths = []
+  for input_path in input_paths:
+    if os.path.isdir(input_path):
+      file_paths.extend(find_kmls(input_path))
+    else:
+      file_paths.append(input_path)
+  return file_paths
+
+
+def read_source(file_path):
+  """Parse all the tracks in one input file, for `trackindex`."""
+  for kml_path, kml_file in extract_inputs([file_path]):
+    meta, track, markers = parse(kml_file)
+    yield kml_path, meta, kml.filter_track(track), markers
+
+
 def find_kmls(root_dir):
   kml_paths = []
   for dirpath, dirnames, filenames in os.walk(root_dir):
@@ -543,7 +654,7 @@ def format_marker_keys(markers):
   return '\n'.join(keys)
 
 
-def format_summary(meta, markers, track, ref_points=None):
+def format_summary(meta, markers, num_points, ref_points=None):
   if meta['title'] and not re.search(r'^\d{4}-\d{2}-\d{2}[ _]', meta['title']) and meta['start']:
     date = datetime.datetime.fromtimestamp(meta['start']).strftime('%Y-%m-%d')
     dateline = '\ndate:\t{}'.format(date)
@@ -557,10 +668,6 @@ def format_summary(meta, markers, track, ref_points=None):
     distance = None
   else:
     distance = '{:0.2f}mi'.format(meta['distance']*MI_PER_KM)
-  if track:
-    track_len = len(track)
-  else:
-    track_len = 0
   reflines = ''
   if ref_points:
     start_dist, start_name, start_area = find_closest_ref_point(meta['start_lat'], meta['start_lon'],
@@ -586,7 +693,7 @@ duration:\t{}
 distance:\t{} ({} points){}
 markers:\t{}
 description:
-{description}""".format(dateline, duration, distance, track_len, reflines, len(markers), **meta)
+{description}""".format(dateline, duration, distance, num_points, reflines, len(markers), **meta)
 
 
 def fail(message):
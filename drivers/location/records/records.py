@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""Parser for the Records.json location history in Google Takeout."""
+import argparse
+import contextlib
+import datetime
+import gzip
+import io
+import json
+import logging
+import os
+import pathlib
+import re
+import sys
+import tarfile
+import zipfile
+try:
+  import kml
+except ImportError:
+  sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+  import kml
+assert sys.version_info.major >= 3, 'Python 3 required'
+
+RECORDS_NAME = 'Records.json'
+# Coordinates are integers in units of 1/E7 degrees.
+E7 = 10000000
+# Read the file this many characters at a time.
+CHUNK_SIZE = 1024*1024
+WHITESPACE_REGEX = re.compile(r'[\s,]*')
+
+DESCRIPTION = """Read the location history from a Google Takeout Records.json file. The file is
+read incrementally, so memory use stays the same no matter how big it is."""
+
+
+def make_argparser():
+  parser = argparse.ArgumentParser(description=DESCRIPTION)
+  parser.add_argument('records',
+    help='The Records.json file. Can be raw or gzipped, or a zip/tarball exported by Google.')
+  parser.add_argument('-j', '--json', dest='format', default='human', const='json',
+    action='store_const',
+    help='Print the output in the Driver API JSON format.')
+  parser.add_argument('-J', '--json-array', action='store_true',
+    help='When using --json, add commas and brackets to make the entire output a JSON array.')
+  parser.add_argument('--since', type=argparse.FileType('r'),
+    help='Only output data that\'s newer than what\'s recorded in this JSON file of high-water marks '
+         'from a previous run, like the "mark" objects in the --json output.')
+  parser.add_argument('-i', '--interval', type=float,
+    help='Decimate the points: skip any that are less than this many seconds after the last one '
+         'output.')
+  parser.add_argument('-m', '--min-distance', type=float,
+    help='Decimate the points: skip any that are less than this many meters from the last one '
+         'output.')
+  parser.add_argument('-L', '--log', type=argparse.FileType('w'), default=sys.stderr,
+    help='Print log messages to this file instead of to stderr. Warning: Will overwrite the file.')
+  volume = parser.add_mutually_exclusive_group()
+  volume.add_argument('-q', '--quiet', dest='volume', action='store_const', const=logging.CRITICAL,
+    default=logging.WARNING)
+  volume.add_argument('-v', '--verbose', dest='volume', action='store_const', const=logging.INFO)
+  volume.add_argument('-D', '--debug', dest='volume', action='store_const', const=logging.DEBUG)
+  return parser
+
+
+def main(argv):
+
+  parser = make_argparser()
+  args = parser.parse_args(argv[1:])
+
+  logging.basicConfig(stream=args.log, level=args.volume, format='%(message)s')
+
+  if not os.path.isfile(args.records):
+    fail(f'Error: File not found: {args.records!r}')
+
+  if args.since:
+    since = json.load(args.since)
+  else:
+    since = None
+
+  with open_records(args.records) as records_file:
+    points = read_points(iter_json_array(records_file, 'locations'))
+    points = decimate(points, args.interval, args.min_distance)
+    if args.format == 'json':
+      if args.json_array:
+        print('[')
+      first = True
+      for obj in get_events(points, since=since):
+        if first:
+          first = False
+        elif args.json_array:
+          print(',', end='')
+        print(json.dumps(obj))
+      if args.json_array:
+        print(']')
+    else:
+      for timestamp, lat_e7, lon_e7, accuracy in points:
+        time_str = datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+        print(time_str, lat_e7/E7, lon_e7/E7, accuracy, sep='\t')
+
+
+def get_events(points, since=None):
+  """Implement the driver interface. Yields dicts ready for `json.dumps()`.
+  `since` is the high-water marks from a previous run. The only source is the Records.json file, so
+  points no later than its "last" timestamp are skipped."""
+  last = get_mark(since)
+  newest = None
+  for timestamp, lat_e7, lon_e7, accuracy in points:
+    if last is not None and timestamp <= last:
+      continue
+    event = {
+      'stream':'location', 'format':'records', 'start':timestamp, 'lat_e7':lat_e7, 'lon_e7':lon_e7
+    }
+    if accuracy is not None:
+      event['accuracy'] = accuracy
+    yield event
+    if newest is None or timestamp > newest:
+      newest = timestamp
+  if newest is not None:
+    yield {'stream':'mark', 'format':'records', 'source':RECORDS_NAME, 'last':newest}
+
+
+def get_mark(since):
+  if since is None or RECORDS_NAME not in since:
+    return None
+  return since[RECORDS_NAME]['last']
+
+
+@contextlib.contextmanager
+def open_records(path):
+  """Open the Records.json as text, whether it's a plain file, gzipped, or in a zip or tarball.
+  Nothing is extracted to disk or read into memory all at once."""
+  if zipfile.is_zipfile(path):
+    with zipfile.ZipFile(path) as zip_file:
+      member = find_member(zip_file.namelist())
+      with zip_file.open(member) as member_file:
+        yield io.TextIOWrapper(member_file, encoding='utf8')
+  elif tarfile.is_tarfile(path):
+    with tarfile.open(path) as tarball:
+      member = find_member(tarball.getnames())
+      yield io.TextIOWrapper(tarball.extractfile(member), encoding='utf8')
+  elif path.endswith('.gz'):
+    with gzip.open(path, 'rt', encoding='utf8') as records_file:
+      yield records_file
+  else:
+    with open(path, encoding='utf8') as records_file:
+      yield records_file
+
+
+def find_member(names):
+  for name in names:
+    if os.path.basename(name) == RECORDS_NAME:
+      return name
+  fail(f'Error: No {RECORDS_NAME} found in archive.')
+
+
+def iter_json_array(text_file, key, chunk_size=CHUNK_SIZE):
+  """Yield each element of the array under `key` in a JSON file, reading the file a chunk at a time.
+  This finds the first occurrence of `key` followed by an array, so it's only reliable for a key of
+  the top-level object. The elements must be objects or arrays (not bare numbers, which could be cut
+  off at the end of a chunk)."""
+  decoder = json.JSONDecoder()
+  start_regex = re.compile(r'"'+re.escape(key)+r'"\s*:\s*\[')
+  # Find the start of the array.
+  buffer = ''
+  while True:
+    match = start_regex.search(buffer)
+    if match:
+      break
+    chunk = text_file.read(chunk_size)
+    if not chunk:
+      logging.warning(f'Warning: No {key!r} array found.')
+      return
+    # Keep the end of the last chunk, in case it has the start of the key.
+    buffer = buffer[-1000:] + chunk
+  pos = match.end()
+  while True:
+    # Skip to the start of the next element.
+    pos = WHITESPACE_REGEX.match(buffer, pos).end()
+    if pos >= len(buffer):
+      buffer = text_file.read(chunk_size)
+      pos = 0
+      if not buffer:
+        raise ValueError(f'File ended in the middle of the {key!r} array.')
+      continue
+    if buffer[pos] == ']':
+      return
+    try:
+      element, pos = decoder.raw_decode(buffer, pos)
+    except json.JSONDecodeError:
+      # Probably just cut off by the end of the chunk. Read more and try again.
+      chunk = text_file.read(chunk_size)
+      if not chunk:
+        raise
+      buffer = buffer[pos:] + chunk
+      pos = 0
+      continue
+    yield element
+
+
+def read_points(records):
+  """Convert the raw location records into `(timestamp, lat_e7, lon_e7, accuracy)` tuples.
+  Records without a time or coordinates (or which aren't objects at all) are skipped."""
+  skipped = 0
+  for record in records:
+    try:
+      lat_e7 = record['latitudeE7']
+      lon_e7 = record['longitudeE7']
+      timestamp = get_timestamp(record)
+    except (KeyError, TypeError, ValueError):
+      skipped += 1
+      continue
+    yield timestamp, lat_e7, lon_e7, record.get('accuracy')
+  if skipped:
+    logging.warning(f'Warning: Skipped {skipped} records missing a time or coordinates.')
+
+
+def get_timestamp(record):
+  # Newer exports have an ISO 8601 "timestamp". Older ones have "timestampMs", a string.
+  if 'timestamp' in record:
+    return kml.parse_timestamp(record['timestamp'])
+  else:
+    return int(record['timestampMs'])/1000
+
+
+def decimate(points, interval=None, min_distance=None):
+  """Thin out the points, skipping any within `interval` seconds or `min_distance` meters of the
+  last point kept."""
+  if not interval and not min_distance:
+    yield from points
+    return
+  last_timestamp = last_lat = last_lon = None
+  for point in points:
+    timestamp, lat_e7, lon_e7, accuracy = point
+    lat = lat_e7/E7
+    lon = lon_e7/E7
+    if last_timestamp is not None:
+      if interval and timestamp - last_timestamp < interval:
+        continue
+      if min_distance and kml.get_lat_long_distance(lat, lon, last_lat, last_lon)*1000 < min_distance:
+        continue
+    last_timestamp = timestamp
+    last_lat = lat
+    last_lon = lon
+    yield point
+
+
+def fail(message):
+  logging.critical(message)
+  if __name__ == '__main__':
+    sys.exit(1)
+  else:
+    raise Exception('Unrecoverable error')
+
+
+if __name__ == '__main__':
+  try:
+    sys.exit(main(sys.argv))
+  except BrokenPipeError:
+    pass
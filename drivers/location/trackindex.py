@@ -0,0 +1,379 @@
+"""A persistent index of a collection of tracks, so queries don't have to parse every KML file.
+It's an SQLite file with a row per source file (with its modification time and size, so changed files
+get re-indexed), a row per track with its points, a grid of the cells each track passes through,
+simplified versions of each track at a few resolutions (see `kml.get_track_pyramid()`), and a summary
+of each track (its metadata, markers, point count, and bounding box), so queries which don't need the
+points don't have to read the files at all. The !key:value metadata of the markers is also indexed
+by key and value, to find the tracks with a given annotation.
+"""
+import array
+import json
+import logging
+import math
+import os
+import sqlite3
+import kml
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+# The size of the grid cells, in degrees. 0.01 is about 1.1 km of latitude.
+CELL_SIZE = 0.01
+# Points are stored as integers in units of 1/POINT_SCALE degrees (about 1.1 meters).
+POINT_SCALE = 100000
+KM_PER_DEGREE = 2*math.pi*kml.EARTH_RADIUS/360
+# Increment this when the schema changes in a way that needs every file re-indexed.
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+  path TEXT PRIMARY KEY,
+  mtime REAL NOT NULL,
+  size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tracks (
+  id INTEGER PRIMARY KEY,
+  source TEXT NOT NULL,
+  name TEXT NOT NULL,
+  start REAL,
+  end REAL,
+  points BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tracks_source ON tracks (source);
+CREATE TABLE IF NOT EXISTS cells (
+  lat_cell INTEGER NOT NULL,
+  lon_cell INTEGER NOT NULL,
+  track INTEGER NOT NULL,
+  PRIMARY KEY (lat_cell, lon_cell, track)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS levels (
+  track INTEGER NOT NULL,
+  max_error REAL NOT NULL,
+  points BLOB NOT NULL,
+  PRIMARY KEY (track, max_error)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS summaries (
+  track INTEGER PRIMARY KEY,
+  meta TEXT NOT NULL,
+  markers TEXT NOT NULL,
+  num_points INTEGER NOT NULL,
+  min_lat REAL,
+  max_lat REAL,
+  min_lon REAL,
+  max_lon REAL
+);
+CREATE TABLE IF NOT EXISTS marker_meta (
+  key TEXT NOT NULL,
+  value,
+  track INTEGER NOT NULL,
+  timestamp REAL
+);
+CREATE INDEX IF NOT EXISTS marker_meta_key_value ON marker_meta (key, value);
+CREATE INDEX IF NOT EXISTS marker_meta_track ON marker_meta (track);
+"""
+# The tables holding the indexed data, in the order to clear them.
+TABLES = ('marker_meta', 'summaries', 'levels', 'cells', 'tracks', 'sources')
+# `find_near()` only rules out a track using a simplified level if it's this much farther away than
+# the level's error, to allow for the flat projection in `kml.get_line_distance()`.
+SLACK = 1.01
+
+
+class TrackIndex:
+
+  def __init__(self, path):
+    self.path = path
+    self.db = sqlite3.connect(path)
+    self.db.executescript(SCHEMA)
+    version = self.db.execute('PRAGMA user_version').fetchone()[0]
+    if version != SCHEMA_VERSION:
+      # Clear out an index from an older version, so everything gets re-indexed by `update()`.
+      with self.db:
+        for table in TABLES:
+          self.db.execute(f'DELETE FROM {table}')
+        self.db.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+  def close(self):
+    self.db.close()
+
+  def update(self, source_paths, read_source):
+    """Index any of the `source_paths` which are new or have changed since they were indexed, and
+    drop any indexed files which no longer exist.
+    `read_source` is called with the path of each file which needs indexing. It should yield a
+    `(name, meta, track, markers)` tuple for each track in the file, like `mytracks.parse()` (plus
+    the name)."""
+    indexed = {path: (mtime, size) for path, mtime, size in self.db.execute('SELECT * FROM sources')}
+    num_updated = 0
+    for path in source_paths:
+      stat = os.stat(path)
+      if indexed.get(path) == (stat.st_mtime, stat.st_size):
+        continue
+      with self.db:
+        self.remove_source(path)
+        for name, meta, track, markers in read_source(path):
+          self.add_track(path, name, meta, track, markers)
+        self.db.execute(
+          'INSERT INTO sources (path, mtime, size) VALUES (?, ?, ?)',
+          (path, stat.st_mtime, stat.st_size)
+        )
+      num_updated += 1
+    num_removed = 0
+    with self.db:
+      for path in indexed:
+        if not os.path.exists(path):
+          self.remove_source(path)
+          num_removed += 1
+    if num_updated or num_removed:
+      logging.info(f'Indexed {num_updated} new or changed files and removed {num_removed} from {self.path}.')
+
+  def remove_source(self, path):
+    self.db.execute('DELETE FROM cells WHERE track IN (SELECT id FROM tracks WHERE source = ?)', (path,))
+    self.db.execute('DELETE FROM levels WHERE track IN (SELECT id FROM tracks WHERE source = ?)', (path,))
+    self.db.execute('DELETE FROM summaries WHERE track IN (SELECT id FROM tracks WHERE source = ?)', (path,))
+    self.db.execute('DELETE FROM marker_meta WHERE track IN (SELECT id FROM tracks WHERE source = ?)', (path,))
+    self.db.execute('DELETE FROM tracks WHERE source = ?', (path,))
+    self.db.execute('DELETE FROM sources WHERE path = ?', (path,))
+
+  def add_track(self, source, name, meta, track, markers=()):
+    """Add a track, which should already be filtered with `kml.filter_track()`."""
+    points = encode_points(track)
+    cursor = self.db.execute(
+      'INSERT INTO tracks (source, name, start, end, points) VALUES (?, ?, ?, ?, ?)',
+      (source, name, meta['start'], meta['end'], points.tobytes())
+    )
+    track_id = cursor.lastrowid
+    self.db.executemany(
+      'INSERT INTO cells (lat_cell, lon_cell, track) VALUES (?, ?, ?)',
+      [(lat_cell, lon_cell, track_id) for lat_cell, lon_cell in get_cells(points)]
+    )
+    self.db.executemany(
+      'INSERT INTO levels (track, max_error, points) VALUES (?, ?, ?)',
+      [(track_id, max_error, encode_points(level).tobytes())
+       for max_error, level in kml.get_track_pyramid(track)]
+    )
+    self.db.execute(
+      'INSERT INTO summaries (track, meta, markers, num_points, min_lat, max_lat, min_lon, max_lon) '
+      'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+      (track_id, json.dumps(meta), json.dumps(list(markers)), len(track), *get_bounds(points))
+    )
+    self.db.executemany(
+      'INSERT INTO marker_meta (key, value, track, timestamp) VALUES (?, ?, ?, ?)',
+      [(key, value, track_id, marker['timestamp'])
+       for marker in markers for key, value in get_meta_values(marker['meta'])]
+    )
+    return track_id
+
+  def find_marker_meta(self, key, value=None, source_paths=None):
+    """Find the tracks with markers whose metadata includes `key`. If `value` is given, the key has
+    to have that value (or, for a list, include it). String values are compared case-insensitively.
+    Give `source_paths` to only include tracks from those files. Returns a dict mapping each track,
+    as a (source, name) pair, to the timestamps of its matching markers."""
+    if value is None:
+      cursor = self.db.execute(
+        'SELECT tracks.source, tracks.name, marker_meta.timestamp FROM marker_meta '
+        'JOIN tracks ON tracks.id = marker_meta.track WHERE marker_meta.key = ?', (key,)
+      )
+    else:
+      cursor = self.db.execute(
+        'SELECT tracks.source, tracks.name, marker_meta.timestamp FROM marker_meta '
+        'JOIN tracks ON tracks.id = marker_meta.track '
+        'WHERE marker_meta.key = ? AND marker_meta.value = ?', (key, normalize_meta_value(value))
+      )
+    if source_paths is not None:
+      source_paths = set(source_paths)
+    matches = {}
+    for source, name, timestamp in cursor:
+      if source_paths is not None and source not in source_paths:
+        continue
+      timestamps = matches.setdefault((source, name), [])
+      if timestamp not in timestamps:
+        timestamps.append(timestamp)
+    return matches
+
+  def get_summaries(self, source):
+    """Get the cached summaries of the tracks in the file `source`, in the order they were read.
+    Each is a dict with the 'name', 'meta', and 'markers' of the track (as returned by `update()`'s
+    `read_source`), its number of 'points', and its 'bounds' (min_lat, max_lat, min_lon, max_lon).
+    Returns None if the file isn't indexed, or was indexed before summaries were added."""
+    if self.db.execute('SELECT 1 FROM sources WHERE path = ?', (source,)).fetchone() is None:
+      return None
+    rows = self.db.execute(
+      'SELECT tracks.name, summaries.meta, summaries.markers, summaries.num_points, '
+      'summaries.min_lat, summaries.max_lat, summaries.min_lon, summaries.max_lon FROM tracks '
+      'LEFT JOIN summaries ON summaries.track = tracks.id WHERE tracks.source = ? ORDER BY tracks.id',
+      (source,)
+    ).fetchall()
+    summaries = []
+    for name, meta, markers, num_points, *bounds in rows:
+      if meta is None:
+        return None
+      summaries.append({
+        'name':name, 'meta':json.loads(meta), 'markers':json.loads(markers), 'points':num_points,
+        'bounds':tuple(bounds),
+      })
+    return summaries
+
+  def find_near(self, location, thres, source_paths=None):
+    """Find the tracks which pass within `thres` kilometers of `location` (a latitude/longitude
+    pair). Give `source_paths` to only include tracks from those files. Returns a set of the tracks,
+    as (source, name) pairs. Names are only unique within a source."""
+    lat, lon = location
+    lat_delta = thres/KM_PER_DEGREE
+    # Near the poles, any longitude could be in range.
+    cos_lat = math.cos(math.radians(min(abs(lat)+lat_delta, 90)))
+    lon_delta = 180 if cos_lat < 1e-6 else min(lat_delta/cos_lat, 180)
+    lon_ranges = get_lon_ranges(lon, lon_delta)
+    lon_where = ' OR '.join(['lon_cell BETWEEN ? AND ?']*len(lon_ranges))
+    params = [get_cell(lat-lat_delta), get_cell(lat+lat_delta)]
+    for lon_min, lon_max in lon_ranges:
+      params.extend((get_cell(lon_min), get_cell(lon_max)))
+    cursor = self.db.execute(
+      'SELECT DISTINCT tracks.id, tracks.source, tracks.name FROM cells '
+      'JOIN tracks ON tracks.id = cells.track '
+      f'WHERE lat_cell BETWEEN ? AND ? AND ({lon_where})',
+      params
+    )
+    if source_paths is not None:
+      source_paths = set(source_paths)
+    tracks = set()
+    for track_id, source, name in cursor:
+      if source_paths is not None and source not in source_paths:
+        continue
+      if (source, name) in tracks:
+        continue
+      if self.track_is_near(track_id, location, thres):
+        tracks.add((source, name))
+    return tracks
+
+  def track_is_near(self, track_id, location, thres):
+    """Check the simplified levels of the track, coarsest first, before resorting to all its
+    points. Every point in a level is a real point, so if any is near, the track is. And if the
+    level's line is farther than `thres` plus the level's error, no real point can be near.
+    The full points are only read if none of the levels can decide."""
+    levels = self.db.execute(
+      'SELECT max_error, points FROM levels WHERE track = ? ORDER BY max_error DESC', (track_id,)
+    )
+    for max_error, level_bytes in levels:
+      points = decode_points(level_bytes)
+      if points_are_near(points, location, thres):
+        return True
+      if get_line_distance(points, location) > (thres+max_error)*SLACK:
+        return False
+    points_bytes = self.db.execute('SELECT points FROM tracks WHERE id = ?', (track_id,)).fetchone()[0]
+    return points_are_near(decode_points(points_bytes), location, thres)
+
+  def get_track(self, source, name, max_error=0):
+    """Get the points of the track `name` in the file `source`, as (latitude, longitude) pairs, from
+    the coarsest level that's within `max_error` kilometers of the original. Returns None if there's
+    no such track."""
+    row = self.db.execute(
+      'SELECT levels.points FROM levels JOIN tracks ON tracks.id = levels.track '
+      'WHERE tracks.source = ? AND tracks.name = ? AND levels.max_error <= ? '
+      'ORDER BY levels.max_error DESC LIMIT 1',
+      (source, name, max_error)
+    ).fetchone()
+    if row is None:
+      row = self.db.execute(
+        'SELECT points FROM tracks WHERE source = ? AND name = ?', (source, name)
+      ).fetchone()
+    if row is None:
+      return None
+    points = decode_points(row[0])
+    return [(points[i]/POINT_SCALE, points[i+1]/POINT_SCALE) for i in range(0, len(points), 2)]
+
+
+def get_cell(degrees):
+  return math.floor(degrees/CELL_SIZE)
+
+
+def get_lon_ranges(lon, lon_delta):
+  """Get the ranges of longitudes within `lon_delta` degrees of `lon`, as (min, max) tuples. If the
+  range crosses the antimeridian, it's split in two."""
+  lon_min = lon - lon_delta
+  lon_max = lon + lon_delta
+  if lon_delta >= 180:
+    return [(-180, 180)]
+  elif lon_min < -180:
+    return [(-180, lon_max), (lon_min+360, 180)]
+  elif lon_max > 180:
+    return [(lon_min, 180), (-180, lon_max-360)]
+  else:
+    return [(lon_min, lon_max)]
+
+
+def encode_points(track):
+  """Pack the latitudes and longitudes of a track into an array of integers (alternating latitude
+  and longitude, in units of 1/`POINT_SCALE` degrees)."""
+  points = array.array('i')
+  for point in track:
+    points.append(round(point[1]*POINT_SCALE))
+    points.append(round(point[2]*POINT_SCALE))
+  return points
+
+
+def get_meta_values(meta):
+  """Yield a (key, normalized value) pair for each value in a marker's metadata (see
+  `mytracks.parse_meta_markup()`), with one for each element of list values."""
+  for key, value in meta.items():
+    if isinstance(value, list):
+      for element in value:
+        yield key, normalize_meta_value(element)
+    else:
+      yield key, normalize_meta_value(value)
+
+
+def normalize_meta_value(value):
+  # Values are either strings or True (for a bare "!key").
+  if isinstance(value, str):
+    return value.lower()
+  return value
+
+
+def get_bounds(points):
+  """The (min_lat, max_lat, min_lon, max_lon) of the (encoded) points, or all None if there are
+  none."""
+  if not points:
+    return None, None, None, None
+  lats = points[0::2]
+  lons = points[1::2]
+  return (min(lats)/POINT_SCALE, max(lats)/POINT_SCALE, min(lons)/POINT_SCALE,
+          max(lons)/POINT_SCALE)
+
+
+def decode_points(points_bytes):
+  points = array.array('i')
+  points.frombytes(points_bytes)
+  return points
+
+
+def get_cells(points):
+  """The set of grid cells the (encoded) points fall in, as (lat cell, lon cell) tuples."""
+  scale = CELL_SIZE*POINT_SCALE
+  if numpy is not None:
+    pairs = numpy.floor(numpy.frombuffer(points, dtype=numpy.int32).reshape(-1, 2)/scale)
+    return set(map(tuple, numpy.unique(pairs.astype(numpy.int64), axis=0).tolist()))
+  return {(math.floor(points[i]/scale), math.floor(points[i+1]/scale))
+          for i in range(0, len(points), 2)}
+
+
+def get_line_distance(points, location):
+  if numpy is not None:
+    coords = numpy.frombuffer(points, dtype=numpy.int32).reshape(-1, 2)/POINT_SCALE
+    return kml.get_line_distance(coords[:, 0], coords[:, 1], location)
+  lats = [points[i]/POINT_SCALE for i in range(0, len(points), 2)]
+  lons = [points[i]/POINT_SCALE for i in range(1, len(points), 2)]
+  return kml.get_line_distance(lats, lons, location)
+
+
+def points_are_near(points, location, thres):
+  if numpy is not None:
+    coords = numpy.frombuffer(points, dtype=numpy.int32).reshape(-1, 2)/POINT_SCALE
+    distances = kml.get_lat_long_distances(coords[:, 0], coords[:, 1], location[0], location[1])
+    return bool((distances <= thres).any())
+  for i in range(0, len(points), 2):
+    distance = kml.get_lat_long_distance(
+      points[i]/POINT_SCALE, points[i+1]/POINT_SCALE, location[0], location[1]
+    )
+    if distance <= thres:
+      return True
+  return False
@@ -1,13 +1,16 @@
 import gzip
 import json
+import logging
 import os
 import pathlib
 import subprocess
 import tarfile
+import tempfile
 import yaml
 import zipfile
 import events
 import contacts
+import profiling
 
 
 DRIVERS_DIR = pathlib.Path(__file__).parent
@@ -81,24 +84,44 @@ def find_driver_configs(drivers_root):
         yield pathlib.Path(dirpath_str, filename_str)
 
 
-def get_events(driver, path, book):
+def get_events(driver, path, book, marks=None):
   """Execute a driver on input data and return `Event`s.
   This will use the `book` argument to harmonize the `Contact`s associated with the `Event`s with
-  all the `Contact`s known to this point."""
-  # Use list() to force rehydrate_objects() to finish before we start.
-  # This will cause all the Contacts to be in their final form - no more modifications.
-  for event in list(rehydrate_objects(run_driver(driver, path))):
-    event.update_contacts(book)
-    yield event
-
-
-def rehydrate_objects(raw_objects):
+  all the `Contact`s known to this point.
+  The `Event`s are yielded as soon as the driver outputs them. But the driver can still add info to
+  its `Contact`s after that, so the harmonizing only happens once the driver is finished. Until the
+  generator is finished, the `Event`s will refer to the driver's own local `Contact`s. The binding
+  also happens if the consumer stops early (closes the generator) or there's an error, so no
+  `Event` is left with local `Contact`s.
+  `marks` is for incremental runs. Give a dict of the high-water marks recorded by previous runs,
+  and the driver will skip the data they cover. The driver's new marks are added to the dict."""
+  name = driver['name']
+  binding = ContactBinding()
+  raw_objects = run_driver(driver, path, marks)
+  try:
+    yield from profiling.wrap(f'{name}: rehydrate', rehydrate_objects(raw_objects, binding, marks))
+  finally:
+    with profiling.span(f'{name}: contacts'):
+      binding.bind(book)
+  profiling.checkpoint(name)
+
+
+def rehydrate_objects(raw_objects, binding=None, marks=None):
   """Transform the raw dicts from a driver into `Event`s and `Contact`s.
   The `Contact` `id`s will only be local `id`s valid for this execution. This will not translate
-  them into globally valid `id`s."""
-  book = contacts.ContactBook(index_policy='blacklist', unindexable=('notes', 'addresses'))
+  them into globally valid `id`s. Instead, the `Event`s will look up their `Contact`s in the
+  `binding`, which can do the translation later.
+  Any high-water marks are stored in `marks`, if given, keyed by their source."""
+  if binding is None:
+    binding = ContactBinding()
+  book = binding.local
   for raw_object in raw_objects:
-    if raw_object['stream'] == 'contact':
+    if raw_object['stream'] == 'mark':
+      if marks is not None:
+        marks[raw_object['source']] = {
+          key: value for key, value in raw_object.items() if key not in ('stream', 'format', 'source')
+        }
+    elif raw_object['stream'] == 'contact':
       contact = contacts.Contact.from_dict(raw_object)
       # If the driver finds new info for a previously-seen Contact (like a new phone #), it will
       # yield the same Contact again, with the same id, but with the new info.
@@ -110,17 +133,61 @@ def rehydrate_objects(raw_objects):
       else:
         book.add(contact)
     else:
-      yield events.parse_event(raw_object, book)
+      yield events.parse_event(raw_object, binding)
+
 
+class ContactBinding:
+  """Translates the local `Contact` `id`s from one execution of a driver into final `Contact`s.
+  Before `bind()` is called, `id`s resolve to the driver's own `Contact`s. After, they resolve to
+  the matching `Contact`s in the global `ContactBook`, if any."""
 
-def run_driver(driver, path):
-  command = get_driver_command(driver, path)
+  def __init__(self):
+    self.local = contacts.ContactBook(index_policy='blacklist', unindexable=('notes', 'addresses'))
+    self.table = None
+
+  def get_by_id(self, cid):
+    if self.table is None:
+      return self.local.get_by_id(cid)
+    else:
+      return self.table.get(cid)
+
+  def bind(self, book):
+    """Match each local `Contact` against the `book` once, and record the result."""
+    table = {}
+    for contact in self.local:
+      table[contact.id] = book.replace_and_update(contact)
+    self.table = table
+
+
+def run_driver(driver, path, marks=None):
+  name = driver['name']
+  if not marks:
+    yield from run_command(get_driver_command(driver, path), name=name)
+    return
+  if 'incremental' not in driver:
+    logging.warning(f"Warning: The {name} driver can't run incrementally. Reading all data.")
+    yield from run_command(get_driver_command(driver, path), name=name)
+    return
+  # Give the driver the marks in a temporary file.
+  with tempfile.NamedTemporaryFile('w', prefix='life-browser.', suffix='.marks.json') as marks_file:
+    json.dump(marks, marks_file)
+    marks_file.flush()
+    yield from run_command(get_driver_command(driver, path, marks_path=marks_file.name), name=name)
+
+
+def run_command(command, name='command'):
+  """Run a driver command and yield the objects it outputs.
+  When profiling, the time spent waiting on its output is the `name` stage, and parsing the output
+  is the `name: decode` stage."""
+  children_cpu = profiling.get_children_cpu()
   process = subprocess.Popen(command, stdout=subprocess.PIPE, encoding='utf8')
-  for line in process.stdout:
-    yield json.loads(line)
+  lines = profiling.wrap(name, process.stdout)
+  yield from profiling.wrap(f'{name}: decode', (json.loads(line) for line in lines))
+  process.wait()
+  profiling.add_child_cpu(name, profiling.get_children_cpu()-children_cpu)
 
 
-def get_driver_command(driver, data_path):
+def get_driver_command(driver, data_path, marks_path=None):
   exe_file = driver['execution']['exe']
   executable = driver['dir'] / exe_file
   args = driver['execution']['args']
@@ -134,6 +201,13 @@ def get_driver_command(driver, data_path):
         )
       command[i] = str(data_path)
       substituted = True
+  # For incremental runs, add the arguments giving the path to the high-water marks file.
+  if marks_path is not None:
+    for arg in driver['incremental']['args']:
+      if arg is None:
+        command.append(str(marks_path))
+      else:
+        command.append(arg)
   return command
 
 
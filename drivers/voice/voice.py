@@ -20,13 +20,17 @@ except ImportError:
   root = pathlib.Path(__file__).resolve().parent.parent.parent
   sys.path.insert(0, str(root))
   from contacts import Contact, ContactBook
+import profiling
 
 
 ##### Driver interface #####
 
 
-def get_events(path, book=None, **kwargs):
+def get_events(path, book=None, since=None, **kwargs):
   # Implement the driver interface.
+  # `since` is the high-water marks from a previous run: a dict mapping record filenames to the
+  # timestamp of the last event seen in each, and the size of the file. Files which haven't changed
+  # size are skipped without parsing them, and only events after the mark are yielded.
   if book is None:
     book = ContactBook()
   archive = Archive(path)
@@ -41,12 +45,16 @@ def get_events(path, book=None, **kwargs):
     logging.warning(
       'No numbers of yours provided. May have problems identifying you in conversations.'
     )
+  def is_unchanged(filename, size):
+    return since is not None and filename in since and since[filename].get('size') == size
   emitted_contacts = set()
   last_event = None
-  for raw_record in archive:
+  for raw_record in archive.iter_records(skip=is_unchanged):
     tree = html5lib.parse(raw_record.contents)
     convo = gvParserLib.Parser.process_tree(tree, raw_record.filename, mynumbers)
     subtype = getattr(convo, 'calltype', None) or getattr(convo, 'audiotype', None)
+    # Each entry is an event, its sender, and its recipients.
+    record_events = []
     if subtype is None:
       # It's a Text conversation.
       for message in convo:
@@ -55,7 +63,7 @@ def get_events(path, book=None, **kwargs):
         recipients = [convert_contact(c, book) for c in message.recipients]
         event['stream'] = 'sms'
         event['message'] = message.text
-        event['echo'] = is_echo(event, last_event, sender, recipients)
+        record_events.append((event, sender, recipients))
     else:
       # It's a call.
       if subtype in ('placed', 'received', 'missed'):
@@ -80,17 +88,31 @@ def get_events(path, book=None, **kwargs):
         event['subtype'] = subtype
         sender = convert_contact(convo.contact, book)
         recipients = [me]
+      record_events.append((event, sender, recipients))
+    last = None
+    if since is not None and raw_record.filename in since:
+      last = since[raw_record.filename]['last']
+    latest = last
+    for event, sender, recipients in record_events:
+      if latest is None or event['start'] > latest:
+        latest = event['start']
+      if last is not None and event['start'] <= last:
+        continue
       event['echo'] = is_echo(event, last_event, sender, recipients)
-    for contact in [sender]+recipients:
-      if contact.id not in emitted_contacts:
-        yield contact.to_dict(stream='contact', format='hangouts')
-        emitted_contacts.add(contact.id)
-    event['sender'] = sender.id
-    event['recipients'] = [recip.id for recip in recipients]
-    yield event
-    last_event = event
-    if book and book.me:
-      me = book.me
+      for contact in [sender]+recipients:
+        if contact.id not in emitted_contacts:
+          yield contact.to_dict(stream='contact', format='hangouts')
+          emitted_contacts.add(contact.id)
+      event['sender'] = sender.id
+      event['recipients'] = [recip.id for recip in recipients]
+      yield event
+      last_event = event
+      if book and book.me:
+        me = book.me
+    # Record how far we've gotten in this file, for the next incremental run.
+    if latest is not None:
+      yield {'stream':'mark', 'format':'voice', 'source':raw_record.filename, 'last':latest,
+             'size':raw_record.size}
 
 
 def get_base_dict(voice_record):
@@ -217,19 +239,33 @@ class Archive(object):
             self.phones_path = path
 
   def __iter__(self):
+    return self.iter_records()
+
+  def iter_records(self, skip=None):
+    """Yield a `RawRecord` for each record file.
+    If `skip` is given, it will be called with the filename and size (in bytes) of each file before
+    reading it. If it returns True, the file is skipped."""
     if self.type == 'dir':
       for filename in self.files:
         if not filename.endswith('.html'):
           continue
-        raw_record = RawRecord(filename=filename)
         path = os.path.join(self.root, 'Calls', filename)
+        raw_record = RawRecord(filename=filename, size=os.path.getsize(path))
+        if skip and skip(raw_record.filename, raw_record.size):
+          continue
         with open(path, encoding=self.encoding) as filehandle:
           raw_record.contents = filehandle.read()
         yield raw_record
     else:
       for path in self.files:
         if path.startswith('Takeout/Voice/Calls') and path.endswith('.html'):
-          raw_record = RawRecord(filename=os.path.basename(path))
+          if self.type == 'zip':
+            size = self.archive_handle.getinfo(path).file_size
+          elif self.type == 'tar':
+            size = self.archive_handle.getmember(path).size
+          raw_record = RawRecord(filename=os.path.basename(path), size=size)
+          if skip and skip(raw_record.filename, raw_record.size):
+            continue
           if self.type == 'zip':
             raw_record.contents = str(self.archive_handle.read(path), self.encoding)
           elif self.type == 'tar':
@@ -280,9 +316,10 @@ class Archive(object):
 
 
 class RawRecord(object):
-  def __init__(self, filename=None, contents=None):
+  def __init__(self, filename=None, contents=None, size=None):
     self.filename = filename
     self.contents = contents
+    self.size = size
 
 
 def parse_filename(path):
@@ -320,6 +357,14 @@ def make_argparser():
   parser.add_argument('-j', '--json', action='store_true')
   parser.add_argument('-m', '--mynumbers',
     help='Comma-delimited.')
+  parser.add_argument('--since', type=argparse.FileType('r'),
+    help='With --json, only output data that\'s newer than what\'s recorded in this JSON file of '
+         'high-water marks from a previous run. It should map record filenames to mark objects, '
+         'like the "mark" objects in the --json output.')
+  parser.add_argument('--memprofile', action='store_true',
+    help='With --json, track memory allocations (with tracemalloc) while parsing the records and '
+         'outputting the events, and print a report of where the memory goes to the log (stderr by '
+         'default).')
   parser.add_argument('-l', '--log', type=argparse.FileType('w'), default=sys.stderr,
     help='Print log messages to this file instead of to stderr. Warning: Will overwrite the file.')
   parser.add_argument('-q', '--quiet', dest='volume', action='store_const', const=logging.CRITICAL,
@@ -337,8 +382,20 @@ def main(argv):
   logging.basicConfig(stream=args.log, level=args.volume, format='%(message)s')
 
   if args.json:
-    for event in get_events(args.record):
-      print(json.dumps(event))
+    if args.since:
+      since = json.load(args.since)
+    else:
+      since = None
+    if args.memprofile:
+      profiling.start(memory=True)
+    try:
+      with profiling.span('output'):
+        for event in profiling.wrap('events', get_events(args.record, since=since)):
+          print(json.dumps(event))
+      profiling.checkpoint('output')
+    finally:
+      if args.memprofile:
+        profiling.report(profiling.stop())
     return
 
   if args.mynumbers is None:
@@ -1,7 +1,13 @@
 from datetime import datetime
 import logging
+import sys
+import polyline
 log = logging.getLogger(__name__)
 
+# The scale of "E7" coordinates: degrees times 10 million.
+E7 = 10000000
+MI_PER_KM = 0.6213
+
 
 def parse_event(event, book):
   stream = event['stream']
@@ -9,17 +15,27 @@ def parse_event(event, book):
     return MessageEvent.from_dict(event, book)
   elif stream == 'call':
     return CallEvent.from_dict(event, book)
+  elif stream == 'location':
+    return LocationEvent.from_dict(event)
+  elif stream == 'marker':
+    return LocationMarkerEvent.from_dict(event)
+  elif stream == 'track':
+    return LocationTrackEvent.from_dict(event)
   else:
     raise NotImplementedError(f'Cannot parse {stream!r} streams.')
 
 
 class Event:
 
+  # There can be millions of these in memory at once, so avoid a __dict__ for each.
+  __slots__ = ('stream', 'format', 'start')
+
   def __init__(self, stream, format, start):
     # The type of event ('sms', 'call', 'chat', 'location', 'photo', etc).
-    self.stream = stream
+    # These are interned, since there are only a handful of distinct values, repeated in every Event.
+    self.stream = sys.intern(stream)
     # The format it originated from ('hangouts', 'voice', 'mytracks', 'geotracker', etc).
-    self.format = format
+    self.format = sys.intern(format)
     # Unix timestamp of the event start.
     self.start = start
 
@@ -47,10 +63,47 @@ class Event:
 class CommunicationEvent(Event):
   """Abstract parent class for any type of contact from one person to one or several others."""
 
-  def __init__(self, stream, format, start, sender, recipients):
+  __slots__ = ('book', '_sender', '_recipients')
+
+  def __init__(self, stream, format, start, sender, recipients, book=None):
     super().__init__(stream, format, start)
-    self.sender = sender
-    self.recipients = recipients
+    # If a `book` is given, `sender` and `recipients` are `Contact` ids instead of `Contact`s.
+    # They're only looked up in the `book` when accessed, so the `book` can change what they point
+    # to after the `Event` is created (see `drivers.utils.ContactBinding`).
+    self.book = book
+    self._sender = sender
+    self._recipients = tuple(recipients)
+
+  @property
+  def sender(self):
+    if self.book is None:
+      return self._sender
+    else:
+      return self.book.get_by_id(self._sender)
+
+  @sender.setter
+  def sender(self, value):
+    self._unbind()
+    self._sender = value
+
+  @property
+  def recipients(self):
+    if self.book is None:
+      return list(self._recipients)
+    else:
+      return self.ids_to_contacts(self._recipients, self.book)
+
+  @recipients.setter
+  def recipients(self, values):
+    self._unbind()
+    self._recipients = tuple(values)
+
+  def _unbind(self):
+    """Replace the `Contact` ids with the actual `Contact`s, so they can be set directly."""
+    if self.book is not None:
+      self._sender = self.sender
+      self._recipients = self.recipients
+      self.book = None
 
   def __eq__(self, other):
     if not super().__eq__(other):
@@ -59,7 +112,7 @@ class CommunicationEvent(Event):
     #      different files, it'll end up with the same Contacts, after deduplication via ContactBook.
     elif self.sender != other.sender:
       return False
-    elif sorted(self.recipients) != sorted(other.recipients):
+    elif sorted(self.recipients, key=str) != sorted(other.recipients, key=str):
       return False
     else:
       return True
@@ -77,8 +130,10 @@ class CommunicationEvent(Event):
 class MessageEvent(CommunicationEvent):
   """Messages like SMS, chats, etc."""
 
-  def __init__(self, stream, format, start, sender, recipients, message, echo=False):
-    super().__init__(stream, format, start, sender, recipients)
+  __slots__ = ('message', 'echo')
+
+  def __init__(self, stream, format, start, sender, recipients, message, echo=False, book=None):
+    super().__init__(stream, format, start, sender, recipients, book=book)
     self.message = message
     # If this is a message from myself to myself, it will show up twice.
     # `echo` should be True if this is the 2nd appearance of the message.
@@ -90,9 +145,10 @@ class MessageEvent(CommunicationEvent):
       stream=data['stream'],
       format=data['format'],
       start=data['start'],
-      sender=book.get_by_id(data['sender']),
-      recipients=cls.ids_to_contacts(data['recipients'], book),
-      message=data['message']
+      sender=data['sender'],
+      recipients=data['recipients'],
+      message=data['message'],
+      book=book,
     )
     if 'echo' in data:
       event.echo = data['echo']
@@ -121,10 +177,12 @@ class MessageEvent(CommunicationEvent):
 
 
 class CallEvent(CommunicationEvent):
-
   """Phone calls, voicemails, video chats, etc."""
-  def __init__(self, stream, format, start, end, subtype, sender, recipients):
-    super().__init__(stream, format, start, sender, recipients)
+
+  __slots__ = ('end', 'subtype')
+
+  def __init__(self, stream, format, start, end, subtype, sender, recipients, book=None):
+    super().__init__(stream, format, start, sender, recipients, book=book)
     self.end = end
     # subtype examples: "received", "voicemail", "missed"
     self.subtype = subtype
@@ -155,8 +213,9 @@ class CallEvent(CommunicationEvent):
       start=data['start'],
       end=data['end'],
       subtype=data['subtype'],
-      sender=book.get_by_id(data['sender']),
-      recipients=cls.ids_to_contacts(data['recipients'], book),
+      sender=data['sender'],
+      recipients=data['recipients'],
+      book=book,
     )
 
   def __eq__(self, other):
@@ -171,27 +230,157 @@ class CallEvent(CommunicationEvent):
 
 
 class LocationEvent(Event):
+  """A single location fix."""
+
+  # Location histories can have millions of points, so the coordinates are stored as integers in
+  # units of 1e-7 degrees (the "E7" format Google uses), which is about a centimeter.
+  __slots__ = ('lat_e7', 'lon_e7', 'accuracy')
 
-  def __init__(self, stream, format, start, nw_lat, nw_lon, accuracy, raw=None):
-    super().__init__(stream, format, start, raw=raw)
-    self.lat = self.nw_lat = nw_lat
-    self.lon = self.nw_lon = nw_lon
+  def __init__(self, stream, format, start, lat, lon, accuracy=None):
+    super().__init__(stream, format, start)
+    self.lat_e7 = round(lat*E7)
+    self.lon_e7 = round(lon*E7)
+    # The radius of uncertainty, in meters.
     self.accuracy = accuracy
 
-  #TODO: __eq__()
+  @property
+  def lat(self):
+    return self.lat_e7/E7
+
+  @property
+  def lon(self):
+    return self.lon_e7/E7
+
+  @classmethod
+  def from_dict(cls, data, book=None):
+    """Takes either "lat" and "lon" in degrees, or "lat_e7" and "lon_e7"."""
+    if 'lat_e7' in data:
+      event = cls(data['stream'], data['format'], data['start'], 0, 0, data.get('accuracy'))
+      event.lat_e7 = data['lat_e7']
+      event.lon_e7 = data['lon_e7']
+      return event
+    return cls(
+      stream=data['stream'],
+      format=data['format'],
+      start=data['start'],
+      lat=data['lat'],
+      lon=data['lon'],
+      accuracy=data.get('accuracy'),
+    )
+
+  def __str__(self):
+    time_str = datetime.fromtimestamp(self.start).strftime('%H:%M:%S')
+    if self.accuracy is None:
+      accuracy_str = ''
+    else:
+      accuracy_str = f' (within {self.accuracy}m)'
+    return f'{time_str} Location: {self.lat:0.6f}, {self.lon:0.6f}{accuracy_str}'
+
+  def __eq__(self, other):
+    if not super().__eq__(other):
+      return False
+    elif self.lat_e7 != other.lat_e7 or self.lon_e7 != other.lon_e7:
+      return False
+    elif self.accuracy != other.accuracy:
+      return False
+    else:
+      return True
+
+
+class LocationMarkerEvent(LocationEvent):
+  """A named location, like a marker dropped while recording a track."""
+
+  __slots__ = ('name', 'description')
+
+  def __init__(self, stream, format, start, lat, lon, name, description=None, accuracy=None):
+    super().__init__(stream, format, start, lat, lon, accuracy)
+    self.name = name
+    self.description = description
+
+  @classmethod
+  def from_dict(cls, data, book=None):
+    return cls(
+      stream=data['stream'],
+      format=data['format'],
+      start=data['start'],
+      lat=data['lat'],
+      lon=data['lon'],
+      name=data['name'],
+      description=data.get('description'),
+      accuracy=data.get('accuracy'),
+    )
+
+  def __str__(self):
+    time_str = datetime.fromtimestamp(self.start).strftime('%H:%M:%S')
+    return f'{time_str} Marker: {self.name} ({self.lat:0.6f}, {self.lon:0.6f})'
+
+  def __eq__(self, other):
+    if not super().__eq__(other):
+      return False
+    elif self.name != other.name or self.description != other.description:
+      return False
+    else:
+      return True
 
 
 class LocationTrackEvent(Event):
+  """A recorded track, like a GPS log of a walk or a drive.
+  The points are kept in the compact encoding from `polyline` (see `polyline.encode_track()`), which
+  is also how drivers output them, and only decoded when `track` is accessed."""
 
-  def __init__(self, stream, format, start, end, nw_lat, nw_lon, se_lat, se_lon, track, raw=None):
-    super().__init__(stream, format, start, end=end, raw=raw)
-    self.nw_lat = nw_lat
-    self.nw_lon = nw_lon
-    self.se_lat = se_lat
-    self.se_lon = se_lon
-    self.track = track
+  __slots__ = ('end', 'encoded_track', 'title', 'description', 'distance')
+
+  def __init__(self, stream, format, start, end, encoded_track, title=None, description=None,
+               distance=None):
+    super().__init__(stream, format, start)
+    self.end = end
+    self.encoded_track = encoded_track
+    self.title = title
+    self.description = description
+    # In kilometers.
+    self.distance = distance
+
+  @property
+  def track(self):
+    """The points, as `(timestamp, lat, lon, alt)` tuples."""
+    return polyline.decode_track(self.encoded_track)
 
-  #TODO: __eq__()
+  @property
+  def duration(self):
+    return self.end-self.start
+
+  @classmethod
+  def from_dict(cls, data, book=None):
+    return cls(
+      stream=data['stream'],
+      format=data['format'],
+      start=data['start'],
+      end=data['end'],
+      encoded_track=data['track'],
+      title=data.get('title'),
+      description=data.get('description'),
+      distance=data.get('distance'),
+    )
+
+  def __str__(self):
+    time_str = datetime.fromtimestamp(self.start).strftime('%H:%M:%S')
+    details = []
+    if self.distance is not None:
+      details.append(f'{self.distance*MI_PER_KM:0.1f} mi')
+    if self.end is not None:
+      details.append(format_time(round(self.duration)))
+    details_str = ''
+    if details:
+      details_str = ' ('+', '.join(details)+')'
+    return f'{time_str} Track: {self.title}{details_str}'
+
+  def __eq__(self, other):
+    if not super().__eq__(other):
+      return False
+    elif self.end != other.end or self.encoded_track != other.encoded_track:
+      return False
+    else:
+      return True
 
 
 def format_time(total_seconds):
@@ -0,0 +1,125 @@
+"""Write a stream of `Event`s to a file, for analysis in other tools.
+The events are written in batches as they arrive, so the memory used stays flat."""
+import json
+import logging
+import sys
+try:
+  import pyarrow
+  import pyarrow.parquet
+except ImportError:
+  pyarrow = None
+log = logging.getLogger(__name__)
+
+FORMATS = ('jsonl', 'parquet')
+# How many events to write at a time. For Parquet, this is the size of each row group.
+BATCH_SIZE = 10000
+# The columns in the output. Events which don't have a field get a null.
+# "track" is a track's points in the `polyline` encoding: the dict from `polyline.encode_track()`.
+COLUMNS = ('stream', 'format', 'start', 'end', 'sender', 'recipients', 'subtype', 'message', 'echo',
+           'lat', 'lon', 'accuracy', 'name', 'title', 'description', 'distance', 'track')
+
+
+def export_events(events, path, format=None, batch_size=BATCH_SIZE):
+  """Write `events` to `path` ('-' for stdout) in the given format ('jsonl' or 'parquet').
+  If no `format` is given, it's inferred from the file extension. Returns the number of events."""
+  if format is None:
+    format = guess_format(path)
+  if format == 'parquet':
+    if pyarrow is None:
+      raise ValueError('Writing Parquet requires the pyarrow package.')
+    if path == '-':
+      raise ValueError('Parquet can only be written to a file, not stdout.')
+    writer = ParquetWriter(path)
+  elif format == 'jsonl':
+    writer = JsonLinesWriter(path)
+  else:
+    raise ValueError(f'Unrecognized export format {format!r}. Options: {", ".join(FORMATS)}.')
+  count = 0
+  batch = []
+  try:
+    for event in events:
+      batch.append(event_to_row(event))
+      if len(batch) >= batch_size:
+        writer.write(batch)
+        count += len(batch)
+        batch = []
+    writer.write(batch)
+    count += len(batch)
+  finally:
+    writer.close()
+  return count
+
+
+def guess_format(path):
+  if path.endswith('.parquet') or path.endswith('.pq'):
+    return 'parquet'
+  else:
+    return 'jsonl'
+
+
+def event_to_row(event):
+  """Convert an `Event` into a dict with the `COLUMNS`, with `Contact`s resolved to their names."""
+  row = {}
+  for column in COLUMNS:
+    row[column] = getattr(event, column, None)
+  # Keep the points encoded, instead of decoding them with the `track` property.
+  row['track'] = getattr(event, 'encoded_track', None)
+  if row['sender'] is not None:
+    row['sender'] = str(row['sender'])
+  if row['recipients'] is not None:
+    row['recipients'] = [str(recipient) for recipient in row['recipients']]
+  return row
+
+
+class JsonLinesWriter:
+
+  def __init__(self, path):
+    if path == '-':
+      self.file = sys.stdout
+    else:
+      self.file = open(path, 'w')
+
+  def write(self, rows):
+    self.file.write(''.join([json.dumps(row)+'\n' for row in rows]))
+    self.file.flush()
+
+  def close(self):
+    if self.file is not sys.stdout:
+      self.file.close()
+
+
+class ParquetWriter:
+
+  def __init__(self, path):
+    self.schema = pyarrow.schema([
+      ('stream', pyarrow.string()),
+      ('format', pyarrow.string()),
+      ('start', pyarrow.float64()),
+      ('end', pyarrow.float64()),
+      ('sender', pyarrow.string()),
+      ('recipients', pyarrow.list_(pyarrow.string())),
+      ('subtype', pyarrow.string()),
+      ('message', pyarrow.string()),
+      ('echo', pyarrow.bool_()),
+      ('lat', pyarrow.float64()),
+      ('lon', pyarrow.float64()),
+      ('accuracy', pyarrow.float64()),
+      ('name', pyarrow.string()),
+      ('title', pyarrow.string()),
+      ('description', pyarrow.string()),
+      ('distance', pyarrow.float64()),
+      ('track', pyarrow.struct([
+        ('coords', pyarrow.string()), ('times', pyarrow.string()), ('alts', pyarrow.string()),
+      ])),
+    ])
+    self.writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression='snappy')
+
+  def write(self, rows):
+    if not rows:
+      return
+    columns = {column: [row[column] for row in rows] for column in COLUMNS}
+    table = pyarrow.Table.from_pydict(columns, schema=self.schema)
+    self.writer.write_table(table)
+
+  def close(self):
+    self.writer.close()
@@ -0,0 +1,8 @@
+import os
+
+
+def setup():
+  """Configure Django so the lifeapp models can be used outside the web app (like from view.py)."""
+  import django
+  os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lifesite.settings')
+  django.setup()
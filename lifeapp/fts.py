@@ -0,0 +1,45 @@
+"""SQL for the full-text index of `MessageEvent.message`.
+It's an SQLite FTS5 "external content" table, so it stores only the index, not another copy of the
+text. Triggers keep it in sync with the messages table, so each import only indexes the messages it
+adds.
+Note: When a migration alters the messages table, Django rebuilds it under a new name, which drops
+its triggers. So any migration which alters `MessageEvent` has to run `RESTORE_SQL` afterward.
+Migrations shouldn't import this module: they keep their own copies of the SQL, so changes here
+don't change what past migrations do."""
+
+TABLE = 'lifeapp_messageevent_fts'
+
+CREATE_TABLE_SQL = f"""
+CREATE VIRTUAL TABLE {TABLE} USING fts5(
+  message, content='lifeapp_messageevent', content_rowid='id'
+);"""
+
+CREATE_TRIGGERS_SQL = [
+  f"""
+CREATE TRIGGER {TABLE}_insert AFTER INSERT ON lifeapp_messageevent BEGIN
+  INSERT INTO {TABLE}(rowid, message) VALUES (new.id, new.message);
+END;""",
+  f"""
+CREATE TRIGGER {TABLE}_delete AFTER DELETE ON lifeapp_messageevent BEGIN
+  INSERT INTO {TABLE}({TABLE}, rowid, message) VALUES ('delete', old.id, old.message);
+END;""",
+  f"""
+CREATE TRIGGER {TABLE}_update AFTER UPDATE OF message ON lifeapp_messageevent BEGIN
+  INSERT INTO {TABLE}({TABLE}, rowid, message) VALUES ('delete', old.id, old.message);
+  INSERT INTO {TABLE}(rowid, message) VALUES (new.id, new.message);
+END;""",
+]
+
+DROP_TRIGGERS_SQL = [
+  f'DROP TRIGGER IF EXISTS {TABLE}_update;',
+  f'DROP TRIGGER IF EXISTS {TABLE}_delete;',
+  f'DROP TRIGGER IF EXISTS {TABLE}_insert;',
+]
+
+# Re-index all the messages from scratch.
+REBUILD_SQL = f"INSERT INTO {TABLE}({TABLE}) VALUES ('rebuild');"
+
+CREATE_SQL = [CREATE_TABLE_SQL] + CREATE_TRIGGERS_SQL + [REBUILD_SQL]
+DROP_SQL = DROP_TRIGGERS_SQL + [f'DROP TABLE {TABLE};']
+# Put back the triggers after the messages table has been rebuilt, and re-index it.
+RESTORE_SQL = DROP_TRIGGERS_SQL + CREATE_TRIGGERS_SQL + [REBUILD_SQL]
@@ -0,0 +1,67 @@
+import argparse
+import time
+from django.core.management.base import BaseCommand, CommandError
+import drivers
+import drivers.contacts
+import view
+from lifeapp import store
+
+
+class Command(BaseCommand):
+  help = 'Parse data sources with the drivers and import their events into the database.'
+
+  def add_arguments(self, parser):
+    parser.add_argument('-d', '--data', nargs=2, action='append', required=True,
+      metavar=('FORMAT', 'PATH'),
+      help='The input file/directory for a data source, like in view.py. Give two arguments: the '
+           'format, and the path to the data.')
+    parser.add_argument('-c', '--contacts', type=argparse.FileType('r'),
+      help='Contacts file, in the "Google CSV" format exported by Google Contacts.')
+    parser.add_argument('-a', '--aliases', default='',
+      help='Aliases for people, like in view.py.')
+    parser.add_argument('--mynumbers',
+      help='Your phone numbers, to help identify yourself in conversations. comma-separated list.')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('-i', '--incremental', action='store_true',
+      help='Only import the data that\'s new since the last import of each format, using the '
+           'high-water marks recorded by previous imports. Use this when importing a newer export '
+           'which mostly overlaps with an older one. Without this, every event is read, but ones '
+           'already in the database are skipped.')
+    mode.add_argument('--replace', action='store_true',
+      help='Delete the existing events of each format in every month the new events cover, and '
+           'replace them with the new ones. Use this to re-import a complete export after the data '
+           'or the driver changed. Events from other exports in the same months are lost.')
+    parser.add_argument('-b', '--batch-size', type=int, default=store.BATCH_SIZE,
+      help='Insert this many events at a time. Default: %(default)s')
+    parser.add_argument('-t', '--transaction-size', type=int, default=store.TRANSACTION_SIZE,
+      help='Commit after this many events. Default: %(default)s')
+
+  def handle(self, *args, **options):
+    all_drivers = drivers.discover_drivers()
+    for format, path in options['data']:
+      if format not in all_drivers:
+        raise CommandError(f'Driver for format {format!r} not found.')
+      if options['incremental'] and 'incremental' not in all_drivers[format]:
+        raise CommandError(f'The {format} driver doesn\'t support incremental imports.')
+    # Start with the contacts already in the database, so new events get linked to them.
+    contacts = store.load_contact_book()
+    if options['contacts']:
+      contacts.merge(drivers.contacts.get_contacts(options['contacts'], 'google-browser-google-csv'))
+    view.parse_aliases(options['aliases'], contacts)
+    view.parse_mynumbers(options['mynumbers'], contacts)
+    # Record the high-water marks from every import, so the next one can be incremental.
+    marks = {}
+    if options['incremental']:
+      for format, path in options['data']:
+        marks[format] = store.load_marks(format)
+    start = time.time()
+    all_events = view.read_events(options['data'], all_drivers, contacts, marks=marks)
+    count = store.import_events(
+      all_events, book=contacts, replace=options['replace'], incremental=options['incremental'],
+      batch_size=options['batch_size'], transaction_size=options['transaction_size']
+    )
+    # Only save the marks once the events they cover are safely stored.
+    for format, format_marks in marks.items():
+      store.save_marks(format, format_marks)
+    elapsed = time.time() - start
+    self.stdout.write(f'Imported {count} events in {elapsed:0.1f} seconds.')
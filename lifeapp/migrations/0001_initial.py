@@ -0,0 +1,46 @@
+# Generated by Django 2.2.3 on 2026-10-19 05:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CallEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stream', models.CharField(db_index=True, max_length=31)),
+                ('format', models.CharField(db_index=True, max_length=63)),
+                ('start', models.BigIntegerField(db_index=True)),
+                ('end', models.BigIntegerField()),
+                ('subtype', models.CharField(max_length=31)),
+                ('sender', models.CharField(db_index=True, max_length=127)),
+                ('_recipients', models.CharField(max_length=1023)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='MessageEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stream', models.CharField(db_index=True, max_length=31)),
+                ('format', models.CharField(db_index=True, max_length=63)),
+                ('start', models.BigIntegerField(db_index=True)),
+                ('sender', models.CharField(db_index=True, max_length=127)),
+                ('_recipients', models.CharField(max_length=1023)),
+                ('message', models.TextField()),
+                ('echo', models.BooleanField(default=False)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
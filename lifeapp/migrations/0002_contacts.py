@@ -0,0 +1,116 @@
+import json
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 5000
+
+
+def names_to_contacts(apps, schema_editor):
+    """Create a Contact for each distinct sender/recipient name, and link the events to them."""
+    Contact = apps.get_model('lifeapp', 'Contact')
+    contact_ids = {}
+    def get_contact_id(name):
+        if name not in contact_ids:
+            if name == 'Me':
+                contact = Contact.objects.create(name='', is_me=True)
+            elif name == '???':
+                contact = Contact.objects.create(name='')
+            else:
+                data = {'names': {name: {'default': True, 'labels': []}}}
+                contact = Contact.objects.create(name=name, data=json.dumps(data))
+            contact_ids[name] = contact.id
+        return contact_ids[name]
+    for model_name, event_column in (('MessageEvent', 'messageevent_id'), ('CallEvent', 'callevent_id')):
+        Model = apps.get_model('lifeapp', model_name)
+        Through = Model.recipients.through
+        events = []
+        links = []
+        for event in Model.objects.only('id', 'sender', '_recipients').iterator():
+            event.sender_contact_id = get_contact_id(event.sender)
+            events.append(event)
+            for name in set(event._recipients.split('\x00')):
+                links.append(Through(**{event_column: event.id, 'contact_id': get_contact_id(name)}))
+            if len(events) >= BATCH_SIZE:
+                Model.objects.bulk_update(events, ['sender_contact'])
+                events = []
+            if len(links) >= BATCH_SIZE:
+                Through.objects.bulk_create(links)
+                links = []
+        Model.objects.bulk_update(events, ['sender_contact'])
+        Through.objects.bulk_create(links)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lifeapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Contact',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, db_index=True, max_length=127)),
+                ('is_me', models.BooleanField(default=False)),
+                ('data', models.TextField(default='{}')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='callevent',
+            name='sender_contact',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='lifeapp.Contact'),
+        ),
+        migrations.AddField(
+            model_name='messageevent',
+            name='sender_contact',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='lifeapp.Contact'),
+        ),
+        migrations.AddField(
+            model_name='callevent',
+            name='recipients',
+            field=models.ManyToManyField(related_name='calls', to='lifeapp.Contact'),
+        ),
+        migrations.AddField(
+            model_name='messageevent',
+            name='recipients',
+            field=models.ManyToManyField(related_name='messages', to='lifeapp.Contact'),
+        ),
+        migrations.RunPython(names_to_contacts),
+        migrations.RemoveField(
+            model_name='callevent',
+            name='_recipients',
+        ),
+        migrations.RemoveField(
+            model_name='messageevent',
+            name='_recipients',
+        ),
+        migrations.RemoveField(
+            model_name='callevent',
+            name='sender',
+        ),
+        migrations.RemoveField(
+            model_name='messageevent',
+            name='sender',
+        ),
+        migrations.RenameField(
+            model_name='callevent',
+            old_name='sender_contact',
+            new_name='sender',
+        ),
+        migrations.RenameField(
+            model_name='messageevent',
+            old_name='sender_contact',
+            new_name='sender',
+        ),
+        migrations.AlterField(
+            model_name='callevent',
+            name='sender',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sent_calls', to='lifeapp.Contact'),
+        ),
+        migrations.AlterField(
+            model_name='messageevent',
+            name='sender',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sent_messages', to='lifeapp.Contact'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+
+# An SQLite FTS5 index over the message text. It's an "external content" table, so it stores only
+# the index, not another copy of the text. Triggers keep it in sync with the messages table, so
+# each import only indexes the messages it adds.
+CREATE_SQL = """
+CREATE VIRTUAL TABLE lifeapp_messageevent_fts USING fts5(
+    message, content='lifeapp_messageevent', content_rowid='id'
+);
+CREATE TRIGGER lifeapp_messageevent_fts_insert AFTER INSERT ON lifeapp_messageevent BEGIN
+    INSERT INTO lifeapp_messageevent_fts(rowid, message) VALUES (new.id, new.message);
+END;
+CREATE TRIGGER lifeapp_messageevent_fts_delete AFTER DELETE ON lifeapp_messageevent BEGIN
+    INSERT INTO lifeapp_messageevent_fts(lifeapp_messageevent_fts, rowid, message)
+    VALUES ('delete', old.id, old.message);
+END;
+CREATE TRIGGER lifeapp_messageevent_fts_update AFTER UPDATE OF message ON lifeapp_messageevent BEGIN
+    INSERT INTO lifeapp_messageevent_fts(lifeapp_messageevent_fts, rowid, message)
+    VALUES ('delete', old.id, old.message);
+    INSERT INTO lifeapp_messageevent_fts(rowid, message) VALUES (new.id, new.message);
+END;
+INSERT INTO lifeapp_messageevent_fts(lifeapp_messageevent_fts) VALUES ('rebuild');
+"""
+
+DROP_SQL = """
+DROP TRIGGER lifeapp_messageevent_fts_update;
+DROP TRIGGER lifeapp_messageevent_fts_delete;
+DROP TRIGGER lifeapp_messageevent_fts_insert;
+DROP TABLE lifeapp_messageevent_fts;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lifeapp', '0002_contacts'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_SQL, DROP_SQL),
+    ]
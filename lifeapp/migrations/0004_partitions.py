@@ -0,0 +1,90 @@
+# Generated by Django 2.2.3 on 2026-10-19 05:52
+
+from django.db import migrations, models
+
+# Fill in the month of the existing events, and build the manifest of their partitions.
+FILL_SQL = []
+for kind in ('messageevent', 'callevent'):
+    FILL_SQL.append(
+        f"UPDATE lifeapp_{kind} SET month = CAST(strftime('%Y%m', start, 'unixepoch') AS INTEGER);"
+    )
+    FILL_SQL.append(
+        f"INSERT INTO lifeapp_partition (kind, month, format, stream, count, first, last) "
+        f"SELECT '{kind}', month, format, stream, COUNT(*), MIN(start), MAX(start) "
+        f"FROM lifeapp_{kind} GROUP BY month, format, stream;"
+    )
+
+# Put back the search index's triggers after the messages table has been rebuilt, and re-index it.
+# A copy of `lifeapp.RESTORE_SQL` as it was when this was written, so later changes there don't
+# change this migration.
+RESTORE_SQL = [
+    'DROP TRIGGER IF EXISTS lifeapp_messageevent_fts_update;',
+    'DROP TRIGGER IF EXISTS lifeapp_messageevent_fts_delete;',
+    'DROP TRIGGER IF EXISTS lifeapp_messageevent_fts_insert;',
+    """
+CREATE TRIGGER lifeapp_messageevent_fts_insert AFTER INSERT ON lifeapp_messageevent BEGIN
+  INSERT INTO lifeapp_messageevent_fts(rowid, message) VALUES (new.id, new.message);
+END;""",
+    """
+CREATE TRIGGER lifeapp_messageevent_fts_delete AFTER DELETE ON lifeapp_messageevent BEGIN
+  INSERT INTO lifeapp_messageevent_fts(lifeapp_messageevent_fts, rowid, message)
+  VALUES ('delete', old.id, old.message);
+END;""",
+    """
+CREATE TRIGGER lifeapp_messageevent_fts_update AFTER UPDATE OF message ON lifeapp_messageevent BEGIN
+  INSERT INTO lifeapp_messageevent_fts(lifeapp_messageevent_fts, rowid, message)
+  VALUES ('delete', old.id, old.message);
+  INSERT INTO lifeapp_messageevent_fts(rowid, message) VALUES (new.id, new.message);
+END;""",
+    "INSERT INTO lifeapp_messageevent_fts(lifeapp_messageevent_fts) VALUES ('rebuild');",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lifeapp', '0003_message_search'),
+    ]
+
+    operations = [
+        # When this is reversed, removing the month column rebuilds the messages table again, so
+        # the triggers have to be restored last.
+        migrations.RunSQL(migrations.RunSQL.noop, RESTORE_SQL),
+        migrations.AddField(
+            model_name='callevent',
+            name='month',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='messageevent',
+            name='month',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterIndexTogether(
+            name='callevent',
+            index_together={('month', 'start')},
+        ),
+        migrations.AlterIndexTogether(
+            name='messageevent',
+            index_together={('month', 'start')},
+        ),
+        migrations.CreateModel(
+            name='Partition',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=31)),
+                ('month', models.IntegerField()),
+                ('format', models.CharField(max_length=63)),
+                ('stream', models.CharField(max_length=31)),
+                ('count', models.IntegerField(default=0)),
+                ('first', models.BigIntegerField()),
+                ('last', models.BigIntegerField()),
+            ],
+            options={
+                'unique_together': {('kind', 'month', 'format', 'stream')},
+            },
+        ),
+        migrations.RunSQL(FILL_SQL, migrations.RunSQL.noop),
+        # Adding the month column rebuilt the messages table, dropping the search index's triggers.
+        migrations.RunSQL(RESTORE_SQL, RESTORE_SQL),
+    ]
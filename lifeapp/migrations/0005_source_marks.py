@@ -0,0 +1,26 @@
+# Generated by Django 2.2.3 on 2026-10-19 05:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lifeapp', '0004_partitions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SourceMark',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('format', models.CharField(max_length=63)),
+                ('source', models.CharField(max_length=255)),
+                ('last', models.FloatField()),
+                ('size', models.BigIntegerField(null=True)),
+            ],
+            options={
+                'unique_together': {('format', 'source')},
+            },
+        ),
+    ]
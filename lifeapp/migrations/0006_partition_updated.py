@@ -0,0 +1,18 @@
+# Generated by Django 2.2.3 on 2026-10-19 06:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lifeapp', '0005_source_marks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='partition',
+            name='updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
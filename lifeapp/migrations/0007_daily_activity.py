@@ -0,0 +1,56 @@
+# Generated by Django 2.2.3 on 2026-10-19 06:01
+
+import collections
+import datetime
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_rollups(apps, schema_editor):
+    """Count the existing events. This is the same as `store.update_rollups()`, for all months."""
+    DailyActivity = apps.get_model('lifeapp', 'DailyActivity')
+    counts = collections.Counter()
+    with schema_editor.connection.cursor() as cursor:
+        for table, event_column in (('lifeapp_messageevent', 'messageevent_id'),
+                                    ('lifeapp_callevent', 'callevent_id')):
+            cursor.execute(f'SELECT start / 86400, stream, COUNT(*) FROM {table} GROUP BY 1, 2')
+            for day, stream, count in cursor.fetchall():
+                counts[(day, stream, None)] += count
+            cursor.execute(
+                f'SELECT e.start / 86400, e.stream, p.contact_id, COUNT(*) FROM {table} e JOIN ('
+                f'  SELECT id AS event_id, sender_id AS contact_id FROM {table} WHERE sender_id IS NOT NULL'
+                f'  UNION SELECT {event_column}, contact_id FROM {table}_recipients'
+                f') p ON p.event_id = e.id GROUP BY 1, 2, 3'
+            )
+            for day, stream, contact_id, count in cursor.fetchall():
+                counts[(day, stream, contact_id)] += count
+    epoch = datetime.date(1970, 1, 1)
+    rows = [
+        DailyActivity(day=epoch+datetime.timedelta(days=day), stream=stream, contact_id=contact_id, count=count)
+        for (day, stream, contact_id), count in counts.items()
+    ]
+    DailyActivity.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lifeapp', '0006_partition_updated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyActivity',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(db_index=True)),
+                ('stream', models.CharField(max_length=31)),
+                ('count', models.IntegerField(default=0)),
+                ('contact', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='activity', to='lifeapp.Contact')),
+            ],
+            options={
+                'unique_together': {('day', 'stream', 'contact')},
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.3 on 2026-10-19 07:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lifeapp', '0007_daily_activity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('finished', models.DateTimeField(auto_now_add=True)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 2.2.3 on 2026-10-19 07:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lifeapp', '0008_import_runs'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='dailyactivity',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyactivity',
+            constraint=models.UniqueConstraint(fields=('day', 'stream', 'contact'), name='unique_daily_activity'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyactivity',
+            constraint=models.UniqueConstraint(condition=models.Q(contact__isnull=True), fields=('day', 'stream'), name='unique_daily_total'),
+        ),
+    ]
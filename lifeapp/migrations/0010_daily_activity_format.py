@@ -0,0 +1,34 @@
+# Generated by Django 2.2.3 on 2026-10-19 07:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lifeapp', '0009_daily_activity_constraints'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='dailyactivity',
+            name='unique_daily_activity',
+        ),
+        migrations.RemoveConstraint(
+            model_name='dailyactivity',
+            name='unique_daily_total',
+        ),
+        migrations.AddField(
+            model_name='dailyactivity',
+            name='format',
+            field=models.CharField(blank=True, default='', max_length=63),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyactivity',
+            constraint=models.UniqueConstraint(fields=('day', 'stream', 'format', 'contact'), name='unique_daily_activity'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyactivity',
+            constraint=models.UniqueConstraint(condition=models.Q(contact__isnull=True), fields=('day', 'stream', 'format'), name='unique_daily_total'),
+        ),
+    ]
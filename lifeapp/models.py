@@ -10,18 +10,119 @@ except django.core.exceptions.ImproperlyConfigured as error:
 log = logging.getLogger(__name__)
 
 
+class Contact(models.Model):
+  """A person. This is the database version of `contacts.Contact`."""
+
+  name = models.CharField(max_length=127, blank=True, db_index=True)
+  is_me = models.BooleanField(default=False)
+  # All the contact info (names, phones, emails, etc), as JSON in the format of the 'values' in
+  # `contacts.Contact.to_dict()`.
+  data = models.TextField(default='{}')
+
+  def __str__(self):
+    if self.is_me:
+      return 'Me'
+    elif self.name:
+      return self.name
+    else:
+      return '???'
+
+
+class Partition(models.Model):
+  """The manifest of the events stored for each month.
+  There's one of these for each combination of event table, month, format, and stream."""
+
+  # The name of the event model ('messageevent' or 'callevent').
+  kind = models.CharField(max_length=31)
+  month = models.IntegerField()
+  format = models.CharField(max_length=63)
+  stream = models.CharField(max_length=31)
+  count = models.IntegerField(default=0)
+  # The earliest and latest start times of the events.
+  first = models.BigIntegerField()
+  last = models.BigIntegerField()
+  # When the partition was last written.
+  updated = models.DateTimeField(auto_now=True)
+
+  class Meta:
+    unique_together = [('kind', 'month', 'format', 'stream')]
+
+  def __str__(self):
+    return f'{self.kind} {self.month} {self.format}/{self.stream}: {self.count} events'
+
+
+class ImportRun(models.Model):
+  """A record of each import. Every import bumps this, even one which only changes contacts or
+  deletes partitions, so it's a version number for the whole database (for HTTP caching)."""
+
+  finished = models.DateTimeField(auto_now_add=True)
+  # The number of events written.
+  count = models.IntegerField(default=0)
+
+  def __str__(self):
+    return f'Import {self.id} at {self.finished}: {self.count} events'
+
+
+class DailyActivity(models.Model):
+  """A rollup of how many events happened each day (in the site's time zone), in each stream, with
+  each person.
+  The rows with no contact are the totals for the day and stream."""
+
+  day = models.DateField(db_index=True)
+  stream = models.CharField(max_length=31)
+  contact = models.ForeignKey(Contact, null=True, on_delete=models.CASCADE, related_name='activity')
+  # The format the counts came from, for the streams which are only counted, not stored (see
+  # `store.COUNTED_STREAMS`). Empty for the counts of the stored events, which cover every format.
+  format = models.CharField(max_length=63, blank=True, default='')
+  count = models.IntegerField(default=0)
+
+  class Meta:
+    constraints = [
+      models.UniqueConstraint(fields=['day', 'stream', 'format', 'contact'],
+                              name='unique_daily_activity'),
+      # SQLite treats NULLs as distinct, so the constraint above doesn't cover the totals.
+      models.UniqueConstraint(fields=['day', 'stream', 'format'],
+                              condition=models.Q(contact__isnull=True), name='unique_daily_total'),
+    ]
+
+  def __str__(self):
+    return f'{self.day} {self.stream} {self.contact or "(all)"}: {self.count}'
+
+
+class SourceMark(models.Model):
+  """A high-water mark for incremental imports: how far into one source the data has been imported.
+  A source is a unit of the input a driver can skip, like a conversation or a record file."""
+
+  format = models.CharField(max_length=63)
+  source = models.CharField(max_length=255)
+  # The timestamp of the last event imported from the source.
+  last = models.FloatField()
+  # The size of the source, for drivers which use it to tell whether the source has changed.
+  size = models.BigIntegerField(null=True)
+
+  class Meta:
+    unique_together = [('format', 'source')]
+
+  def __str__(self):
+    return f'{self.format} {self.source}: {self.last}'
+
+
 class Event(models.Model):
 
   # The type of event ('sms', 'call', 'chat', 'location', 'photo', etc).
-  stream = models.CharField(max_length=31, blank=False)
+  stream = models.CharField(max_length=31, blank=False, db_index=True)
   # The format it originated from ('hangouts', 'voice', 'mytracks', 'geotracker', etc).
-  format = models.CharField(max_length=63, blank=False)
+  format = models.CharField(max_length=63, blank=False, db_index=True)
   # Unix timestamp of the event start.
   #TODO: Make a DateTimeField.
-  start = models.BigIntegerField(null=False)
+  start = models.BigIntegerField(null=False, db_index=True)
+  # The month of the start time (in UTC), as a YYYYMM integer. The events are partitioned by month:
+  # see `Partition`.
+  month = models.IntegerField(default=0)
 
   class Meta:
     abstract = True
+    index_together = [('month', 'start')]
 
   @classmethod
   def create(cls, stream, format, start, raw=None):
@@ -39,28 +140,39 @@ class Event(models.Model):
 class MessageEvent(Event):
   """Messages like SMS, chats, etc."""
 
-  #TODO: sender = models.ForeignKey(Contact, on_delete=models.SET_NULL)
-  sender = models.CharField(max_length=127, blank=False)
-  # A null-delimited string of recipient names. This is a very temporary kludge just to get this up
-  # and running without defining a Contact table.
-  #TODO: recipients = models.ManyToManyField(Contact, related_name='messages')
-  _recipients = models.CharField(max_length=1023, blank=False)
+  sender = models.ForeignKey(Contact, null=True, on_delete=models.SET_NULL,
+                             related_name='sent_messages')
+  recipients = models.ManyToManyField(Contact, related_name='messages')
   message = models.TextField()
   # If this is a message from myself to myself, it will show up twice.
   # `echo` should be True if this is the 2nd appearance of the message.
   echo = models.BooleanField(default=False)
 
   @classmethod
-  def create(cls, stream, format, start, sender, recipients, message, echo=False, raw=None):
-    event = cls(stream=stream, format=format, start=start, sender=sender, recipients=recipients,
-                message=message, echo=echo)
+  def create(cls, stream, format, start, sender, message, echo=False, raw=None):
+    # Note: The recipients can only be added after the event is saved.
+    event = cls(stream=stream, format=format, start=start, sender=sender, message=message, echo=echo)
     event.add_raw(raw)
     return event
 
-  @property
-  def recipients(self):
-    return self._recipients.split('\x00')
 
-  @recipients.setter
-  def recipients(self, values):
-    self._recipients = '\x00'.join([str(value) for value in values])
+class CallEvent(Event):
+  """Phone calls, voicemails, video chats, etc."""
+
+  end = models.BigIntegerField(null=False)
+  # subtype examples: "received", "voicemail", "missed"
+  subtype = models.CharField(max_length=31, blank=False)
+  sender = models.ForeignKey(Contact, null=True, on_delete=models.SET_NULL,
+                             related_name='sent_calls')
+  recipients = models.ManyToManyField(Contact, related_name='calls')
+
+  @classmethod
+  def create(cls, stream, format, start, end, subtype, sender, raw=None):
+    # Note: The recipients can only be added after the event is saved.
+    event = cls(stream=stream, format=format, start=start, end=end, subtype=subtype, sender=sender)
+    event.add_raw(raw)
+    return event
+
+  @property
+  def duration(self):
+    return self.end-self.start
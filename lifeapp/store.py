@@ -0,0 +1,796 @@
+"""Bulk import `events.Event`s into the lifeapp database, and read them back out.
+Django must be set up before importing this (see `setup()` in `lifeapp`)."""
+import collections
+import datetime
+import heapq
+import json
+import logging
+from django.db import connection, transaction, DatabaseError
+from django.db.models import Count, Max, Min, Q, Sum
+from django.utils import timezone
+import events
+import contacts
+from lifeapp import models
+from lifeapp import fts
+log = logging.getLogger(__name__)
+
+# How many rows to buffer before each batch INSERT.
+BATCH_SIZE = 5000
+# How many rows to insert in each transaction.
+TRANSACTION_SIZE = 200000
+# How many rows to read from each table at a time.
+READ_CHUNK_SIZE = 2000
+# The default number of events in a page of the timeline (see `load_page()`).
+PAGE_SIZE = 100
+# The fields written by the importer, in the order of the values in its rows.
+IMPORT_FIELDS = {
+  models.MessageEvent: ('id', 'stream', 'format', 'start', 'month', 'sender', 'message', 'echo'),
+  models.CallEvent: ('id', 'stream', 'format', 'start', 'month', 'end', 'subtype', 'sender'),
+}
+# The fields which identify an event within a (month, format) partition, for skipping events which
+# are already stored. The sender isn't included, since new events refer to the drivers' local
+# `Contact`s until the import finishes.
+DEDUP_FIELDS = {
+  models.MessageEvent: ('stream', 'start', 'message', 'echo'),
+  models.CallEvent: ('stream', 'start', 'end', 'subtype'),
+}
+# The streams of events the database doesn't store, but counts in the `DailyActivity` rollups.
+COUNTED_STREAMS = ('location', 'track')
+# The rollups' days are in the site's time zone (`TIME_ZONE` in the settings), like /api/timeline.
+# SQLite can't convert to it, so the events are counted per quarter hour (every UTC offset is a
+# multiple of one), and then each quarter hour is assigned to its day (see `get_local_days()`).
+QUARTER_HOUR = 15*60
+# The names of the event models. Their order breaks ties between events with the same start time.
+KINDS = [model._meta.model_name for model in IMPORT_FIELDS]
+
+
+def import_events(all_events, book=None, replace=False, incremental=False, batch_size=BATCH_SIZE,
+                  transaction_size=TRANSACTION_SIZE):
+  """Write a stream of `events.Event`s into the database.
+  `book` should be the `ContactBook` the `Event`s' `Contact`s are bound to. If it came from
+  `load_contact_book()`, its `Contact`s will be matched with their existing rows.
+  If `replace` is True, the events replace any existing ones from the same format in the months
+  they cover. Otherwise, they're added to them, skipping any which are already stored.
+  Set `incremental` if the `Event`s are only the new ones since the last import (see
+  `Importer.add_counts()`).
+  Returns the number of `Event`s written."""
+  importer = Importer(
+    book, replace=replace, incremental=incremental, batch_size=batch_size,
+    transaction_size=transaction_size
+  )
+  for event in all_events:
+    importer.add(event)
+  importer.finish()
+  return importer.count
+
+
+class Importer:
+  """Buffer `Event`s and write them in batches, inside large transactions.
+  This skips building model instances and uses `executemany()` with one prepared INSERT per table.
+  Django's `bulk_create()` spends most of its time compiling SQL for each row, which limits it to
+  roughly ten thousand rows per second.
+  The `Event`s from a driver refer to its own local `Contact`s until the driver finishes, so they're
+  written with rows for those local `Contact`s. `finish()` then translates the local rows into the
+  rows for the final, bound `Contact`s.
+  If `replace` is True, each (month, format) partition the `Event`s fall in is rewritten: the events
+  already stored in it are deleted. Partitions the import doesn't touch are left alone. Otherwise,
+  `Event`s matching one already stored in their partition (by `DEDUP_FIELDS`) are skipped.
+  `Event`s in the `COUNTED_STREAMS` aren't stored, only counted (see `add_counts()`)."""
+
+  def __init__(self, book=None, replace=False, incremental=False, batch_size=BATCH_SIZE,
+               transaction_size=TRANSACTION_SIZE):
+    self.replace = replace
+    self.incremental = incremental
+    self.batch_size = batch_size
+    self.transaction_size = transaction_size
+    self.count = 0
+    self.duplicates = 0
+    # The (month, format) partitions of each table that this import has written to.
+    self.touched = {model: set() for model in IMPORT_FIELDS}
+    # The touched partitions whose old events haven't been deleted yet.
+    self._to_clear = {model: [] for model in IMPORT_FIELDS}
+    # The `DEDUP_FIELDS` of the events stored in each touched partition before this import.
+    self._existing = {model: {} for model in IMPORT_FIELDS}
+    self.skipped = collections.Counter()
+    # The number of `Event`s in the `COUNTED_STREAMS`, per (quarter hour, stream, format).
+    self.counts = collections.Counter()
+    self._batches = {model: [] for model in IMPORT_FIELDS}
+    self._links = {model: [] for model in IMPORT_FIELDS}
+    self._in_transaction = 0
+    self._atomic = None
+    # The `ContactBinding`s of the `Event`s seen so far.
+    self._bindings = set()
+    # The row id for each `Contact` object (by `id()`), along with the `Contact`.
+    self._contact_rows = {}
+    if book is not None:
+      db_ids = set(models.Contact.objects.values_list('id', flat=True))
+      for contact in book:
+        if contact.id in db_ids:
+          self._contact_rows[id(contact)] = (contact.id, contact)
+    # The first row id each model had before this import.
+    self._first_ids = {model: get_max_id(model)+1 for model in self._batches}
+    self._next_ids = self._first_ids.copy()
+
+  def add(self, event):
+    if event.stream in COUNTED_STREAMS:
+      self.counts[(int(event.start)//QUARTER_HOUR, event.stream, event.format)] += 1
+      return
+    if isinstance(event, events.MessageEvent):
+      model = models.MessageEvent
+    elif isinstance(event, events.CallEvent):
+      model = models.CallEvent
+    else:
+      self.skipped[type(event).__name__] += 1
+      return
+    start = int(event.start)
+    month = get_month(start)
+    partition = (month, event.format)
+    if partition not in self.touched[model]:
+      self.touched[model].add(partition)
+      if self.replace:
+        self._to_clear[model].append(partition)
+      else:
+        self._existing[model][partition] = load_keys(model, partition, self._first_ids[model])
+    if not self.replace:
+      if model is models.MessageEvent:
+        key = (event.stream, start, event.message, event.echo)
+      elif model is models.CallEvent:
+        key = (event.stream, start, int(event.end), event.subtype)
+      if key in self._existing[model][partition]:
+        self.duplicates += 1
+        return
+    if event.book is not None:
+      self._bindings.add(event.book)
+    # Assign the id here instead of letting the database do it, so we know it for the recipients.
+    event_id = self._next_ids[model]
+    self._next_ids[model] += 1
+    sender_id = self.contact_row(event.sender)
+    if model is models.MessageEvent:
+      row = (event_id, event.stream, event.format, start, month, sender_id, event.message,
+             event.echo)
+    elif model is models.CallEvent:
+      row = (event_id, event.stream, event.format, start, month, int(event.end), event.subtype,
+             sender_id)
+    self._batches[model].append(row)
+    # Remove duplicates, but keep the order (the join table rows are read back in id order).
+    recipient_ids = dict.fromkeys([self.contact_row(recipient) for recipient in event.recipients])
+    for recipient_id in recipient_ids:
+      self._links[model].append((event_id, recipient_id))
+    if len(self._batches[model]) >= self.batch_size:
+      self.flush(model)
+
+  def contact_row(self, contact):
+    """Get the row id for a `Contact`, creating the row if it doesn't exist yet."""
+    if contact is None:
+      return None
+    try:
+      return self._contact_rows[id(contact)][0]
+    except KeyError:
+      pass
+    row = models.Contact(**contact_to_fields(contact))
+    row.save()
+    self._contact_rows[id(contact)] = (row.id, contact)
+    return row.id
+
+  def flush(self, model):
+    batch = self._batches[model]
+    if not batch:
+      return
+    if self._atomic is None:
+      self._atomic = transaction.atomic()
+      self._atomic.__enter__()
+    # Only delete events from before this import.
+    clear_partitions(model, self._to_clear[model], self._first_ids[model])
+    self._to_clear[model] = []
+    bulk_insert(model, batch)
+    bulk_insert(model.recipients.through, self._links[model], get_link_fields(model))
+    self.count += len(batch)
+    self._in_transaction += len(batch)
+    self._batches[model] = []
+    self._links[model] = []
+    if self._in_transaction >= self.transaction_size:
+      self.commit()
+
+  def commit(self):
+    if self._atomic is not None:
+      self._atomic.__exit__(None, None, None)
+      self._atomic = None
+    self._in_transaction = 0
+
+  def finish(self):
+    for model in self._batches:
+      self.flush(model)
+    self.commit()
+    with transaction.atomic():
+      self.translate_contacts()
+      self.save_contacts()
+      all_months = set()
+      for model, partitions in self.touched.items():
+        months = set([month for month, format in partitions])
+        update_manifest(model, months)
+        all_months |= months
+      update_rollups(all_months)
+      self.add_counts()
+      models.ImportRun.objects.create(count=self.count)
+    if self.counts:
+      log.info(f'Info: Counted {sum(self.counts.values())} location events in the daily activity '
+               f'(their points aren\'t stored).')
+    if self.duplicates:
+      log.info(f'Info: Skipped {self.duplicates} events which were already in the database.')
+    for type_name, count in self.skipped.items():
+      log.warning(f'Warning: Skipped {count} {type_name}s, which the database can\'t store yet.')
+
+  def add_counts(self):
+    """Write the counts of the `Event`s in the `COUNTED_STREAMS` to the `DailyActivity` rollups.
+    The counts are kept separately for each format.
+    Since the `Event`s aren't stored, there's no way to tell which were already counted. So for an
+    incremental import, the counts are added to the existing ones. Otherwise, the import is assumed
+    to include all the data from each of its formats for the days it covers, and its counts replace
+    the existing ones from those formats. So re-importing one format doesn't affect the counts from
+    the others, but importing part of a format's data (without --incremental) replaces the counts
+    from the rest of it on the same days."""
+    if not self.counts:
+      return
+    local_days = get_local_days([quarter for quarter, stream, format in self.counts])
+    counts = collections.Counter()
+    for (quarter, stream, format), count in self.counts.items():
+      counts[(local_days[quarter], stream, format)] += count
+    existing = models.DailyActivity.objects.filter(
+      contact__isnull=True, stream__in=COUNTED_STREAMS,
+      format__in=set([format for day, stream, format in counts]),
+      day__gte=min(local_days.values()), day__lte=max(local_days.values()),
+    )
+    rows = {(row.day, row.stream, row.format): row for row in existing}
+    new_rows = []
+    updated_rows = []
+    for (day, stream, format), count in counts.items():
+      row = rows.get((day, stream, format))
+      if row is None:
+        new_rows.append(models.DailyActivity(
+          day=day, stream=stream, format=format, contact=None, count=count
+        ))
+      else:
+        if self.incremental:
+          row.count += count
+        else:
+          row.count = count
+        updated_rows.append(row)
+    models.DailyActivity.objects.bulk_update(updated_rows, ['count'], batch_size=500)
+    models.DailyActivity.objects.bulk_create(new_rows, batch_size=500)
+
+  def translate_contacts(self):
+    """Point the events at the rows for the drivers' final `Contact`s, instead of their local ones.
+    This only touches rows that need to change, using the indices on the contact ids."""
+    translation = {}
+    for binding in self._bindings:
+      if binding.table is None:
+        continue
+      for cid, final_contact in binding.table.items():
+        local_contact = binding.local.get_by_id(cid)
+        if final_contact is local_contact or id(local_contact) not in self._contact_rows:
+          continue
+        local_row_id = self._contact_rows.pop(id(local_contact))[0]
+        translation[local_row_id] = self.contact_row(final_contact)
+    if not translation:
+      return
+    log.info(f'Info: Translating {len(translation)} contacts to their final versions.')
+    with connection.cursor() as cursor:
+      for model, first_id in self._first_ids.items():
+        table = connection.ops.quote_name(model._meta.db_table)
+        through = model.recipients.through
+        through_table = connection.ops.quote_name(through._meta.db_table)
+        event_column, contact_column = [
+          connection.ops.quote_name(through._meta.get_field(name).column)
+          for name in get_link_fields(model)
+        ]
+        for old_id, new_id in translation.items():
+          cursor.execute(
+            f'UPDATE {table} SET sender_id = %s WHERE sender_id = %s AND id >= %s',
+            (new_id, old_id, first_id)
+          )
+          # If an event already lists the new contact, the update would create a duplicate link.
+          # Skip those and just delete the old link.
+          cursor.execute(
+            f'UPDATE OR IGNORE {through_table} SET {contact_column} = %s '
+            f'WHERE {contact_column} = %s AND {event_column} >= %s',
+            (new_id, old_id, first_id)
+          )
+          cursor.execute(f'DELETE FROM {through_table} WHERE {contact_column} = %s', (old_id,))
+    models.Contact.objects.filter(id__in=translation.keys()).delete()
+
+  def save_contacts(self):
+    """Write any new info the `Contact`s gained during the import."""
+    rows = []
+    for row_id, contact in self._contact_rows.values():
+      rows.append(models.Contact(id=row_id, **contact_to_fields(contact)))
+    models.Contact.objects.bulk_update(rows, ['name', 'is_me', 'data'], batch_size=500)
+
+
+def bulk_insert(model, rows, field_names=None):
+  """Insert tuples of values for the given fields (by default, the ones in `IMPORT_FIELDS`)."""
+  if not rows:
+    return
+  if field_names is None:
+    field_names = IMPORT_FIELDS[model]
+  fields = [model._meta.get_field(name) for name in field_names]
+  columns = ', '.join([connection.ops.quote_name(field.column) for field in fields])
+  placeholders = ', '.join(['%s'] * len(fields))
+  table = connection.ops.quote_name(model._meta.db_table)
+  with connection.cursor() as cursor:
+    cursor.executemany(f'INSERT INTO {table} ({columns}) VALUES ({placeholders})', rows)
+
+
+def get_month(timestamp):
+  """Get the month partition key of a timestamp: an integer like 201907 (for July 2019, in UTC)."""
+  dt = datetime.datetime.utcfromtimestamp(timestamp)
+  return dt.year*100 + dt.month
+
+
+def get_month_range(month):
+  """Get the (begin, end) timestamps of a month partition key. `end` is the next month's start."""
+  year, month_num = divmod(month, 100)
+  begin = datetime.datetime(year, month_num, 1, tzinfo=datetime.timezone.utc)
+  if month_num == 12:
+    end = datetime.datetime(year+1, 1, 1, tzinfo=datetime.timezone.utc)
+  else:
+    end = datetime.datetime(year, month_num+1, 1, tzinfo=datetime.timezone.utc)
+  return int(begin.timestamp()), int(end.timestamp())
+
+
+def clear_partitions(model, partitions, before_id):
+  """Delete the events in the given (month, format) partitions, if their row id is before
+  `before_id`. This also deletes their recipient links (the search index has its own triggers)."""
+  if not partitions:
+    return
+  log.info(f'Info: Rewriting {len(partitions)} {model._meta.verbose_name} partitions.')
+  table = connection.ops.quote_name(model._meta.db_table)
+  through = model.recipients.through
+  through_table = connection.ops.quote_name(through._meta.db_table)
+  event_column = connection.ops.quote_name(through._meta.get_field(get_link_fields(model)[0]).column)
+  # Uses the (month, start) index.
+  where = 'month = %s AND format = %s AND id < %s'
+  with connection.cursor() as cursor:
+    for month, format in partitions:
+      params = (month, format, before_id)
+      cursor.execute(
+        f'DELETE FROM {through_table} WHERE {event_column} IN (SELECT id FROM {table} WHERE {where})',
+        params
+      )
+      cursor.execute(f'DELETE FROM {table} WHERE {where}', params)
+
+
+def load_keys(model, partition, before_id):
+  """Get the `DEDUP_FIELDS` of the events in a (month, format) partition whose row id is before
+  `before_id`, as a set of tuples."""
+  month, format = partition
+  rows = model.objects.filter(month=month, format=format, id__lt=before_id)
+  return set(rows.values_list(*DEDUP_FIELDS[model]))
+
+
+def update_manifest(model, months):
+  """Recount the events in the given months, and store the results in the `Partition` manifest."""
+  if not months:
+    return
+  kind = model._meta.model_name
+  models.Partition.objects.filter(kind=kind, month__in=months).delete()
+  stats = (
+    model.objects.filter(month__in=months).values('month', 'format', 'stream')
+    .annotate(count=Count('id'), first=Min('start'), last=Max('start')).order_by()
+  )
+  partitions = [models.Partition(kind=kind, **stat) for stat in stats]
+  models.Partition.objects.bulk_create(partitions, batch_size=500)
+
+
+def update_rollups(months):
+  """Recompute the `DailyActivity` rollups for every day in the given months.
+  The months are in UTC, like the partitions, but the days are in the site's time zone. So this
+  recomputes every local day which overlaps the months, including the events from the neighboring
+  months on the days at the edges.
+  This aggregates in SQL, using the start time index, so it only reads the days it recomputes.
+  The counts of the `COUNTED_STREAMS` can't be recomputed, so they're left alone."""
+  if not months:
+    return
+  # The local days to recompute, and the (UTC) time ranges to read for them. Each range is padded by
+  # two days, which covers the whole of the local days at its ends in any time zone.
+  day_ranges = []
+  time_ranges = []
+  for month in sorted(months):
+    begin, end = get_month_range(month)
+    day_ranges.append((get_local_day(begin), get_local_day(end-1)))
+    begin -= 2*86400
+    end += 2*86400
+    if time_ranges and begin <= time_ranges[-1][1]:
+      time_ranges[-1] = (time_ranges[-1][0], end)
+    else:
+      time_ranges.append((begin, end))
+  in_ranges = ' OR '.join(['(start >= %s AND start < %s)'] * len(time_ranges))
+  range_params = [time for time_range in time_ranges for time in time_range]
+  counts = collections.Counter()
+  with connection.cursor() as cursor:
+    for model in IMPORT_FIELDS:
+      table = connection.ops.quote_name(model._meta.db_table)
+      through = model.recipients.through
+      through_table = connection.ops.quote_name(through._meta.db_table)
+      event_column, contact_column = [
+        connection.ops.quote_name(through._meta.get_field(name).column)
+        for name in get_link_fields(model)
+      ]
+      # The totals for each quarter hour and stream.
+      cursor.execute(
+        f'SELECT start / {QUARTER_HOUR}, stream, COUNT(*) FROM {table} WHERE {in_ranges} '
+        f'GROUP BY 1, 2',
+        range_params
+      )
+      for quarter, stream, count in cursor.fetchall():
+        counts[(quarter, stream, None)] += count
+      # The counts for each participant. The UNION removes duplicates, so someone who's both the
+      # sender and a recipient of an event only counts once.
+      cursor.execute(
+        f'SELECT e.start / {QUARTER_HOUR}, e.stream, p.contact_id, COUNT(*) FROM {table} e JOIN ('
+        f'  SELECT id AS event_id, sender_id AS contact_id FROM {table}'
+        f'  WHERE ({in_ranges}) AND sender_id IS NOT NULL'
+        f'  UNION SELECT {event_column}, {contact_column} FROM {through_table}'
+        f'  WHERE {event_column} IN (SELECT id FROM {table} WHERE {in_ranges})'
+        f') p ON p.event_id = e.id GROUP BY 1, 2, 3',
+        range_params*2
+      )
+      for quarter, stream, contact_id, count in cursor.fetchall():
+        counts[(quarter, stream, contact_id)] += count
+  local_days = get_local_days([quarter for quarter, stream, contact_id in counts])
+  day_counts = collections.Counter()
+  for (quarter, stream, contact_id), count in counts.items():
+    day = local_days[quarter]
+    # Skip the padding.
+    if any(first_day <= day <= last_day for first_day, last_day in day_ranges):
+      day_counts[(day, stream, contact_id)] += count
+  in_days = Q()
+  for first_day, last_day in day_ranges:
+    in_days |= Q(day__gte=first_day, day__lte=last_day)
+  models.DailyActivity.objects.filter(in_days).exclude(stream__in=COUNTED_STREAMS).delete()
+  rows = [
+    models.DailyActivity(day=day, stream=stream, contact_id=contact_id, count=count)
+    for (day, stream, contact_id), count in day_counts.items()
+  ]
+  models.DailyActivity.objects.bulk_create(rows, batch_size=500)
+
+
+def get_local_day(timestamp):
+  """Get the `datetime.date` of a timestamp in the site's time zone."""
+  return datetime.datetime.fromtimestamp(timestamp, timezone.get_current_timezone()).date()
+
+
+def get_local_days(quarters):
+  """Map each quarter hour (a timestamp divided by `QUARTER_HOUR`) to its day in the site's time
+  zone."""
+  return {quarter: get_local_day(quarter*QUARTER_HOUR) for quarter in set(quarters)}
+
+
+def load_activity(begin=None, end=None, stream=None, contact_ids=None):
+  """Get the daily event counts from the `DailyActivity` rollups, as a dict mapping each day to a
+  dict of counts per stream. `begin` and `end` are `datetime.date`s (inclusive).
+  If `contact_ids` is given, only count events involving those contacts. Events involving more
+  than one of them are counted once for each."""
+  rows = models.DailyActivity.objects.all()
+  if begin is not None:
+    rows = rows.filter(day__gte=begin)
+  if end is not None:
+    rows = rows.filter(day__lte=end)
+  if stream is not None:
+    rows = rows.filter(stream=stream)
+  if contact_ids is None:
+    rows = rows.filter(contact__isnull=True)
+  else:
+    rows = rows.filter(contact_id__in=contact_ids)
+  rows = rows.values('day', 'stream').annotate(total=Sum('count')).order_by('day', 'stream')
+  days = collections.OrderedDict()
+  for row in rows:
+    days.setdefault(row['day'], {})[row['stream']] = row['total']
+  return days
+
+
+def find_partitions(begin=None, end=None, stream=None):
+  """Use the manifest to find which months hold events in the given range.
+  Returns a dict mapping each model to the set of months to read."""
+  partitions = models.Partition.objects.all()
+  if begin is not None:
+    partitions = partitions.filter(last__gte=begin)
+  if end is not None:
+    partitions = partitions.filter(first__lte=end)
+  if stream is not None:
+    partitions = partitions.filter(stream=stream)
+  months = {model: set() for model in IMPORT_FIELDS}
+  kinds = {model._meta.model_name: model for model in IMPORT_FIELDS}
+  for kind, month in partitions.values_list('kind', 'month'):
+    months[kinds[kind]].add(month)
+  return months
+
+
+def load_marks(format):
+  """Get the high-water marks recorded for a format, in the form `drivers.get_events()` takes."""
+  marks = {}
+  for mark in models.SourceMark.objects.filter(format=format):
+    marks[mark.source] = {'last': mark.last}
+    if mark.size is not None:
+      marks[mark.source]['size'] = mark.size
+  return marks
+
+
+def save_marks(format, marks):
+  """Record the high-water marks for a format, as filled in by `drivers.get_events()`."""
+  existing = dict(models.SourceMark.objects.filter(format=format).values_list('source', 'id'))
+  new_rows = []
+  updated_rows = []
+  for source, mark in marks.items():
+    row = models.SourceMark(format=format, source=source, last=mark['last'], size=mark.get('size'))
+    if source in existing:
+      row.id = existing[source]
+      updated_rows.append(row)
+    else:
+      new_rows.append(row)
+  with transaction.atomic():
+    models.SourceMark.objects.bulk_update(updated_rows, ['last', 'size'], batch_size=500)
+    models.SourceMark.objects.bulk_create(new_rows, batch_size=500)
+
+
+def get_link_fields(model):
+  """Get the names of the event and contact fields of the model's recipients join table."""
+  return (model._meta.model_name, 'contact')
+
+
+def get_max_id(model):
+  last = model.objects.order_by('-id').values_list('id', flat=True).first()
+  if last is None:
+    return 0
+  return last
+
+
+def contact_to_fields(contact):
+  return {
+    'name': contact.name or '',
+    'is_me': contact.is_me,
+    'data': json.dumps(contact.to_dict()['values']),
+  }
+
+
+def row_to_contact(row):
+  return contacts.Contact.from_dict({'id': row.id, 'is_me': row.is_me, 'values': json.loads(row.data)})
+
+
+def load_contact_book():
+  """Load all the `Contact`s in the database into a `ContactBook`. Their `id`s are their row ids."""
+  book = contacts.ContactBook()
+  for row in models.Contact.objects.iterator():
+    book.add(row_to_contact(row))
+  return book
+
+
+def find_contact_ids(person, exact_person=False, book=None):
+  """Find the row ids of all `Contact`s with a name matching `person` (case-insensitive).
+  Unless `exact_person` is True, a substring of any of their names will match."""
+  if book is None:
+    book = load_contact_book()
+  query = person.lower()
+  contact_ids = []
+  for contact in book:
+    for name in contact['names']:
+      if (exact_person and name.lower() == query) or (not exact_person and query in name.lower()):
+        contact_ids.append(contact.id)
+        break
+  return contact_ids
+
+
+def load_events(begin=None, end=None, stream=None, person=None, exact_person=False, search=None):
+  """Read `events.Event`s from the database, sorted by start time.
+  If `search` is given, only return `MessageEvent`s whose text matches it (see `search_rows()`).
+  Only the monthly partitions which overlap the time range are read.
+  This only keeps one chunk of rows from each table in memory at a time.
+  An invalid `search` raises `ValueError` here, before any events are read. Matches are returned in
+  time order, not ranked by relevance."""
+  if search is not None:
+    check_search(search)
+  return _load_events(begin, end, stream, person, exact_person, search)
+
+
+def _load_events(begin, end, stream, person, exact_person, search):
+  book = load_contact_book()
+  contact_ids = None
+  if person is not None:
+    contact_ids = find_contact_ids(person, exact_person, book=book)
+  if search is None:
+    models_to_read = IMPORT_FIELDS.keys()
+  else:
+    models_to_read = (models.MessageEvent,)
+  all_months = find_partitions(begin, end, stream)
+  querysets = []
+  for model in models_to_read:
+    months = all_months[model]
+    if not months:
+      continue
+    rows = filter_rows(model.objects.filter(month__in=months), begin, end, stream, contact_ids)
+    if search is not None:
+      rows = search_rows(rows, search)
+    querysets.append(iter_rows(model, rows))
+  for row in heapq.merge(*querysets, key=lambda row: row.start):
+    yield to_event(row, book)
+
+
+def filter_rows(rows, begin=None, end=None, stream=None, contact_ids=None):
+  if begin is not None:
+    rows = rows.filter(start__gte=begin)
+  if end is not None:
+    rows = rows.filter(start__lte=end)
+  if stream is not None:
+    rows = rows.filter(stream=stream)
+  if contact_ids is not None:
+    # Both of these are index lookups: on the sender column, and on the recipients join table.
+    through = rows.model.recipients.through
+    event_field, contact_field = get_link_fields(rows.model)
+    links = through.objects.filter(**{contact_field+'_id__in': contact_ids})
+    rows = rows.filter(Q(sender_id__in=contact_ids) | Q(id__in=links.values(event_field+'_id')))
+  return rows
+
+
+def search_rows(rows, query):
+  """Filter a `MessageEvent` queryset to the messages whose text matches an FTS5 `query`.
+  The query syntax allows boolean operators (AND, OR, NOT), "quoted phrases", prefixes (word*),
+  and NEAR(). Bare words must all match, in any order."""
+  # RawSQL inside an `__in` lookup gets wrapped in a second set of parentheses, which makes SQLite
+  # treat the subquery as a single value.
+  table = connection.ops.quote_name(rows.model._meta.db_table)
+  return rows.extra(
+    where=[f'{table}.id IN (SELECT rowid FROM {fts.TABLE} WHERE {fts.TABLE} MATCH %s)'],
+    params=(query,)
+  )
+
+
+def check_search(query):
+  """Raise a `ValueError` if `query` isn't valid FTS5 syntax."""
+  with connection.cursor() as cursor:
+    try:
+      cursor.execute(f'SELECT rowid FROM {fts.TABLE} WHERE {fts.TABLE} MATCH %s LIMIT 1',
+                     (query,))
+    except DatabaseError as error:
+      raise ValueError(f'Invalid search query {query!r}: {error}')
+
+
+def iter_rows(model, rows, chunk_size=READ_CHUNK_SIZE):
+  """Iterate through a queryset in (start, id) order, one chunk at a time.
+  Each row gets a `recipient_ids` attribute listing the row ids of its recipients."""
+  rows = rows.order_by('start', 'id')
+  last = None
+  while True:
+    if last is None:
+      chunk = list(rows[:chunk_size])
+    else:
+      after_last = Q(start__gt=last.start) | Q(start=last.start, id__gt=last.id)
+      chunk = list(rows.filter(after_last)[:chunk_size])
+    if not chunk:
+      break
+    add_recipient_ids(model, chunk)
+    yield from chunk
+    last = chunk[-1]
+
+
+def add_recipient_ids(model, rows):
+  """Give each row a `recipient_ids` attribute listing the row ids of its recipients, in order."""
+  through = model.recipients.through
+  event_field, contact_field = get_link_fields(model)
+  recipients = collections.defaultdict(list)
+  links = through.objects.filter(**{event_field+'_id__in': [row.id for row in rows]}).order_by('id')
+  for event_id, contact_id in links.values_list(event_field+'_id', contact_field+'_id'):
+    recipients[event_id].append(contact_id)
+  for row in rows:
+    row.recipient_ids = recipients[row.id]
+
+
+def load_page(after=None, limit=PAGE_SIZE, begin=None, end=None, stream=None, contact_ids=None):
+  """Get one page of event rows from all the tables, in the order of their cursors.
+  A cursor is a (start, kind, id) tuple, where kind is the model name. Paging is done by seeking to
+  the cursor with the (start, id) indices instead of with OFFSET, so every page is equally fast.
+  `after` is the cursor of the last row of the previous page.
+  Returns the rows (with `recipient_ids`), and the cursor for the next page (None if there's no
+  next page)."""
+  if after is not None and (begin is None or after[0] > begin):
+    range_begin = after[0]
+  else:
+    range_begin = begin
+  all_months = find_partitions(range_begin, end, stream)
+  page = []
+  for model in IMPORT_FIELDS:
+    months = all_months[model]
+    if not months:
+      continue
+    rows = filter_rows(model.objects.filter(month__in=months), begin, end, stream, contact_ids)
+    if after is not None:
+      rows = rows.filter(after_cursor(model, after))
+    # Get one more than the limit, to tell whether there's a next page.
+    page.extend(rows.order_by('start', 'id')[:limit+1])
+  page.sort(key=lambda row: get_cursor_order(get_cursor(row)))
+  if len(page) > limit:
+    page = page[:limit]
+    next_cursor = get_cursor(page[-1])
+  else:
+    next_cursor = None
+  for model in IMPORT_FIELDS:
+    add_recipient_ids(model, [row for row in page if isinstance(row, model)])
+  return page, next_cursor
+
+
+def after_cursor(model, cursor):
+  """Make a filter for the rows of a table which come after the cursor."""
+  start, kind, row_id = cursor
+  rank = KINDS.index(model._meta.model_name)
+  cursor_rank = KINDS.index(kind)
+  if rank < cursor_rank:
+    return Q(start__gt=start)
+  elif rank > cursor_rank:
+    return Q(start__gte=start)
+  else:
+    return Q(start__gt=start) | Q(start=start, id__gt=row_id)
+
+
+def get_cursor(row):
+  return (row.start, row._meta.model_name, row.id)
+
+
+def get_cursor_order(cursor):
+  start, kind, row_id = cursor
+  return (start, KINDS.index(kind), row_id)
+
+
+def format_cursor(cursor):
+  return '{}:{}:{}'.format(*cursor)
+
+
+def parse_cursor(cursor_str):
+  """Parse a cursor from `format_cursor()`. Raises `ValueError` if it's invalid."""
+  try:
+    start, kind, row_id = cursor_str.split(':')
+    cursor = (int(start), kind, int(row_id))
+  except ValueError:
+    raise ValueError(f'Invalid cursor {cursor_str!r}.')
+  if kind not in KINDS:
+    raise ValueError(f'Invalid cursor {cursor_str!r}: Unknown kind {kind!r}.')
+  return cursor
+
+
+def get_last_modified(begin=None, end=None, stream=None):
+  """Get the last time anything in the range could have changed: the last write to any partition in
+  it, or the last import (which can change contacts, or delete partitions). Returns None if there
+  are neither."""
+  partitions = models.Partition.objects.all()
+  if begin is not None:
+    partitions = partitions.filter(last__gte=begin)
+  if end is not None:
+    partitions = partitions.filter(first__lte=end)
+  if stream is not None:
+    partitions = partitions.filter(stream=stream)
+  times = [
+    partitions.aggregate(updated=Max('updated'))['updated'],
+    models.ImportRun.objects.aggregate(finished=Max('finished'))['finished'],
+  ]
+  times = [time for time in times if time is not None]
+  if not times:
+    return None
+  return max(times)
+
+
+def get_version():
+  """Get a number which changes with every import (the number of the last one)."""
+  return models.ImportRun.objects.aggregate(version=Max('id'))['version'] or 0
+
+
+def to_event(row, book):
+  """Convert a model instance back into an `events.Event`, with `Contact`s from `book`."""
+  sender = book.get_by_id(row.sender_id)
+  recipients = [book.get_by_id(contact_id) for contact_id in row.recipient_ids]
+  if isinstance(row, models.MessageEvent):
+    return events.MessageEvent(
+      stream=row.stream, format=row.format, start=row.start, sender=sender, recipients=recipients,
+      message=row.message, echo=row.echo
+    )
+  elif isinstance(row, models.CallEvent):
+    return events.CallEvent(
+      stream=row.stream, format=row.format, start=row.start, end=row.end, subtype=row.subtype,
+      sender=sender, recipients=recipients
+    )
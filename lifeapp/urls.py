@@ -0,0 +1,7 @@
+from django.urls import path
+from lifeapp import views
+
+urlpatterns = [
+  path('api/timeline', views.timeline, name='timeline'),
+  path('api/activity', views.activity, name='activity'),
+]
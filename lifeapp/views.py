@@ -1,3 +1,174 @@
-from django.shortcuts import render
+import collections
+import datetime
+import hashlib
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.http import condition, require_GET
+from lifeapp import models
+from lifeapp import store
 
-# Create your views here.
+# The most events a client can ask for in one page.
+MAX_PAGE_SIZE = 1000
+
+
+class QueryError(ValueError):
+  pass
+
+
+def parse_timeline_query(params):
+  """Read the timeline query parameters. Raises `QueryError` for invalid values."""
+  query = {}
+  try:
+    query['limit'] = int(params.get('limit', store.PAGE_SIZE))
+    query['begin'] = int(params['begin']) if 'begin' in params else None
+    query['end'] = int(params['end']) if 'end' in params else None
+  except ValueError as error:
+    raise QueryError(f'Invalid number: {error}')
+  if not 1 <= query['limit'] <= MAX_PAGE_SIZE:
+    raise QueryError(f'limit must be between 1 and {MAX_PAGE_SIZE}.')
+  try:
+    query['after'] = store.parse_cursor(params['after']) if 'after' in params else None
+  except ValueError as error:
+    raise QueryError(str(error))
+  query['stream'] = params.get('stream') or None
+  query['person'] = params.get('person') or None
+  query['exact_person'] = params.get('exact_person') in ('1', 'true')
+  group = params.get('group')
+  if group not in (None, 'day'):
+    raise QueryError(f'Invalid group {group!r}. The only option is "day".')
+  query['group'] = group
+  return query
+
+
+def timeline_last_modified(request):
+  try:
+    query = parse_timeline_query(request.GET)
+  except QueryError:
+    return None
+  # Anything written after the start of the page can change it.
+  begin = query['begin']
+  if query['after'] is not None and (begin is None or query['after'][0] > begin):
+    begin = query['after'][0]
+  return store.get_last_modified(begin, query['end'], query['stream'])
+
+
+def timeline_etag(request):
+  last_modified = timeline_last_modified(request)
+  if last_modified is None:
+    return None
+  # The version catches imports within the same second, which Last-Modified can't tell apart.
+  key = request.get_full_path()+'\n'+last_modified.isoformat()+'\n'+str(store.get_version())
+  return hashlib.sha1(key.encode('utf8')).hexdigest()
+
+
+@require_GET
+@condition(etag_func=timeline_etag, last_modified_func=timeline_last_modified)
+def timeline(request):
+  """A page of the timeline, as JSON.
+  Query parameters:
+    `after`:  The `next` cursor from the previous page. Omit it to get the first page.
+    `limit`:  How many events to return (default 100).
+    `begin`, `end`: Only include events starting in this range of timestamps.
+    `stream`: Only include events in this stream ('chat', 'sms', 'call', etc).
+    `person`: Only include events involving someone whose name contains this (case-insensitive).
+    `exact_person`: Set to 1 to make `person` require an exact match.
+    `group`:  Set to 'day' to group the events into days.
+  The response has the events (or the days, each with its events), and the `next` cursor, which is
+  null on the last page.
+  Responses include ETag and Last-Modified headers, which change whenever there's a new import."""
+  try:
+    query = parse_timeline_query(request.GET)
+  except QueryError as error:
+    return JsonResponse({'error': str(error)}, status=400)
+  contact_ids = None
+  if query['person'] is not None:
+    contact_ids = store.find_contact_ids(query['person'], query['exact_person'])
+  rows, next_cursor = store.load_page(
+    after=query['after'], limit=query['limit'], begin=query['begin'], end=query['end'],
+    stream=query['stream'], contact_ids=contact_ids
+  )
+  contact_ids = set()
+  for row in rows:
+    contact_ids.add(row.sender_id)
+    contact_ids.update(row.recipient_ids)
+  contacts = models.Contact.objects.in_bulk([cid for cid in contact_ids if cid is not None])
+  event_dicts = [row_to_dict(row, contacts) for row in rows]
+  data = {'next': None if next_cursor is None else store.format_cursor(next_cursor)}
+  if query['group'] == 'day':
+    data['days'] = group_by_day(event_dicts)
+  else:
+    data['events'] = event_dicts
+  return JsonResponse(data)
+
+
+@require_GET
+@condition(last_modified_func=lambda request: store.get_last_modified())
+def activity(request):
+  """The number of events on each day (in UTC), per stream, as JSON. This is for heatmaps: it reads
+  the daily rollups, so it's only a row per day and stream, however many events there are.
+  Query parameters:
+    `begin`, `end`: Only include days in this range (YYYY-MM-DD, inclusive).
+    `stream`, `person`, `exact_person`: The same as for `timeline()`.
+  When filtering by person, events involving more than one matching contact are counted once for
+  each."""
+  try:
+    begin = parse_date(request.GET.get('begin'))
+    end = parse_date(request.GET.get('end'))
+  except ValueError as error:
+    return JsonResponse({'error': f'Invalid date: {error}'}, status=400)
+  contact_ids = None
+  if request.GET.get('person'):
+    exact_person = request.GET.get('exact_person') in ('1', 'true')
+    contact_ids = store.find_contact_ids(request.GET['person'], exact_person)
+  days = store.load_activity(
+    begin=begin, end=end, stream=request.GET.get('stream') or None, contact_ids=contact_ids
+  )
+  totals = collections.Counter()
+  day_dicts = []
+  for day, counts in days.items():
+    day_dicts.append({'date': day.isoformat(), 'counts': counts})
+    totals.update(counts)
+  return JsonResponse({'days': day_dicts, 'totals': totals})
+
+
+def parse_date(date_str):
+  if not date_str:
+    return None
+  return datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
+
+
+def row_to_dict(row, contacts):
+  data = {
+    'cursor': store.format_cursor(store.get_cursor(row)),
+    'kind': row._meta.model_name,
+    'stream': row.stream,
+    'format': row.format,
+    'start': row.start,
+    'sender': contact_to_dict(contacts.get(row.sender_id)),
+    'recipients': [contact_to_dict(contacts.get(cid)) for cid in row.recipient_ids],
+  }
+  if isinstance(row, models.MessageEvent):
+    data['message'] = row.message
+    data['echo'] = row.echo
+  elif isinstance(row, models.CallEvent):
+    data['end'] = row.end
+    data['subtype'] = row.subtype
+  return data
+
+
+def contact_to_dict(contact):
+  if contact is None:
+    return None
+  return {'id': contact.id, 'name': str(contact), 'is_me': contact.is_me}
+
+
+def group_by_day(event_dicts):
+  """Group the events by their date (in the site's time zone)."""
+  tz = timezone.get_current_timezone()
+  days = []
+  for event in event_dicts:
+    date = datetime.datetime.fromtimestamp(event['start'], tz=tz).date().isoformat()
+    if not days or days[-1]['date'] != date:
+      days.append({'date': date, 'events': []})
+    days[-1]['events'].append(event)
+  return days
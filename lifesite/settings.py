@@ -106,6 +106,8 @@ AUTH_PASSWORD_VALIDATORS = [
 
 LANGUAGE_CODE = 'en-us'
 
+# The daily activity rollups (see lifeapp/store.py) count the events per day in this time zone.
+# After changing it, re-import the data with --replace to recount them.
 TIME_ZONE = 'UTC'
 
 USE_I18N = True
@@ -0,0 +1,131 @@
+"""Look up where you were at any point in time, from all the location data at once."""
+import array
+import bisect
+import events
+
+# The streams of location `Event`s.
+STREAMS = ('location', 'marker', 'track')
+# Between two points less than this many seconds apart, the location is interpolated.
+MAX_GAP = 60*60
+# Otherwise, the nearest point is used, if it's within this many seconds.
+TOLERANCE = 10*60
+# How far a `Cursor` steps forward before it switches to a binary search.
+CURSOR_STEPS = 8
+
+
+class LocationIndex:
+  """All the location points from every source, merged into one time-sorted sequence.
+  The points are kept in compact arrays (a timestamp and two E7 integers each, 16 bytes per point),
+  so there can be millions of them."""
+
+  def __init__(self, max_gap=MAX_GAP, tolerance=TOLERANCE):
+    self.max_gap = max_gap
+    self.tolerance = tolerance
+    self.times = array.array('d')
+    self.lats = array.array('i')
+    self.lons = array.array('i')
+    self._sorted = True
+
+  def __len__(self):
+    return len(self.times)
+
+  def add_point(self, timestamp, lat_e7, lon_e7):
+    if self.times and timestamp < self.times[-1]:
+      self._sorted = False
+    self.times.append(timestamp)
+    self.lats.append(lat_e7)
+    self.lons.append(lon_e7)
+
+  def add_event(self, event):
+    """Add the point(s) from a `LocationEvent` or `LocationTrackEvent`. Other `Event`s are ignored."""
+    if isinstance(event, events.LocationEvent):
+      self.add_point(event.start, event.lat_e7, event.lon_e7)
+    elif isinstance(event, events.LocationTrackEvent):
+      for timestamp, lat, lon, alt in event.track:
+        self.add_point(timestamp, round(lat*events.E7), round(lon*events.E7))
+
+  def collect(self, all_events):
+    """Add the location `Event`s from `all_events` as they pass through. Yields all the `Event`s."""
+    for event in all_events:
+      if event.stream in STREAMS:
+        self.add_event(event)
+      yield event
+
+  def sort(self):
+    """Put the points in time order. Done automatically before the first lookup."""
+    if self._sorted:
+      return
+    order = sorted(range(len(self.times)), key=self.times.__getitem__)
+    self.times = array.array('d', [self.times[i] for i in order])
+    self.lats = array.array('i', [self.lats[i] for i in order])
+    self.lons = array.array('i', [self.lons[i] for i in order])
+    self._sorted = True
+
+  def locate(self, timestamp):
+    """Where you were at `timestamp`, as a (latitude, longitude) tuple, or None if there's no
+    location data close enough in time."""
+    self.sort()
+    return self._locate_at(bisect.bisect_right(self.times, timestamp), timestamp)
+
+  def locate_all(self, timestamps):
+    """Look up the location for each of a sorted series of timestamps, in one pass through the
+    index. Yields a location (or None) for each."""
+    cursor = self.cursor()
+    for timestamp in timestamps:
+      yield cursor.locate(timestamp)
+
+  def cursor(self):
+    """Get a `Cursor`, for looking up timestamps in order."""
+    self.sort()
+    return Cursor(self)
+
+  def _locate_at(self, i, timestamp):
+    """Find the location at `timestamp`, given the index of the first point after it."""
+    times = self.times
+    before = i-1 if i > 0 else None
+    after = i if i < len(times) else None
+    if before is not None and after is not None and times[after]-times[before] <= self.max_gap:
+      span = times[after] - times[before]
+      if span == 0:
+        fraction = 0
+      else:
+        fraction = (timestamp - times[before])/span
+      lat = self.lats[before] + (self.lats[after]-self.lats[before])*fraction
+      lon = self.lons[before] + (self.lons[after]-self.lons[before])*fraction
+      return lat/events.E7, lon/events.E7
+    # Otherwise, take the nearest point, if it's close enough.
+    nearest = None
+    if before is not None and timestamp - times[before] <= self.tolerance:
+      nearest = before
+    if after is not None and times[after] - timestamp <= self.tolerance:
+      if nearest is None or times[after] - timestamp < timestamp - times[before]:
+        nearest = after
+    if nearest is None:
+      return None
+    return self.lats[nearest]/events.E7, self.lons[nearest]/events.E7
+
+
+class Cursor:
+  """Looks up locations for timestamps in increasing order, by stepping forward through the index
+  instead of searching it each time. Going back in time is allowed, but needs a search."""
+
+  def __init__(self, index):
+    self.index = index
+    self.position = 0
+    self.last_timestamp = None
+
+  def locate(self, timestamp):
+    times = self.index.times
+    if self.last_timestamp is not None and timestamp < self.last_timestamp:
+      self.position = bisect.bisect_right(times, timestamp)
+    else:
+      # Usually the next point is close by. If not, search for it.
+      steps = 0
+      while self.position < len(times) and times[self.position] <= timestamp:
+        self.position += 1
+        steps += 1
+        if steps >= CURSOR_STEPS:
+          self.position = bisect.bisect_right(times, timestamp, self.position)
+          break
+    self.last_timestamp = timestamp
+    return self.index._locate_at(self.position, timestamp)
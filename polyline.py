@@ -0,0 +1,89 @@
+"""A compact text encoding for location tracks, based on Google's encoded polyline format:
+https://developers.google.com/maps/documentation/utilities/polylinealgorithm
+Each number is rounded to an integer and stored as the difference from the previous one, written as
+printable ASCII characters holding 5 bits each. The points in a track are close together, so most
+differences only take 1-3 characters, instead of the ~18 it takes to write a float in JSON."""
+
+# The scale of each field: coordinates in 1e-5 degrees (about a meter, like Google's format),
+# times in milliseconds, and altitudes in tenths of a meter.
+COORD_SCALE = 100000
+TIME_SCALE = 1000
+ALT_SCALE = 10
+
+
+def encode_track(track):
+  """Encode a list of `(timestamp, lat, lon, alt)` points into a dict of strings:
+  'coords' (the latitudes and longitudes, as a standard Google polyline), 'times', and 'alts'.
+  Points without a timestamp or coordinates are left out. 'alts' is only included if every point has
+  an altitude."""
+  points = [point for point in track if None not in point[:3]]
+  coords = []
+  for point in points:
+    coords.append(round(point[1]*COORD_SCALE))
+    coords.append(round(point[2]*COORD_SCALE))
+  encoded = {
+    'coords': encode_ints(coords, dims=2),
+    'times': encode_ints([round(point[0]*TIME_SCALE) for point in points]),
+  }
+  if points and all([len(point) > 3 and point[3] is not None for point in points]):
+    encoded['alts'] = encode_ints([round(point[3]*ALT_SCALE) for point in points])
+  return encoded
+
+
+def decode_track(encoded):
+  """Decode the output of `encode_track()` back into a list of `(timestamp, lat, lon, alt)` tuples.
+  The altitudes are None if they weren't encoded (if 'alts' is missing or None, as it is when read
+  back from a Parquet export)."""
+  coords = decode_ints(encoded['coords'], dims=2)
+  times = decode_ints(encoded['times'])
+  if encoded.get('alts') is not None:
+    alts = [alt/ALT_SCALE for alt in decode_ints(encoded['alts'])]
+  else:
+    alts = [None]*len(times)
+  track = []
+  for i, (time, alt) in enumerate(zip(times, alts)):
+    track.append((time/TIME_SCALE, coords[2*i]/COORD_SCALE, coords[2*i+1]/COORD_SCALE, alt))
+  return track
+
+
+def encode_ints(values, dims=1):
+  """Encode a list of integers. With `dims` > 1, the values are taken as interleaved `dims`-tuples
+  (like latitude/longitude pairs), and each is stored as the difference from the same field of the
+  previous tuple."""
+  chars = []
+  last = [0]*dims
+  for i, value in enumerate(values):
+    dim = i % dims
+    delta = value - last[dim]
+    last[dim] = value
+    # Put the sign in the lowest bit.
+    if delta < 0:
+      delta = ~(delta << 1)
+    else:
+      delta <<= 1
+    while delta >= 0x20:
+      chars.append(chr((0x20 | (delta & 0x1f)) + 63))
+      delta >>= 5
+    chars.append(chr(delta + 63))
+  return ''.join(chars)
+
+
+def decode_ints(text, dims=1):
+  """Decode the output of `encode_ints()`."""
+  values = []
+  last = [0]*dims
+  value = shift = 0
+  for char in text:
+    chunk = ord(char) - 63
+    value |= (chunk & 0x1f) << shift
+    shift += 5
+    if chunk < 0x20:
+      if value & 1:
+        delta = ~(value >> 1)
+      else:
+        delta = value >> 1
+      dim = len(values) % dims
+      last[dim] += delta
+      values.append(last[dim])
+      value = shift = 0
+  return values
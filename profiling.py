@@ -0,0 +1,291 @@
+"""Measure how much time each stage of the event pipeline takes.
+The stages are mostly generators feeding each other, so their work is interleaved. To separate it,
+each stage is timed while it's running (inside `next()`, or inside a `span()`), minus the time spent
+in any other stage it pulls from. The result is the stage's own ("self") time.
+With `memory=True`, it also uses `tracemalloc` to count the bytes each stage leaves allocated, and
+`checkpoint()` takes snapshots to find the top allocation sites between points in the pipeline.
+Profiling is off unless `start()` is called. Until then, `wrap()`, `span()`, and `checkpoint()` do
+nothing, so the rest of the code can call them unconditionally."""
+import collections
+import contextlib
+import json
+import logging
+import resource
+import time
+import tracemalloc
+
+# If a stage resumes within this many seconds of when it last paused, the trace shows it as one
+# continuous span.
+MERGE_GAP = 0.001
+
+# How many allocation sites to list for each checkpoint.
+TOP_SITES = 10
+# How many stack frames tracemalloc records for each allocation.
+TRACE_FRAMES = 1
+
+# The active `Profiler`, if any.
+current = None
+
+
+def start(memory=False):
+  global current
+  current = Profiler(memory=memory)
+  return current
+
+
+def stop():
+  global current
+  profiler = current
+  current = None
+  if profiler is not None and profiler.memory:
+    tracemalloc.stop()
+  return profiler
+
+
+def report(profiler, trace_path=None):
+  """Log the summary table (and the memory report, if any), and write the trace, if a path is given."""
+  for line in profiler.format_summary():
+    logging.critical(line)
+  for line in profiler.format_memory_report():
+    logging.critical(line)
+  if trace_path:
+    profiler.write_trace(trace_path)
+    logging.critical(f'Wrote trace to {trace_path}')
+
+
+def wrap(name, iterable):
+  """Time the iteration of `iterable` as the stage `name`, if profiling is on."""
+  if current is None:
+    return iterable
+  return current.wrap(name, iterable)
+
+
+def span(name):
+  """A context manager to time a block of code as the stage `name`, if profiling is on."""
+  if current is None:
+    return contextlib.nullcontext()
+  return current.span(name)
+
+
+def checkpoint(name):
+  """Take a memory snapshot, if profiling memory. `name` should say what stage just finished."""
+  if current is not None and current.memory:
+    current.checkpoint(name)
+
+
+def add_child_cpu(name, seconds):
+  """Add CPU time used by a subprocess (like a driver) to a stage, if profiling is on."""
+  if current is not None:
+    current.stage(name).child_cpu += seconds
+
+
+def get_children_cpu():
+  """The total CPU time used by all finished subprocesses of this process."""
+  usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+  return usage.ru_utime + usage.ru_stime
+
+
+def get_max_rss():
+  """The peak resident memory of this process so far, in bytes."""
+  # Linux reports this in kilobytes.
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def format_bytes(num_bytes):
+  if abs(num_bytes) < 1024:
+    return f'{num_bytes} B'
+  for unit in ('KB', 'MB', 'GB'):
+    num_bytes /= 1024
+    if abs(num_bytes) < 1024 or unit == 'GB':
+      return f'{num_bytes:0.1f} {unit}'
+
+
+class Stage:
+
+  def __init__(self, name, index):
+    self.name = name
+    self.index = index
+    self.items = 0
+    # The stage's own time, not counting other stages it called.
+    self.wall = 0.0
+    self.cpu = 0.0
+    # CPU time of subprocesses run by the stage.
+    self.child_cpu = 0.0
+    # The bytes the stage allocated and didn't free (when profiling memory).
+    self.memory = 0
+    # When the stage was running: a list of [start, end, items] lists.
+    self.spans = []
+
+  def add_span(self, start, end):
+    if self.spans and start - self.spans[-1][1] < MERGE_GAP:
+      self.spans[-1][1] = end
+      self.spans[-1][2] = self.items
+    else:
+      self.spans.append([start, end, self.items])
+
+
+class Checkpoint:
+
+  def __init__(self, name, snapshot, current, peak, max_rss):
+    self.name = name
+    self.snapshot = snapshot
+    self.current = current
+    self.peak = peak
+    self.max_rss = max_rss
+
+
+class Profiler:
+
+  def __init__(self, memory=False):
+    self.stages = collections.OrderedDict()
+    # The stages currently running. Each entry is
+    # [stage, start, cpu start, memory start, child wall, child cpu, child memory].
+    self._stack = []
+    self.memory = memory
+    self.checkpoints = []
+    if memory:
+      tracemalloc.start(TRACE_FRAMES)
+    self.start_time = time.perf_counter()
+
+  def stage(self, name):
+    if name not in self.stages:
+      self.stages[name] = Stage(name, len(self.stages))
+    return self.stages[name]
+
+  def enter(self, stage):
+    memory = tracemalloc.get_traced_memory()[0] if self.memory else 0
+    self._stack.append([stage, time.perf_counter(), time.process_time(), memory, 0.0, 0.0, 0])
+
+  def exit(self):
+    end = time.perf_counter()
+    cpu_end = time.process_time()
+    memory_end = tracemalloc.get_traced_memory()[0] if self.memory else 0
+    stage, start, cpu_start, memory_start, child_wall, child_cpu, child_memory = self._stack.pop()
+    wall = end - start
+    cpu = cpu_end - cpu_start
+    memory = memory_end - memory_start
+    stage.wall += wall - child_wall
+    stage.cpu += cpu - child_cpu
+    stage.memory += memory - child_memory
+    stage.add_span(start, end)
+    # Don't count this toward whatever stage called this one.
+    if self._stack:
+      self._stack[-1][4] += wall
+      self._stack[-1][5] += cpu
+      self._stack[-1][6] += memory
+
+  def wrap(self, name, iterable):
+    stage = self.stage(name)
+    iterator = iter(iterable)
+    while True:
+      self.enter(stage)
+      try:
+        item = next(iterator)
+      except StopIteration:
+        return
+      finally:
+        self.exit()
+      stage.items += 1
+      yield item
+
+  @contextlib.contextmanager
+  def span(self, name):
+    self.enter(self.stage(name))
+    try:
+      yield
+    finally:
+      self.exit()
+
+  def checkpoint(self, name):
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+      tracemalloc.Filter(False, tracemalloc.__file__),
+      tracemalloc.Filter(False, __file__),
+    ))
+    current, peak = tracemalloc.get_traced_memory()
+    self.checkpoints.append(Checkpoint(name, snapshot, current, peak, get_max_rss()))
+
+  def format_summary(self):
+    """Make a table of the time spent in each stage, as a list of lines."""
+    total = time.perf_counter() - self.start_time
+    header = ['Stage', 'Items', 'Wall (s)', 'CPU (s)', 'Child CPU (s)', 'Items/s']
+    if self.memory:
+      header += ['Net memory', 'Bytes/item']
+    rows = []
+    for stage in self.stages.values():
+      if stage.items and stage.wall > 0:
+        throughput = f'{stage.items/stage.wall:0.0f}'
+      else:
+        throughput = ''
+      child_cpu = f'{stage.child_cpu:0.3f}' if stage.child_cpu else ''
+      row = [
+        stage.name, str(stage.items), f'{stage.wall:0.3f}', f'{stage.cpu:0.3f}', child_cpu, throughput
+      ]
+      if self.memory:
+        row.append(format_bytes(stage.memory))
+        row.append(f'{stage.memory/stage.items:0.0f}' if stage.items else '')
+      rows.append(row)
+    total_row = ['Total', '', f'{total:0.3f}', f'{time.process_time():0.3f}', '', '']
+    if self.memory:
+      total_row += ['', '']
+    rows.append(total_row)
+    return format_table(header, rows)
+
+  def format_memory_report(self):
+    """List the memory in use at each checkpoint, and the top allocation sites since the last one,
+    as a list of lines."""
+    lines = []
+    last_snapshot = None
+    for checkpoint in self.checkpoints:
+      lines.append(
+        f'After {checkpoint.name}: {format_bytes(checkpoint.current)} traced '
+        f'(peak {format_bytes(checkpoint.peak)}), max RSS {format_bytes(checkpoint.max_rss)}'
+      )
+      if last_snapshot is None:
+        stats = checkpoint.snapshot.statistics('lineno')
+        rows = [(format_bytes(stat.size), str(stat.count), format_site(stat.traceback))
+                for stat in stats[:TOP_SITES]]
+      else:
+        stats = checkpoint.snapshot.compare_to(last_snapshot, 'lineno')
+        rows = [(format_bytes(stat.size_diff), str(stat.count_diff), format_site(stat.traceback))
+                for stat in stats[:TOP_SITES] if stat.size_diff]
+      for line in format_table(('Size', 'Blocks', 'Allocated at'), rows, left=(2,)):
+        lines.append('  '+line)
+      last_snapshot = checkpoint.snapshot
+    return lines
+
+  def write_trace(self, path):
+    """Write the stages' spans as a Chrome trace-format JSON file (for chrome://tracing, Perfetto,
+    etc). Each stage is shown as its own thread."""
+    trace_events = []
+    for stage in self.stages.values():
+      trace_events.append({
+        'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': stage.index,
+        'args': {'name': stage.name},
+      })
+      for start, end, items in stage.spans:
+        trace_events.append({
+          'name': stage.name, 'ph': 'X', 'pid': 1, 'tid': stage.index,
+          'ts': round((start-self.start_time)*1000000), 'dur': round((end-start)*1000000),
+          'args': {'items': items},
+        })
+    with open(path, 'w') as trace_file:
+      json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, trace_file)
+
+
+def format_site(traceback):
+  frame = traceback[0]
+  return f'{frame.filename}:{frame.lineno}'
+
+
+def format_table(header, rows, left=(0,)):
+  """Line up the columns of a table of strings. Columns are right-justified, except those whose
+  indices are in `left`."""
+  rows = [header] + list(rows)
+  widths = [max([len(row[i]) for row in rows]) for i in range(len(header))]
+  lines = []
+  for row in rows:
+    fields = []
+    for i, (field, width) in enumerate(zip(row, widths)):
+      fields.append(field.ljust(width) if i in left else field.rjust(width))
+    lines.append('  '.join(fields).rstrip())
+  return lines
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import socket
+# This is kept to the bare minimum of imports, so it starts quickly.
+
+USAGE = """Usage: $ {} socket [view.py options]
+Query a running "view.py --serve socket" server. Give the same filter options as view.py, like
+--begin, --end, --person, --stream, and --search. The events are already loaded by the server, so
+the answer comes back right away."""
+
+
+def main(argv):
+  if len(argv) < 2 or argv[1] in ('-h', '--help'):
+    print(USAGE.format(os.path.basename(argv[0])), file=sys.stderr)
+    return 1
+  socket_path = argv[1]
+  try:
+    for response in query(socket_path, argv[2:]):
+      if 'line' in response:
+        print(response['line'])
+      elif 'log' in response:
+        print(response['log'], file=sys.stderr)
+      elif 'error' in response:
+        print(response['error'], file=sys.stderr)
+        return 1
+  except (FileNotFoundError, ConnectionRefusedError):
+    print(f'Error: No server is running at {socket_path!r}. Start one with "view.py --serve".',
+          file=sys.stderr)
+    return 1
+
+
+def query(socket_path, args):
+  """Send a query to a server, and yield its response dicts (see `serving.QueryHandler`)."""
+  with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+    sock.connect(socket_path)
+    sock.sendall(json.dumps({'args': args}).encode('utf8')+b'\n')
+    with sock.makefile('r', encoding='utf8') as responses:
+      for line in responses:
+        yield json.loads(line)
+
+
+if __name__ == '__main__':
+  try:
+    sys.exit(main(sys.argv))
+  except BrokenPipeError:
+    pass
@@ -0,0 +1,146 @@
+"""Keep a timeline of `Event`s in memory and answer queries about it over a Unix socket.
+`view.py --serve` loads and indexes the events once, then runs the server. `query.py` is the client."""
+import bisect
+import collections
+import json
+import logging
+import os
+import signal
+import socketserver
+import sys
+log = logging.getLogger(__name__)
+
+
+class Timeline:
+  """A sorted list of `Event`s, indexed by start time, participant, and stream."""
+
+  def __init__(self, events):
+    # The events must already be sorted by start time.
+    self.events = list(events)
+    self.starts = [event.start for event in self.events]
+    # The positions of the events in each stream.
+    self.by_stream = collections.defaultdict(list)
+    # The positions of each participant's events, keyed by the `id()` of their `Contact`.
+    self.by_contact = collections.defaultdict(list)
+    self.contacts = {}
+    for i, event in enumerate(self.events):
+      self.by_stream[event.stream].append(i)
+      for contact in get_participants(event):
+        positions = self.by_contact[id(contact)]
+        if not positions or positions[-1] != i:
+          positions.append(i)
+        self.contacts[id(contact)] = contact
+
+  def __len__(self):
+    return len(self.events)
+
+  def find_contacts(self, person, exact_person=False):
+    """Get the keys of the participants whose name matches `person`, like `view.person_match()`."""
+    query = person.lower()
+    keys = []
+    for key, contact in self.contacts.items():
+      if not contact.name:
+        continue
+      name = contact.name.lower()
+      if (exact_person and name == query) or (not exact_person and query in name):
+        keys.append(key)
+    return keys
+
+  def query(self, begin=None, end=None, person=None, exact_person=False, stream=None, search=None):
+    """Yield the `Event`s matching all the given filters, in order.
+    `search` is a plain, case-insensitive text match: messages must contain all its words."""
+    lo = 0 if begin is None else bisect.bisect_left(self.starts, begin)
+    hi = len(self.starts) if end is None else bisect.bisect_right(self.starts, end)
+    # Narrow down the positions using the indices first.
+    selections = []
+    if person is not None:
+      positions = set()
+      for key in self.find_contacts(person, exact_person):
+        positions.update(slice_positions(self.by_contact[key], lo, hi))
+      selections.append(positions)
+    if stream is not None:
+      selections.append(set(slice_positions(self.by_stream.get(stream, ()), lo, hi)))
+    if selections:
+      positions = sorted(set.intersection(*selections))
+    else:
+      positions = range(lo, hi)
+    words = None
+    if search:
+      words = search.lower().split()
+    for i in positions:
+      event = self.events[i]
+      if words:
+        message = getattr(event, 'message', None)
+        if message is None:
+          continue
+        message = message.lower()
+        if not all([word in message for word in words]):
+          continue
+      yield event
+
+
+def get_participants(event):
+  participants = []
+  sender = getattr(event, 'sender', None)
+  if sender is not None:
+    participants.append(sender)
+  for recipient in getattr(event, 'recipients', ()):
+    if recipient is not None:
+      participants.append(recipient)
+  return participants
+
+
+def slice_positions(positions, lo, hi):
+  """Get the part of a sorted list of positions that falls in the range [lo, hi)."""
+  return positions[bisect.bisect_left(positions, lo):bisect.bisect_left(positions, hi)]
+
+
+##### Server #####
+
+
+def serve(socket_path, answer):
+  """Answer queries on a Unix socket at `socket_path` until interrupted.
+  `answer` is called with the list of command line arguments from each client. It should return an
+  iterable of response dicts (see `QueryHandler`)."""
+  if os.path.exists(socket_path):
+    os.remove(socket_path)
+  server = QueryServer(socket_path, answer)
+  # Clean up the socket when killed, too.
+  signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+    os.remove(socket_path)
+
+
+class QueryServer(socketserver.UnixStreamServer):
+  """A server that answers one query at a time.
+  Queries are fast, and answering them isn't thread-safe (it captures the argument parser's output)."""
+
+  def __init__(self, socket_path, answer):
+    self.answer = answer
+    super().__init__(socket_path, QueryHandler)
+
+
+class QueryHandler(socketserver.StreamRequestHandler):
+  """The protocol is lines of JSON. The client sends one request: `{"args": [...]}`.
+  The server replies with a series of responses, then closes the connection:
+    `{"line": "..."}`:  A line of output.
+    `{"log": "..."}`:   A log message.
+    `{"error": "..."}`: The query failed. This is the last response."""
+
+  def handle(self):
+    try:
+      request = json.loads(self.rfile.readline())
+      responses = self.server.answer(request['args'])
+    except (ValueError, KeyError, TypeError) as error:
+      responses = [{'error': f'Error: Invalid request: {error}'}]
+    try:
+      for response in responses:
+        self.wfile.write(json.dumps(response).encode('utf8')+b'\n')
+    except BrokenPipeError:
+      log.info('Info: Client disconnected before reading the whole response.')
+
@@ -0,0 +1,108 @@
+"""Sort more `Event`s than fit in memory, by spilling sorted runs to disk and merging them."""
+import heapq
+import logging
+import pickle
+import sys
+import tempfile
+import events
+log = logging.getLogger(__name__)
+
+# How many items to pickle together in one chunk of a run file.
+CHUNK_SIZE = 1000
+# Types whose values are written into the run files. Anything else (like the `ContactBinding` or
+# `Contact`s an `Event` refers to) is shared by many `Event`s, so it's kept in memory and only a
+# reference to it is written.
+INLINE_TYPES = (str, bytes, int, float, bool, type(None), tuple, list, dict, set, frozenset)
+
+
+def sort_events(items, key, memory_limit=None):
+  """Sort `items` by `key`, staying (roughly) within `memory_limit` bytes.
+  If the items fit within the limit, this is the same as `sorted()`. Otherwise, it sorts runs of
+  items which fit, writes each run to a temporary file, then lazily merges the runs.
+  Returns an iterator over the sorted items. Like `sorted()`, the sort is stable."""
+  run = []
+  run_size = 0
+  spiller = None
+  for item in items:
+    run.append(item)
+    if memory_limit is not None:
+      run_size += estimate_size(item)
+      if run_size > memory_limit:
+        if spiller is None:
+          spiller = Spiller()
+          log.info(f'Info: Events exceed the memory limit of {memory_limit} bytes. Sorting on disk.')
+        run.sort(key=key)
+        spiller.write_run(run)
+        run = []
+        run_size = 0
+  run.sort(key=key)
+  if spiller is None:
+    return iter(run)
+  log.info(f'Info: Merging {len(spiller.runs)+1} sorted runs.')
+  return spiller.merge(run, key)
+
+
+def estimate_size(item):
+  """A rough estimate of the memory used by an `Event`, including its text, but not any objects it
+  shares with other `Event`s."""
+  size = sys.getsizeof(item)
+  if isinstance(item, events.CommunicationEvent):
+    size += sys.getsizeof(item._recipients)
+  message = getattr(item, 'message', None)
+  if message is not None:
+    size += sys.getsizeof(message)
+  encoded_track = getattr(item, 'encoded_track', None)
+  if encoded_track is not None:
+    size += sum([sys.getsizeof(value) for value in encoded_track.values()])
+  return size
+
+
+class Spiller:
+  """Write sorted runs of `Event`s to temporary files and merge them back."""
+
+  def __init__(self):
+    self.runs = []
+    # Objects referenced from the run files, instead of being written to them.
+    self.shared = []
+    self._shared_ids = {}
+
+  def write_run(self, run):
+    run_file = tempfile.TemporaryFile(prefix='life-browser.', suffix='.run')
+    pickler = pickle.Pickler(run_file, protocol=pickle.HIGHEST_PROTOCOL)
+    pickler.persistent_id = self._persistent_id
+    for i in range(0, len(run), CHUNK_SIZE):
+      pickler.dump(run[i:i+CHUNK_SIZE])
+      # Don't let the pickler hold onto every object it's seen.
+      pickler.clear_memo()
+    run_file.flush()
+    self.runs.append(run_file)
+
+  def read_run(self, run_file):
+    run_file.seek(0)
+    unpickler = pickle.Unpickler(run_file)
+    unpickler.persistent_load = self._persistent_load
+    try:
+      while True:
+        yield from unpickler.load()
+    except EOFError:
+      pass
+    finally:
+      run_file.close()
+
+  def merge(self, last_run, key):
+    runs = [self.read_run(run_file) for run_file in self.runs]
+    runs.append(last_run)
+    # heapq.merge() favors earlier iterables when keys are equal, so this is still a stable sort.
+    return heapq.merge(*runs, key=key)
+
+  def _persistent_id(self, obj):
+    if type(obj) in INLINE_TYPES or isinstance(obj, events.Event):
+      return None
+    obj_id = id(obj)
+    if obj_id not in self._shared_ids:
+      self._shared_ids[obj_id] = len(self.shared)
+      self.shared.append(obj)
+    return self._shared_ids[obj_id]
+
+  def _persistent_load(self, index):
+    return self.shared[index]
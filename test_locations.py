@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+import random
+import unittest
+import locations
+
+
+class LocationIndexTest(unittest.TestCase):
+
+  def make_index(self, rng, num_points=2000):
+    """Make an index of random points, added out of order. The gaps between them vary from none (two
+    points at the same time) to more than `MAX_GAP`."""
+    points = []
+    timestamp = 1500000000
+    for i in range(num_points):
+      timestamp += rng.choice((0, 1, 30, 300, 900, 3000, 4000, 20000))
+      points.append((timestamp, rng.randint(-900000000, 900000000),
+                     rng.randint(-1800000000, 1800000000)))
+    rng.shuffle(points)
+    index = locations.LocationIndex()
+    for point in points:
+      index.add_point(*point)
+    return index, sorted(points)
+
+  def test_sort(self):
+    index, points = self.make_index(random.Random(1))
+    index.sort()
+    self.assertEqual(list(index.times), [timestamp for timestamp, lat, lon in points])
+    # Points at the same time can be in any order.
+    self.assertEqual(sorted(zip(index.times, index.lats, index.lons)), points)
+
+  def test_cursor_matches_locate(self):
+    rng = random.Random(2)
+    index, points = self.make_index(rng)
+    first, last = points[0][0], points[-1][0]
+    # Random times, plus the exact times of some points, and times outside the data.
+    timestamps = [rng.uniform(first-10000, last+10000) for i in range(3000)]
+    timestamps += [timestamp for timestamp, lat, lon in rng.sample(points, 500)]
+    timestamps.sort()
+    expected = [index.locate(timestamp) for timestamp in timestamps]
+    self.assertEqual(list(index.locate_all(timestamps)), expected)
+    self.assertTrue(any(location is None for location in expected))
+    self.assertTrue(any(location is not None for location in expected))
+
+  def test_cursor_going_back(self):
+    rng = random.Random(3)
+    index, points = self.make_index(rng, num_points=300)
+    first, last = points[0][0], points[-1][0]
+    timestamps = sorted(rng.uniform(first, last) for i in range(200))
+    # Mostly in order, with a few jumps back.
+    for i in range(0, len(timestamps)-10, 37):
+      timestamps[i:i+10] = reversed(timestamps[i:i+10])
+    cursor = index.cursor()
+    for timestamp in timestamps:
+      self.assertEqual(cursor.locate(timestamp), index.locate(timestamp))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+import unittest
+import polyline
+
+
+class PolylineTest(unittest.TestCase):
+
+  def test_google_example(self):
+    # The example from Google's description of the format.
+    coords = [3850000, -12020000, 4070000, -12095000, 4325200, -12645300]
+    self.assertEqual(polyline.encode_ints(coords, dims=2), '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+    self.assertEqual(polyline.decode_ints('_p~iF~ps|U_ulLnnqC_mqNvxq`@', dims=2), coords)
+
+  def test_ints_round_trip(self):
+    values = [0, 1, -1, 31, -32, 1000000, -1000000, 5, 5, 2**40, -2**40]
+    for dims in (1, 2, 3):
+      with self.subTest(dims=dims):
+        encoded = polyline.encode_ints(values[:len(values)//dims*dims], dims=dims)
+        self.assertEqual(polyline.decode_ints(encoded, dims=dims),
+                         values[:len(values)//dims*dims])
+
+  def test_track_round_trip(self):
+    # The coordinates go down and up, so some of the deltas are negative.
+    track = [
+      (1500000000.0, 38.91703, -77.07713, 12.5),
+      (1500000005.5, 38.91699, -77.07701, 11.0),
+      (1500000011.0, 38.91712, -77.07722, -3.2),
+      (1500000011.0, -33.86785, 151.20732, 0.0),
+    ]
+    self.assertEqual(polyline.decode_track(polyline.encode_track(track)), track)
+
+  def test_track_missing_altitudes(self):
+    # If any point is missing its altitude, none are kept.
+    track = [
+      (1500000000.0, 38.91703, -77.07713, 12.5),
+      (1500000060.0, 38.91601, -77.07812, None),
+    ]
+    encoded = polyline.encode_track(track)
+    self.assertNotIn('alts', encoded)
+    self.assertEqual(polyline.decode_track(encoded),
+                     [(time, lat, lon, None) for time, lat, lon, alt in track])
+    # As read back from a Parquet export.
+    encoded['alts'] = None
+    self.assertEqual(polyline.decode_track(encoded),
+                     [(time, lat, lon, None) for time, lat, lon, alt in track])
+
+  def test_track_missing_coords(self):
+    track = [
+      (1500000000.0, 38.91703, -77.07713, 1.0),
+      (None, 38.91601, -77.07812, 2.0),
+      (1500000060.0, None, None, 3.0),
+      (1500000120.0, 38.91502, -77.07911, 4.0),
+    ]
+    self.assertEqual(polyline.decode_track(polyline.encode_track(track)), [track[0], track[3]])
+
+  def test_empty_track(self):
+    self.assertEqual(polyline.decode_track(polyline.encode_track([])), [])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -6,10 +6,18 @@ import time
 import errno
 import logging
 import argparse
+import contextlib
+import collections
+import io
 from datetime import datetime
 #TODO: Move code to run the drivers into "driverslib" module.
 import drivers
 import drivers.contacts
+import export
+import locations
+import profiling
+import serving
+import sorting
 from contacts import ContactBook, Contact
 assert sys.version_info.major >= 3, 'Python 3 required'
 
@@ -26,27 +34,55 @@ def make_argparser(drivers):
   parser.add_argument('-d', '--data', nargs=2, action='append', metavar=('FORMAT', 'PATH'),
     help='The input file/directory for a data source. Give two arguments: the format, and the path '
          'to the data. The available formats are: "'+'", "'.join(drivers.keys())+'".')
+  parser.add_argument('-B', '--db', action='store_true',
+    help='Read the events from the database (see "manage.py import_events") instead of parsing the '
+         'raw data sources.')
   parser.add_argument('-c', '--contacts', type=argparse.FileType('r'),
     help='Contacts file. At the moment, this only accepts the "Google CSV" format exported by '
          'Google Contacts.')
-  parser.add_argument('-b', '--begin', default=0,
-    help='Only show events from after this timestamp or date ("YYYY-MM-DD" or '
-         '"YYYY-MM-DD HH:MM:DD"). If the date doesn\'t include a time, it\'s assumed to be the '
-         'start of that day.')
-  parser.add_argument('-e', '--end', default=9999999999,
-    help='Only events from before this timestamp or date (see --begin for format).')
-  parser.add_argument('-p', '--person',
-    help='Only show events involving this person. This can be a fuzzy match. If any part of a '
-         'participant\'s name matches this (case-insensitive), it\'s considered a hit.')
-  parser.add_argument('--exact-person', action='store_true',
-    help='Make --person require an exact match. It\'s still case-insensitive.')
+  add_filter_args(parser)
+  parser.add_argument('-w', '--where', action='store_true',
+    help='Add a column showing where you were at the time of each event (latitude, longitude), '
+         'from the location data sources (like "mytracks" or "records") given with --data.')
   parser.add_argument('--mynumbers',
     help='Your phone numbers, to help identify yourself in conversations. comma-separated list.')
   parser.add_argument('-a', '--aliases', default='',
     help='Aliases for people. Use this to convert phone numbers or Google identifiers to a name. '
          'Give comma-separated key=values.')
+  parser.add_argument('-S', '--stats', action='store_true',
+    help='Just print the number of events on each day, per stream. The days are in the web app\'s '
+         'time zone (TIME_ZONE in lifesite/settings.py). This reads the daily totals from the '
+         'database (see --db), so it\'s fast even for years of data. --begin, --end, --person, and '
+         '--stream still apply.')
   parser.add_argument('-C', '--print-contacts', action='store_true',
     help='Just print all the contacts discovered in the input data.')
+  parser.add_argument('-x', '--export', metavar='PATH',
+    help='Write the events to this file instead of printing them, for analysis in other tools. Give '
+         '"-" to write to stdout. The events are written as they come out of the merge, so this '
+         'doesn\'t need to hold them all in memory. The filtering options still apply.')
+  parser.add_argument('--export-format', choices=export.FORMATS,
+    help='The format for --export. "jsonl" is JSON Lines, one event per line. "parquet" requires '
+         'pyarrow. Default: "parquet" if the path ends in ".parquet" or ".pq", "jsonl" otherwise.')
+  parser.add_argument('--serve', metavar='SOCKET',
+    help='Load the events, then keep them in memory and answer queries about them on a Unix socket '
+         'at this path. Use query.py to send queries, with the same filtering options as this '
+         'script (--begin, --end, --person, --stream, --search).')
+  parser.add_argument('-P', '--profile', action='store_true',
+    help='Time each stage of reading and processing the events (each driver, sorting, filtering, '
+         'etc), and print a table of the wall and CPU time, event counts, and throughput of each at '
+         'the end. The times are each stage\'s own, not including the stages it reads from.')
+  parser.add_argument('--profile-trace', metavar='PATH',
+    help='Also write the --profile timings to this file in the Chrome trace format, for viewing in '
+         'chrome://tracing or ui.perfetto.dev. Implies --profile.')
+  parser.add_argument('--memprofile', action='store_true',
+    help='Like --profile, but also track memory allocations (with tracemalloc), to see which stages '
+         'use the most. Adds the net memory each stage allocated (in total and per event) to '
+         'the table, and lists the top allocation sites after each driver, the sort, and '
+         'the output. This slows everything down a lot, so the times will be inflated.')
+  parser.add_argument('-M', '--sort-memory', type=int, default=2048,
+    help='Roughly how much memory (in MB) the events can take up while sorting them. If there are '
+         'more events than this, they\'ll be sorted on disk (in the system temp directory) '
+         'instead. Default: %(default)s')
   parser.add_argument('-l', '--log', type=argparse.FileType('w'), default=sys.stderr,
     help='Print log messages to this file instead of to stderr. Warning: Will overwrite the file.')
   parser.add_argument('-q', '--quiet', dest='volume', action='store_const', const=logging.CRITICAL,
@@ -56,6 +92,36 @@ def make_argparser(drivers):
   return parser
 
 
+def make_query_argparser():
+  """Make the parser for queries sent to a --serve server (by query.py). This only has the filtering
+  options, since the server has already loaded its data."""
+  parser = argparse.ArgumentParser(prog='query.py socket',
+    description='Query the events loaded by a "view.py --serve" server.')
+  add_filter_args(parser)
+  return parser
+
+
+def add_filter_args(parser):
+  parser.add_argument('-b', '--begin', default=0,
+    help='Only show events from after this timestamp or date ("YYYY-MM-DD" or '
+         '"YYYY-MM-DD HH:MM:DD"). If the date doesn\'t include a time, it\'s assumed to be the '
+         'start of that day.')
+  parser.add_argument('-e', '--end', default=9999999999,
+    help='Only events from before this timestamp or date (see --begin for format).')
+  parser.add_argument('-p', '--person',
+    help='Only show events involving this person. This can be a fuzzy match. If any part of a '
+         'participant\'s name matches this (case-insensitive), it\'s considered a hit.')
+  parser.add_argument('--exact-person', action='store_true',
+    help='Make --person require an exact match. It\'s still case-insensitive.')
+  parser.add_argument('-t', '--stream',
+    help='Only show events from this stream ("chat", "sms", "call", etc).')
+  parser.add_argument('-s', '--search',
+    help='Only show messages whose text matches this query. This reads from the database, like '
+         '--db, using its full-text index. Bare words must all appear (in any order). You can also '
+         'use AND, OR, NOT, "quoted phrases", and prefixes like "word*". Matches are listed in time '
+         'order, not ranked by relevance.')
+
+
 def main(argv):
 
   all_drivers = drivers.discover_drivers()
@@ -64,19 +130,27 @@ def main(argv):
 
   logging.basicConfig(stream=args.log, level=args.volume, format='%(message)s')
 
+  if args.data is None:
+    args.data = []
   for format, path in args.data:
     if format not in all_drivers:
       parser.print_help()
       fail(f'Driver for format {format!r} not found.')
 
-  try:
-    begin = int(args.begin)
-  except ValueError:
-    begin = human_time_to_timestamp(args.begin)
-  try:
-    end = int(args.end)
-  except ValueError:
-    end = human_time_to_timestamp(args.end)
+  begin = parse_time_arg(args.begin)
+  end = parse_time_arg(args.end)
+
+  if args.profile or args.profile_trace or args.memprofile:
+    profiling.start(memory=args.memprofile)
+    try:
+      return run(args, parser, all_drivers, begin, end)
+    finally:
+      profiling.report(profiling.stop(), args.profile_trace)
+  else:
+    return run(args, parser, all_drivers, begin, end)
+
+
+def run(args, parser, all_drivers, begin, end):
 
   if args.contacts:
     contacts = drivers.contacts.get_contacts(args.contacts, 'google-browser-google-csv')
@@ -85,45 +159,230 @@ def main(argv):
   parse_aliases(args.aliases, contacts)
   parse_mynumbers(args.mynumbers, contacts)
 
-  # Read in the events from each dataset.
-  events = []
-  for format, path in args.data:
-    # Load the driver.
-    driver = all_drivers[format]
-    # Check the path exists and looks right.
-    path_type = 'file'
-    if 'format' in driver and 'path_type' in driver['format']:
-      path_type = driver['format']['path_type']
-    verify_path(path, type=path_type)
-    # Read the data.
-    new_events = list(drivers.get_events(driver, path, contacts))
-    logging.info(f"Found {len(new_events)} events in {driver['name']} data.")
-    events.extend(new_events)
-
-  sorted_events = sorted(events, key=lambda event: event.start)
-  events = dedup_events(sorted_events)
+  if args.stats:
+    print_stats(begin, end, args.person, args.exact_person, args.stream)
+    return
 
-  if not events:
-    fail('Error: No events found! Make sure you provide at least one data source.')
-  logging.warning(f'Found {len(events)} events.')
+  # Read in the events from each dataset.
+  location_index = None
+  if args.where and (args.db or args.search):
+    logging.warning('Warning: The database has no location data. Ignoring --where.')
+  if args.serve and args.db:
+    # Load everything in the time range. The other filters are for the queries.
+    sorted_events = read_db_events(begin, end)
+  elif args.db or (args.search and not args.serve):
+    # The database returns them already sorted.
+    sorted_events = read_db_events(
+      begin, end, args.person, args.exact_person, args.search, args.stream
+    )
+  else:
+    all_events = read_events(args.data, all_drivers, contacts)
+    if args.where:
+      # The sort reads all the events before it outputs any, so the index is complete by the time
+      # the first event is printed.
+      location_index = locations.LocationIndex()
+      all_events = location_index.collect(all_events)
+    with profiling.span('sort'):
+      sorted_events = sorting.sort_events(
+        all_events, key=lambda event: event.start, memory_limit=args.sort_memory*1024*1024
+      )
+    profiling.checkpoint('sort')
+    sorted_events = profiling.wrap('merge', sorted_events)
+  events = profiling.wrap('dedup', dedup_events(sorted_events))
 
   if args.print_contacts:
+    # The contacts are only complete once every driver has finished.
+    drain_events(events)
     for contact in contacts:
       print(contact.format())
     return
 
-  current_day_stamp = None
+  if args.serve:
+    with profiling.span('index'):
+      timeline = serving.Timeline(profiling.wrap('filter', filter_events(events, begin, end)))
+    profiling.checkpoint('index')
+    logging.warning(f'Serving {len(timeline)} events on {args.serve}')
+    query_parser = make_query_argparser()
+    serving.serve(args.serve, lambda query_args: answer_query(query_args, query_parser, timeline))
+    return
+
+  events = CountedIterator(events)
+  matching = profiling.wrap(
+    'filter', filter_events(events, begin, end, args.person, args.exact_person, args.stream)
+  )
+
+  if args.export:
+    try:
+      with profiling.span('export'):
+        num_exported = export.export_events(matching, args.export, format=args.export_format)
+    except ValueError as error:
+      fail(f'Error: {error}')
+    profiling.checkpoint('export')
+    logging.warning(f'Exported {num_exported} of {events.count} events.')
+    return
+  with profiling.span('print'):
+    for line in profiling.wrap('format', format_timeline(matching, location_index)):
+      print(line)
+  profiling.checkpoint('print')
+
+  if not events.count:
+    fail('Error: No events found! Make sure you provide at least one data source.')
+  logging.warning(f'Found {events.count} events.')
+
+
+def drain_events(events):
+  """Read through all the events (so the drivers finish and bind their contacts), and log how many
+  there were. Fails if there were none."""
+  num_events = 0
+  for event in events:
+    num_events += 1
+  if not num_events:
+    fail('Error: No events found! Make sure you provide at least one data source.')
+  logging.warning(f'Found {num_events} events.')
+  return num_events
+
+
+def answer_query(query_args, parser, timeline):
+  """Answer a query from `query.py`, given as a list of command line arguments for `parser` (see
+  `make_query_argparser()`). Yields response dicts for `serving.QueryHandler`."""
+  # Capture anything the parser prints (like errors and --help) to send back.
+  output = io.StringIO()
+  try:
+    with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+      args = parser.parse_args(query_args)
+    begin = parse_time_arg(args.begin)
+    end = parse_time_arg(args.end)
+  except SystemExit as exit:
+    for line in output.getvalue().splitlines():
+      yield {'line': line}
+    if exit.code:
+      yield {'error': 'Error: Invalid query.'}
+    return
+  except ValueError as error:
+    yield {'error': f'Error: Invalid time: {error}'}
+    return
+  events = CountedIterator(timeline.query(
+    begin=begin, end=end, person=args.person, exact_person=args.exact_person, stream=args.stream,
+    search=args.search
+  ))
+  for line in format_timeline(events):
+    yield {'line': line}
+  if events.count:
+    yield {'log': f'Found {events.count} events.'}
+  else:
+    yield {'error': 'Error: No events found!'}
+
+
+def filter_events(events, begin, end, person=None, exact_person=False, stream=None):
   for event in events:
     if event.start < begin or event.start > end:
       continue
-    if args.person and not person_match(event, args.person, args.exact_person):
+    if person and not person_match(event, person, exact_person):
       continue
+    if stream and event.stream != stream:
+      continue
+    yield event
+
+
+def format_timeline(events, location_index=None):
+  """Format sorted `Event`s as lines of text, with a header line at the start of each day.
+  Give a `locations.LocationIndex` to add where you were at the time to each (non-location) event."""
+  current_day_stamp = None
+  if location_index is not None:
+    cursor = location_index.cursor()
+  for event in events:
     if current_day_stamp is None or event.start > current_day_stamp + 24*60*60:
       current_day_stamp = get_day_start(event.start)
       dt = datetime.fromtimestamp(current_day_stamp)
       date = dt.strftime('%a, {:2d} %b %Y').format(dt.day)
-      print('========== '+date+' ==========')
-    print(event)
+      yield '========== '+date+' =========='
+    if location_index is None or event.stream in locations.STREAMS:
+      yield str(event)
+    else:
+      yield str(event)+format_location(cursor.locate(event.start))
+
+
+def format_location(location):
+  if location is None:
+    return '  @ ?'
+  return f'  @ {location[0]:0.5f}, {location[1]:0.5f}'
+
+
+class CountedIterator:
+  """Wrap an iterator and count how many items have been taken from it."""
+
+  def __init__(self, items):
+    self.items = iter(items)
+    self.count = 0
+
+  def __iter__(self):
+    return self
+
+  def __next__(self):
+    item = next(self.items)
+    self.count += 1
+    return item
+
+
+def read_events(data, all_drivers, contacts, marks=None):
+  """Run the drivers on each data source and yield their `Event`s.
+  For incremental runs, give `marks`: a dict mapping each format to its high-water marks (see
+  `drivers.get_events()`). They'll be updated with the new marks from the drivers."""
+  for format, path in data:
+    # Load the driver.
+    driver = all_drivers[format]
+    # Check the path exists and looks right.
+    path_type = 'file'
+    if 'format' in driver and 'path_type' in driver['format']:
+      path_type = driver['format']['path_type']
+    verify_path(path, type=path_type)
+    # Read the data.
+    num_events = 0
+    if marks is None:
+      format_marks = None
+    else:
+      format_marks = marks.setdefault(format, {})
+    for event in drivers.get_events(driver, path, contacts, marks=format_marks):
+      num_events += 1
+      yield event
+    logging.info(f"Found {num_events} events in {driver['name']} data.")
+
+
+def read_db_events(begin, end, person=None, exact_person=False, search=None, stream=None):
+  import lifeapp
+  lifeapp.setup()
+  from lifeapp import store
+  try:
+    events = store.load_events(
+      begin=begin, end=end, stream=stream, person=person, exact_person=exact_person, search=search
+    )
+  except ValueError as error:
+    fail(f'Error: {error}')
+  return profiling.wrap('database', events)
+
+
+def print_stats(begin, end, person=None, exact_person=False, stream=None):
+  import lifeapp
+  lifeapp.setup()
+  from lifeapp import store
+  contact_ids = None
+  if person is not None:
+    contact_ids = store.find_contact_ids(person, exact_person)
+  days = store.load_activity(
+    begin=store.get_local_day(begin), end=store.get_local_day(end),
+    stream=stream, contact_ids=contact_ids
+  )
+  if not days:
+    fail('Error: No events found in the database.')
+  totals = collections.Counter()
+  for day, counts in days.items():
+    print(day.isoformat()+'  '+format_counts(counts))
+    totals.update(counts)
+  print('Total:      '+format_counts(totals))
+
+
+def format_counts(counts):
+  return '  '.join([f'{stream}: {count}' for stream, count in sorted(counts.items())])
 
 
 def format_driver_info(drivers):
@@ -145,6 +404,14 @@ def format_driver_info(drivers):
   return '\n'.join(descriptions)
 
 
+def parse_time_arg(time_arg):
+  """Parse a --begin or --end argument: either a timestamp or a human-readable date."""
+  try:
+    return int(time_arg)
+  except ValueError:
+    return human_time_to_timestamp(time_arg)
+
+
 def human_time_to_timestamp(human_time):
   try:
     dt = datetime.strptime(human_time, '%Y-%m-%d %H:%M:%S')
@@ -202,9 +469,9 @@ def verify_path(path, type='file'):
 
 
 def dedup_events(old_events):
-  """Remove duplicate events from a sorted list."""
+  """Remove duplicate events from a sorted iterable.
+  This is a generator, so it doesn't need the whole list in memory."""
   duplicates = 0
-  new_events = []
   last_event = None
   for event in old_events:
     if last_event is None:
@@ -214,11 +481,10 @@ def dedup_events(old_events):
     if duplicate:
       duplicates += 1
     else:
-      new_events.append(event)
+      yield event
       last_event = event
   if duplicates:
     logging.warning('Removed {} duplicate events.'.format(duplicates))
-  return new_events
 
 
 def get_day_start(timestamp):
@@ -229,10 +495,13 @@ def get_day_start(timestamp):
 
 def person_match(event, person, exact_person=False):
   participants = []
-  if event.sender and event.sender.name:
-    participants = [event.sender.name.value.lower()]
-  if event.recipients:
-    participants.extend([p.name.value.lower() for p in event.recipients if p.name])
+  # Not all `Event`s have people (like `LocationEvent`s).
+  sender = getattr(event, 'sender', None)
+  if sender and sender.name:
+    participants = [sender.name.lower()]
+  recipients = getattr(event, 'recipients', None)
+  if recipients:
+    participants.extend([p.name.lower() for p in recipients if p and p.name])
   if exact_person:
     if person.lower() in participants:
       return True